@@ -1,3 +1,3 @@
-from . import products, categories, users, orders
+from . import products, categories, users, orders, pricing, cart, stock
 
-__all__ = ["products", "categories", "users", "orders"]
\ No newline at end of file
+__all__ = ["products", "categories", "users", "orders", "pricing", "cart", "stock"]
\ No newline at end of file
@@ -0,0 +1,169 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import User
+from app.schemas import (
+    Cart as CartSchema, CartLine as CartLineSchema,
+    CartLineCreate, CartLineUpdate, CartLineResult,
+    CheckoutHold, StockReservation as StockReservationSchema
+)
+from app.services import cart as cart_service
+from app.services.pricing_engine import pricing_engine
+from app.services.stock import (
+    place_checkout_hold, release_checkout_hold, aggregate_quantities, InsufficientStock
+)
+from app.utils.auth import get_current_active_user
+
+router = APIRouter()
+
+def build_line_result(cart, line) -> CartLineResult:
+    """
+    Ответ на изменение позиции: только измененная позиция и агрегаты
+    """
+    return CartLineResult(
+        item=CartLineSchema.model_validate(line) if line is not None else None,
+        subtotal=cart.subtotal,
+        total_amount=cart.total_amount,
+        total_discount=cart.total_discount
+    )
+
+def change_line(db: Session, user: User, product_id: int, quantity: int, increment: bool = False) -> CartLineResult:
+    """
+    Изменить позицию корзины и сохранить результат
+    """
+    rules = pricing_engine.get_rules(db)
+    cart = cart_service.get_or_create_cart(db, user)
+    
+    try:
+        line = cart_service.set_line_quantity(
+            db, cart, product_id, quantity, rules, user.user_type, increment=increment
+        )
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    db.commit()
+    if line is not None:
+        db.refresh(line)
+    return build_line_result(cart, line)
+
+@router.get("/", response_model=CartSchema)
+def get_cart(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Получить корзину текущего пользователя
+    """
+    rules = pricing_engine.get_rules(db)
+    cart = cart_service.get_or_create_cart(db, current_user)
+    lines = cart_service.recalculate_cart(db, cart, rules, current_user.user_type)
+    
+    response = CartSchema(
+        id=cart.id,
+        items=[CartLineSchema.model_validate(line) for line in lines],
+        subtotal=cart.subtotal,
+        total_amount=cart.total_amount,
+        total_discount=cart.total_discount,
+        updated_at=cart.updated_at
+    )
+    db.commit()
+    return response
+
+@router.post("/items", response_model=CartLineResult)
+def add_cart_item(
+    item: CartLineCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Добавить товар в корзину (количество прибавляется к уже добавленному)
+    """
+    if item.quantity < 1:
+        raise HTTPException(status_code=400, detail="Количество должно быть больше нуля")
+    
+    return change_line(db, current_user, item.product_id, item.quantity, increment=True)
+
+@router.patch("/items/{product_id}", response_model=CartLineResult)
+def update_cart_item(
+    product_id: int,
+    item_update: CartLineUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Изменить количество товара в корзине (0 - удалить позицию)
+    """
+    if item_update.quantity < 0:
+        raise HTTPException(status_code=400, detail="Количество не может быть отрицательным")
+    
+    return change_line(db, current_user, product_id, item_update.quantity)
+
+@router.delete("/items/{product_id}", response_model=CartLineResult)
+def delete_cart_item(
+    product_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Удалить товар из корзины
+    """
+    return change_line(db, current_user, product_id, 0)
+
+@router.delete("/")
+def clear_cart(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Очистить корзину
+    """
+    cart = cart_service.get_or_create_cart(db, current_user)
+    cart_service.clear_cart(db, cart)
+    release_checkout_hold(db, current_user.id)
+    db.commit()
+    return {"message": "Корзина очищена"}
+
+@router.post("/checkout", response_model=CheckoutHold)
+def start_checkout(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Начать оформление: удержать товар корзины на складе
+
+    Удержание действует STOCK_RESERVATION_TTL_MINUTES и переходит в заказ
+    при его создании; брошенное оформление возвращается на склад.
+    """
+    cart = cart_service.get_or_create_cart(db, current_user)
+    if not cart.lines:
+        raise HTTPException(status_code=400, detail="Корзина пуста")
+    
+    try:
+        reservations = place_checkout_hold(
+            db, current_user.id, aggregate_quantities((line.product_id, line.quantity) for line in cart.lines)
+        )
+    except InsufficientStock as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Недостаточно товара на складе", "product_ids": e.product_ids}
+        )
+    
+    db.commit()
+    return CheckoutHold(
+        reservations=[StockReservationSchema.model_validate(reservation) for reservation in reservations],
+        expires_at=reservations[0].expires_at if reservations else None
+    )
+
+@router.delete("/checkout")
+def cancel_checkout(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Отменить оформление: вернуть удержанный товар на склад
+    """
+    released = release_checkout_hold(db, current_user.id)
+    db.commit()
+    return {"message": "Удержание товара снято", "released": released}
@@ -1,19 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import asyncio
+import json
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 import math
-from app.database import get_db
+from app.database import get_db, settings
 from app.models import Order, OrderItem, Product, User
 from app.models.orders import OrderStatus
 from app.schemas import (
     OrderCreate, OrderUpdate, Order as OrderSchema, 
-    OrderList, CartItem, CartCalculation
+    OrderList, CartItem, CartCalculation,
+    Cart as CartSchema, CartLine as CartLineSchema,
+    QuickOrderLine as QuickOrderLineSchema, QuickOrderResult
 )
 from app.utils.auth import get_current_active_user
-from app.utils.pricing import calculate_b2b_discount
+from app.utils.pricing import calculate_total_for_item
+from app.utils.query_counter import query_budget
+from app.services.pricing_engine import pricing_engine
+from app.services.outbox import enqueue_event, build_order_payload, ORDER_CREATED
+from app.services.order_events import order_events
+from app.services import cart as cart_service
+from app.services.quick_order import parse_text, parse_file, resolve_lines, QuickOrderError
+from app.services.stock import (
+    reserve_items, commit_order_reservations, release_order_reservations, release_checkout_hold,
+    aggregate_quantities, InsufficientStock
+)
 
 router = APIRouter()
 
+# Стратегия загрузки заказа для сериализации OrderSchema:
+# позиции и товары подгружаются двумя запросами на всю страницу вместо N+1
+ORDER_LOAD_OPTIONS = (
+    selectinload(Order.order_items).selectinload(OrderItem.product),
+)
+
+# Бюджет SQL-запросов: не зависит от числа заказов и позиций. В режиме DEBUG
+# превышение пишется в лог, жесткая проверка - scripts/order_query_budget_check.py.
+# Список: count, заказы, позиции, товары; один заказ: заказ, позиции, товары.
+# Плюс один запрос: дочитывание полей пользователя из снимка principal_cache (Order.user)
+ORDER_LIST_QUERY_BUDGET = 5
+ORDER_DETAIL_QUERY_BUDGET = 4
+
 @router.post("/calculate", response_model=CartCalculation)
 def calculate_cart(
     cart_items: List[CartItem],
@@ -26,33 +54,44 @@ def calculate_cart(
     if not cart_items:
         raise HTTPException(status_code=400, detail="Корзина пуста")
     
-    calculated_items = []
-    total_amount = 0.0
-    total_discount = 0.0
+    rules = pricing_engine.get_rules(db)
     
+    # Получаем товары и считаем сумму корзины до скидок (нужна для порогов по сумме)
+    cart_products = []
+    cart_total = 0.0
     for item in cart_items:
-        # Получаем товар
         product = db.query(Product).filter(Product.id == item.product_id).first()
         if not product:
             raise HTTPException(status_code=404, detail=f"Товар с ID {item.product_id} не найден")
-        
+        cart_products.append((item, product))
+        cart_total += product.price * item.quantity
+    
+    calculated_items = []
+    total_amount = 0.0
+    total_discount = 0.0
+    
+    for item, product in cart_products:
         # Рассчитываем цену с учетом скидки
-        discount_percent = calculate_b2b_discount(item.quantity)
-        unit_price = product.price
-        base_total = unit_price * item.quantity
-        discount_amount = base_total * (discount_percent / 100)
-        final_total = base_total - discount_amount
+        line = calculate_total_for_item(
+            product.price,
+            item.quantity,
+            user_type=current_user.user_type,
+            category_id=product.category_id,
+            manufacturer=product.manufacturer,
+            cart_total=cart_total,
+            rules=rules
+        )
         
         calculated_items.append({
             "product_id": item.product_id,
             "quantity": item.quantity,
-            "unit_price": unit_price,
-            "discount_percent": discount_percent,
-            "total_price": final_total
+            "unit_price": line["unit_price"],
+            "discount_percent": line["discount_percent"],
+            "total_price": line["final_total"]
         })
         
-        total_amount += final_total
-        total_discount += discount_amount
+        total_amount += line["final_total"]
+        total_discount += line["discount_amount"]
     
     return CartCalculation(
         items=calculated_items,
@@ -60,6 +99,75 @@ def calculate_cart(
         total_discount=total_discount
     )
 
+@router.post("/quick", response_model=QuickOrderResult)
+def quick_order(
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    replace: bool = Query(False, description="Заменить содержимое корзины"),
+    accept_fuzzy: bool = Query(False, description="Подставлять нечеткие совпадения артикулов"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Быстрый заказ по списку артикулов
+
+    Принимает вставленный текст ("EMC-HW-80 x 50" на строку) или файл CSV/XLSX,
+    находит товары и кладет их в корзину с B2B скидками.
+    """
+    try:
+        if file is not None:
+            # Читаем не больше лимита: больший файл отклоняется до разбора
+            content = file.file.read(settings.quick_order_max_file_bytes + 1)
+            if len(content) > settings.quick_order_max_file_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Файл слишком большой: максимум {settings.quick_order_max_file_bytes // 1024} КБ"
+                )
+            lines = parse_file(file.filename, content)
+        elif text:
+            lines = parse_text(text)
+        else:
+            raise HTTPException(status_code=400, detail="Передайте список артикулов или файл")
+    except QuickOrderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not lines:
+        raise HTTPException(status_code=400, detail="Список артикулов пуст")
+    if len(lines) > settings.quick_order_max_lines:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много позиций: максимум {settings.quick_order_max_lines}"
+        )
+    
+    resolve_lines(db, lines, accept_fuzzy=accept_fuzzy)
+    resolved = [line for line in lines if line.product_id is not None]
+    
+    rules = pricing_engine.get_rules(db)
+    cart = cart_service.get_or_create_cart(db, current_user)
+    if replace:
+        cart_service.clear_cart(db, cart)
+    cart_service.add_lines(
+        db, cart,
+        aggregate_quantities((line.product_id, line.quantity) for line in resolved),
+        rules, current_user.user_type
+    )
+    
+    cart_lines = cart_service.recalculate_cart(db, cart, rules, current_user.user_type)
+    response = QuickOrderResult(
+        cart=CartSchema(
+            id=cart.id,
+            items=[CartLineSchema.model_validate(line) for line in cart_lines],
+            subtotal=cart.subtotal,
+            total_amount=cart.total_amount,
+            total_discount=cart.total_discount,
+            updated_at=cart.updated_at
+        ),
+        lines=[QuickOrderLineSchema.model_validate(line) for line in resolved],
+        unresolved=[QuickOrderLineSchema.model_validate(line) for line in lines if line.product_id is None]
+    )
+    db.commit()
+    return response
+
 @router.post("/", response_model=OrderSchema)
 def create_order(
     order: OrderCreate,
@@ -72,31 +180,41 @@ def create_order(
     if not order.items:
         raise HTTPException(status_code=400, detail="Заказ должен содержать товары")
     
-    # Проверяем все товары и рассчитываем общую сумму
-    total_amount = 0.0
-    order_items_data = []
+    rules = pricing_engine.get_rules(db)
     
+    # Проверяем все товары и считаем сумму до скидок
+    order_products = []
+    cart_total = 0.0
     for item in order.items:
-        # Получаем товар
         product = db.query(Product).filter(Product.id == item.product_id).first()
         if not product:
             raise HTTPException(status_code=404, detail=f"Товар с ID {item.product_id} не найден")
-        
-        # Рассчитываем цену с учетом скидки
-        discount_percent = calculate_b2b_discount(item.quantity)
-        unit_price = product.price
-        base_total = unit_price * item.quantity
-        discount_amount = base_total * (discount_percent / 100)
-        final_total = base_total - discount_amount
+        order_products.append((item, product))
+        cart_total += product.price * item.quantity
+    
+    # Рассчитываем цены с учетом скидок и общую сумму
+    total_amount = 0.0
+    order_items_data = []
+    
+    for item, product in order_products:
+        line = calculate_total_for_item(
+            product.price,
+            item.quantity,
+            user_type=current_user.user_type,
+            category_id=product.category_id,
+            manufacturer=product.manufacturer,
+            cart_total=cart_total,
+            rules=rules
+        )
         
         order_items_data.append({
             "product_id": item.product_id,
             "quantity": item.quantity,
-            "unit_price": unit_price,
-            "discount_percent": discount_percent
+            "unit_price": line["unit_price"],
+            "discount_percent": line["discount_percent"]
         })
         
-        total_amount += final_total
+        total_amount += line["final_total"]
     
     # Создаем заказ
     order_data = order.dict()
@@ -109,8 +227,7 @@ def create_order(
     )
     
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    db.flush()
     
     # Создаем позиции заказа
     for item_data in order_items_data:
@@ -120,6 +237,37 @@ def create_order(
         )
         db.add(db_order_item)
     
+    # Событие для синхронизации с Битрикс24 пишется в той же транзакции,
+    # сама отправка выполняется фоновым воркером outbox
+    enqueue_event(
+        db,
+        ORDER_CREATED,
+        aggregate_id=db_order.id,
+        payload=build_order_payload(db_order, current_user, order_products, order_items_data)
+    )
+    
+    # Резервирование остатков - последним шагом перед commit,
+    # чтобы блокировки строк склада держались как можно меньше
+    try:
+        # Удержание оформления переходит в резерв заказа: возвращенный товар
+        # сразу резервируется под заказ в той же транзакции
+        release_checkout_hold(db, current_user.id)
+        reserve_items(
+            db,
+            aggregate_quantities((item.product_id, item.quantity) for item in order.items),
+            user_id=current_user.id,
+            order_id=db_order.id
+        )
+        # Товар оформленного заказа списан окончательно: очистка просроченных
+        # резервов возвращает на склад только удержания без заказа
+        commit_order_reservations(db, db_order.id)
+    except InsufficientStock as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Недостаточно товара на складе", "product_ids": e.product_ids}
+        )
+    
     db.commit()
     db.refresh(db_order)
     
@@ -136,30 +284,75 @@ def get_orders(
     """
     Получить список заказов текущего пользователя
     """
-    query = db.query(Order).filter(Order.user_id == current_user.id)
-    
-    if status:
-        query = query.filter(Order.status == status)
-    
-    # Сортировка по дате создания (новые сначала)
-    query = query.order_by(Order.created_at.desc())
-    
-    # Общее количество заказов
-    total = query.count()
-    
-    # Применение пагинации
-    orders = query.offset(skip).limit(limit).all()
-    
-    # Вычисление метаданных пагинации
-    pages = math.ceil(total / limit) if total > 0 else 1
-    page = math.floor(skip / limit) + 1
-    
-    return OrderList(
-        items=orders,
-        total=total,
-        page=page,
-        size=limit,
-        pages=pages
+    # Сериализация - внутри бюджета: ленивые загрузки при ней тоже считаются
+    with query_budget(ORDER_LIST_QUERY_BUDGET, "GET /api/orders"):
+        query = db.query(Order).filter(Order.user_id == current_user.id)
+        
+        if status:
+            query = query.filter(Order.status == status)
+        
+        # Общее количество заказов
+        total = query.count()
+        
+        # Сортировка по дате создания (новые сначала) и пагинация
+        orders = (
+            query.options(*ORDER_LOAD_OPTIONS)
+            .order_by(Order.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        
+        # Вычисление метаданных пагинации
+        pages = math.ceil(total / limit) if total > 0 else 1
+        page = math.floor(skip / limit) + 1
+        
+        return OrderList(
+            items=orders,
+            total=total,
+            page=page,
+            size=limit,
+            pages=pages
+        )
+
+@router.get("/events")
+async def order_status_events(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Поток изменений статусов заказов текущего пользователя (Server-Sent Events)
+    """
+    user_id = current_user.id
+    # Соединение с БД не должно удерживаться на все время жизни потока
+    db.close()
+    
+    queue = order_events.subscribe(user_id)
+    
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=settings.sse_keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # Комментарий-keepalive, чтобы прокси не закрывали простаивающее соединение
+                    yield ": keepalive\n\n"
+                    continue
+                
+                data = json.dumps(payload, ensure_ascii=False)
+                yield f"id: {payload['order_id']}\nevent: order_status\ndata: {data}\n\n"
+        finally:
+            order_events.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
     )
 
 @router.get("/{order_id}", response_model=OrderSchema)
@@ -171,15 +364,16 @@ def get_order(
     """
     Получить заказ по ID
     """
-    order = db.query(Order).filter(
-        Order.id == order_id,
-        Order.user_id == current_user.id
-    ).first()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
-    
-    return order
+    with query_budget(ORDER_DETAIL_QUERY_BUDGET, "GET /api/orders/{order_id}"):
+        order = db.query(Order).options(*ORDER_LOAD_OPTIONS).filter(
+            Order.id == order_id,
+            Order.user_id == current_user.id
+        ).first()
+        
+        if not order:
+            raise HTTPException(status_code=404, detail="Заказ не найден")
+        
+        return OrderSchema.model_validate(order)
 
 @router.put("/{order_id}", response_model=OrderSchema)
 def update_order(
@@ -238,6 +432,10 @@ def update_order(
     for field, value in filtered_updates.items():
         setattr(order, field, value)
     
+    # Отмененный заказ возвращает товар на склад
+    if filtered_updates.get("status") == OrderStatus.cancelled:
+        release_order_reservations(db, order.id)
+    
     db.commit()
     db.refresh(order)
     
@@ -267,6 +465,7 @@ def cancel_order(
         )
     
     order.status = OrderStatus.cancelled
+    release_order_reservations(db, order.id)
     db.commit()
     
     return {"message": "Заказ успешно отменен"}
\ No newline at end of file
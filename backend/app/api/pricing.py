@@ -0,0 +1,112 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.database import get_db
+from app.models import PricingRule, Category
+from app.models.users import UserType
+from app.schemas import PricingRuleCreate, PricingRuleUpdate, PricingRule as PricingRuleSchema
+from app.services.pricing_engine import pricing_engine
+
+router = APIRouter()
+
+def validate_rule(discount_percent: Optional[float], category_id: Optional[int], db: Session):
+    """
+    Проверить скидку и категорию правила
+    """
+    if discount_percent is not None and not 0 <= discount_percent <= 100:
+        raise HTTPException(status_code=400, detail="Скидка должна быть в диапазоне 0-100%")
+    
+    if category_id:
+        category = db.query(Category).filter(Category.id == category_id).first()
+        if not category:
+            raise HTTPException(status_code=400, detail="Категория не найдена")
+
+@router.get("/rules", response_model=List[PricingRuleSchema])
+def get_pricing_rules(
+    user_type: Optional[UserType] = Query(None, description="Фильтр по типу клиента"),
+    category_id: Optional[int] = Query(None, description="Фильтр по категории"),
+    db: Session = Depends(get_db)
+):
+    """
+    Получить список правил ценообразования
+    """
+    query = db.query(PricingRule)
+    
+    if user_type:
+        query = query.filter(PricingRule.user_type == user_type)
+    
+    if category_id:
+        query = query.filter(PricingRule.category_id == category_id)
+    
+    return query.order_by(PricingRule.threshold_type, PricingRule.threshold).all()
+
+@router.get("/discount")
+def get_discount(
+    quantity: int = Query(1, ge=1, description="Количество товара"),
+    user_type: Optional[UserType] = Query(None, description="Тип клиента"),
+    category_id: Optional[int] = Query(None, description="ID категории"),
+    manufacturer: Optional[str] = Query(None, description="Производитель"),
+    cart_total: float = Query(0, ge=0, description="Сумма корзины до скидок"),
+    db: Session = Depends(get_db)
+):
+    """
+    Рассчитать скидку по текущим правилам (для проверки настроек)
+    """
+    rules = pricing_engine.get_rules(db)
+    discount_percent = rules.discount_for(
+        quantity,
+        user_type=user_type,
+        category_id=category_id,
+        manufacturer=manufacturer,
+        cart_total=cart_total
+    )
+    return {"discount_percent": discount_percent, "rules_count": rules.rules_count}
+
+@router.post("/rules", response_model=PricingRuleSchema)
+def create_pricing_rule(rule: PricingRuleCreate, db: Session = Depends(get_db)):
+    """
+    Создать правило ценообразования
+    """
+    validate_rule(rule.discount_percent, rule.category_id, db)
+    
+    db_rule = PricingRule(**rule.dict())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+@router.put("/rules/{rule_id}", response_model=PricingRuleSchema)
+def update_pricing_rule(
+    rule_id: int,
+    rule_update: PricingRuleUpdate,
+    db: Session = Depends(get_db)
+):
+    """
+    Обновить правило ценообразования
+    """
+    rule = db.query(PricingRule).filter(PricingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Правило не найдено")
+    
+    validate_rule(rule_update.discount_percent, rule_update.category_id, db)
+    
+    update_data = rule_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(rule, field, value)
+    
+    db.commit()
+    db.refresh(rule)
+    return rule
+
+@router.delete("/rules/{rule_id}")
+def delete_pricing_rule(rule_id: int, db: Session = Depends(get_db)):
+    """
+    Удалить правило ценообразования
+    """
+    rule = db.query(PricingRule).filter(PricingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Правило не найдено")
+    
+    db.delete(rule)
+    db.commit()
+    return {"message": "Правило успешно удалено"}
@@ -4,8 +4,10 @@ from sqlalchemy import and_, or_
 from typing import List, Optional
 from app.database import get_db
 from app.models import Product, Category
-from app.schemas import ProductCreate, ProductUpdate, Product as ProductSchema, ProductList, ProductFilter
+from app.schemas import ProductCreate, ProductUpdate, Product as ProductSchema, ProductList, ProductFilter, RelatedProduct
 from app.utils.pricing import calculate_price_with_discount
+from app.services.pricing_engine import pricing_engine
+from app.services.related_products import related_products
 import math
 
 router = APIRouter()
@@ -112,9 +114,38 @@ def get_product_price(
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
     
-    price_calculation = calculate_price_with_discount(product.price, quantity)
+    price_calculation = calculate_price_with_discount(
+        product.price,
+        quantity,
+        category_id=product.category_id,
+        manufacturer=product.manufacturer,
+        rules=pricing_engine.get_rules(db)
+    )
     return price_calculation
 
+@router.get("/{product_id}/related", response_model=List[RelatedProduct])
+def get_related_products(
+    product_id: int,
+    limit: int = Query(10, ge=1, le=40, description="Количество товаров"),
+    exclude_same_category: bool = Query(False, description="Только из других категорий"),
+    db: Session = Depends(get_db)
+):
+    """
+    Похожие товары (заранее посчитанные соседи по embedding)
+    """
+    related = related_products.get(db, product_id, limit, exclude_same_category)
+    if related is None:
+        if not db.query(Product.id).filter(Product.id == product_id).first():
+            raise HTTPException(status_code=404, detail="Товар не найден")
+        return []
+
+    ids = [item["product_id"] for item in related]
+    products = {product.id: product for product in db.query(Product).filter(Product.id.in_(ids))} if ids else {}
+    return [
+        {"product": products[item["product_id"]], "similarity": item["similarity"]}
+        for item in related if item["product_id"] in products
+    ]
+
 @router.post("/", response_model=ProductSchema)
 def create_product(product: ProductCreate, db: Session = Depends(get_db)):
     """
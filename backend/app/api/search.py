@@ -0,0 +1,146 @@
+import logging
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database import get_db
+from app.models import Product, User
+from app.schemas import SearchResponse, SearchAnalytics, SpecSearchResponse
+from app.services.hybrid_search import SearchFilters, hybrid_search
+from app.services.search_analytics import search_analytics, search_analytics_report
+from app.services.spec_search import SpecQuery, spec_index, spec_similarity
+from app.utils.auth import get_current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_vector_service = None
+_vector_service_error = None
+
+def get_vector_service():
+    """Сервис векторного поиска; None, если он не настроен (остается лексический поиск)"""
+    global _vector_service, _vector_service_error
+    if _vector_service is None and _vector_service_error is None:
+        try:
+            from app.services.vector_search import get_vector_search_service
+            _vector_service = get_vector_search_service()
+        except Exception as e:
+            _vector_service_error = e
+            logger.warning(f"Векторный поиск недоступен: {e}")
+    return _vector_service
+
+@router.get("/", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Поисковый запрос"),
+    limit: int = Query(20, ge=1, le=100, description="Количество результатов"),
+    mode: str = Query("hybrid", pattern="^(hybrid|lexical|vector)$", description="hybrid, lexical или vector"),
+    category_id: Optional[int] = Query(None, description="ID категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    min_power: Optional[int] = Query(None, ge=0, description="Минимальная мощность (Вт)"),
+    max_power: Optional[int] = Query(None, ge=0, description="Максимальная мощность (Вт)"),
+    protection: Optional[str] = Query(None, description="Минимальная степень защиты (например, IP65)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Гибридный поиск товаров: BM25 + векторная близость с фильтрами до поиска
+    """
+    filters = SearchFilters(
+        category_id=category_id,
+        min_price=min_price,
+        max_price=max_price,
+        min_power=min_power,
+        max_power=max_power,
+    )
+    if protection:
+        filters.min_protection = SearchFilters.from_dict({"protection_rating": protection}).min_protection
+        if filters.min_protection is None:
+            raise HTTPException(status_code=400, detail="Степень защиты указывается как IP65 или 65")
+
+    vector_service = get_vector_service() if mode != "lexical" else None
+    if mode == "vector" and vector_service is None:
+        raise HTTPException(status_code=503, detail="Векторный поиск недоступен")
+
+    started = time.perf_counter()
+    try:
+        hits = await hybrid_search(db, q, limit, filters, mode, vector_service)
+    except Exception as e:
+        logger.error(f"Ошибка поиска по запросу '{q}': {e}")
+        raise HTTPException(status_code=503, detail="Векторный поиск недоступен")
+
+    def load_products():
+        ids = [hit["product_id"] for hit in hits]
+        return {product.id: product for product in db.query(Product).filter(Product.id.in_(ids))} if ids else {}
+
+    products = await run_in_threadpool(load_products)
+    items = [
+        {**hit, "product": products[hit["product_id"]]}
+        for hit in hits if hit["product_id"] in products
+    ]
+    search_analytics.record(
+        q, results_count=len(items), mode=mode, latency_ms=(time.perf_counter() - started) * 1000
+    )
+    return {"query": q, "mode": mode, "items": items}
+
+@router.get("/specs", response_model=SpecSearchResponse)
+def search_by_specs(
+    product_id: Optional[int] = Query(None, description="Подобрать аналог этого товара"),
+    power: Optional[float] = Query(None, gt=0, description="Мощность (Вт)"),
+    luminous_flux: Optional[float] = Query(None, gt=0, description="Световой поток (Лм)"),
+    color_temperature: Optional[float] = Query(None, gt=0, description="Цветовая температура (К)"),
+    protection: Optional[str] = Query(None, description="Степень защиты (например, IP65)"),
+    price: Optional[float] = Query(None, gt=0, description="Цена"),
+    category_id: Optional[int] = Query(None, description="ID категории"),
+    limit: int = Query(15, ge=1, le=100, description="Количество результатов"),
+    db: Session = Depends(get_db)
+):
+    """
+    Похожие товары по числовым характеристикам (подбор аналога)
+
+    Характеристики берутся у товара product_id, явно заданные параметры их заменяют.
+    """
+    query = SpecQuery()
+    if product_id is not None:
+        query = spec_index.product_specs(db, product_id)
+        if query is None:
+            raise HTTPException(status_code=404, detail="Товар не найден")
+
+    explicit = SpecQuery.from_dict({
+        "power": power,
+        "luminous_flux": luminous_flux,
+        "color_temperature": color_temperature,
+        "protection_rating": protection,
+        "price": price,
+    })
+    if protection and explicit.protection is None:
+        raise HTTPException(status_code=400, detail="Степень защиты указывается как IP65 или 65")
+    for name, value in vars(explicit).items():
+        if value is not None:
+            setattr(query, name, value)
+    if query.is_empty():
+        raise HTTPException(status_code=400, detail="Укажите товар или хотя бы одну характеристику")
+
+    matches = spec_index.similar(
+        db, query, limit,
+        filters=SearchFilters(category_id=category_id),
+        exclude=[product_id] if product_id is not None else ()
+    )
+    ids = [match_id for match_id, _ in matches]
+    products = {product.id: product for product in db.query(Product).filter(Product.id.in_(ids))} if ids else {}
+    return {"items": [
+        {"product": products[match_id], "distance": distance, "similarity": spec_similarity(distance)}
+        for match_id, distance in matches if match_id in products
+    ]}
+
+@router.get("/analytics", response_model=SearchAnalytics)
+def get_search_analytics(
+    days: int = Query(7, ge=1, le=365, description="Период (дней, включая сегодня)"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Статистика поиска за период: объем, запросы без результатов, процентили времени
+    """
+    return search_analytics_report(db, days)
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import update
+from typing import List
+from app.database import get_db
+from app.models import Product, StockLevel, StockReservation, ReservationStatus
+from app.schemas import (
+    StockLevel as StockLevelSchema, StockLevelUpdate, StockAdjustment,
+    StockReservation as StockReservationSchema
+)
+
+router = APIRouter()
+
+@router.get("/{product_id}", response_model=StockLevelSchema)
+def get_stock(product_id: int, db: Session = Depends(get_db)):
+    """
+    Получить доступный остаток товара
+    """
+    stock = db.query(StockLevel).filter(StockLevel.product_id == product_id).first()
+    if not stock:
+        raise HTTPException(status_code=404, detail="Товар не учитывается на складе")
+    return stock
+
+@router.put("/{product_id}", response_model=StockLevelSchema)
+def set_stock(product_id: int, stock_update: StockLevelUpdate, db: Session = Depends(get_db)):
+    """
+    Установить доступный остаток товара (включает товар в складской учет)
+    """
+    if stock_update.quantity < 0:
+        raise HTTPException(status_code=400, detail="Остаток не может быть отрицательным")
+    
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Товар не найден")
+    
+    stock = db.query(StockLevel).filter(StockLevel.product_id == product_id).first()
+    if stock:
+        stock.quantity = stock_update.quantity
+    else:
+        stock = StockLevel(product_id=product_id, quantity=stock_update.quantity)
+        db.add(stock)
+    
+    db.commit()
+    db.refresh(stock)
+    return stock
+
+@router.post("/{product_id}/adjust", response_model=StockLevelSchema)
+def adjust_stock(product_id: int, adjustment: StockAdjustment, db: Session = Depends(get_db)):
+    """
+    Атомарно изменить остаток на delta (поступление или списание)
+    """
+    result = db.execute(
+        update(StockLevel)
+        .where(
+            StockLevel.product_id == product_id,
+            StockLevel.quantity + adjustment.delta >= 0
+        )
+        .values(quantity=StockLevel.quantity + adjustment.delta)
+        .execution_options(synchronize_session=False)
+    )
+    
+    if result.rowcount != 1:
+        db.rollback()
+        exists = db.query(StockLevel.product_id).filter(StockLevel.product_id == product_id).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Товар не учитывается на складе")
+        raise HTTPException(status_code=409, detail="Недостаточно товара на складе")
+    
+    db.commit()
+    return db.query(StockLevel).filter(StockLevel.product_id == product_id).first()
+
+@router.get("/{product_id}/reservations", response_model=List[StockReservationSchema])
+def get_active_reservations(product_id: int, db: Session = Depends(get_db)):
+    """
+    Получить активные резервы товара
+    """
+    return db.query(StockReservation).filter(
+        StockReservation.product_id == product_id,
+        StockReservation.status == ReservationStatus.active
+    ).order_by(StockReservation.expires_at).all()
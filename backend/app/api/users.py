@@ -1,34 +1,60 @@
-from datetime import timedelta
+from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials
+from jose import jwt
 from sqlalchemy.orm import Session
-from app.database import get_db, settings
+from app.database import get_db
 from app.models import User
-from app.schemas import UserCreate, UserLogin, User as UserSchema, Token
+from app.schemas import UserCreate, UserLogin, User as UserSchema, Token, RefreshTokenRequest
 from app.utils.auth import (
     authenticate_user, 
-    create_access_token, 
-    get_password_hash,
-    get_current_active_user
+    issue_tokens,
+    rotate_refresh_token,
+    revoke_session,
+    get_current_active_user,
+    security
 )
+from app.services.token_revocation import token_revocation
+from app.utils.passwords import password_hasher, PasswordHasherBusy
 
 router = APIRouter()
 
+def _save_user(db: Session, db_user: User) -> User:
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+def _issue_and_commit(db: Session, user: User) -> dict:
+    tokens = issue_tokens(db, user)
+    db.commit()
+    return tokens
+
 @router.post("/register", response_model=UserSchema)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     """
     Регистрация нового пользователя
     """
     # Проверка существования пользователя
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.email == user.email).first()
+    )
     if existing_user:
         raise HTTPException(
             status_code=400,
             detail="Пользователь с такой электронной почтой уже зарегистрирован"
         )
     
-    # Создание нового пользователя
-    hashed_password = get_password_hash(user.password)
+    # Создание нового пользователя (bcrypt - в отдельном пуле)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис регистрации перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
     user_data = user.dict()
     del user_data["password"]
     
@@ -37,21 +63,17 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+    return await run_in_threadpool(_save_user, db, db_user)
 
 @router.post("/login", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """
     Авторизация пользователя (получение JWT токена)
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,18 +88,14 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return await run_in_threadpool(_issue_and_commit, db, user)
 
 @router.post("/login/json", response_model=Token)
-def login_json(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login_json(user_credentials: UserLogin, db: Session = Depends(get_db)):
     """
     Авторизация пользователя через JSON (альтернатива form-data)
     """
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.email, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -92,11 +110,41 @@ def login_json(user_credentials: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return await run_in_threadpool(_issue_and_commit, db, user)
+
+@router.post("/refresh", response_model=Token)
+def refresh_access_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Обновить пару токенов по refresh токену (без повторного ввода пароля)
+    """
+    tokens = rotate_refresh_token(db, request.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный refresh токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+@router.post("/logout")
+def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Выйти: отозвать текущую сессию (access и refresh токены)
+    """
+    # Подпись уже проверена в get_current_active_user
+    payload = jwt.get_unverified_claims(credentials.credentials)
+    if payload.get("sid"):
+        revoke_session(db, payload["sid"])
+    elif payload.get("jti"):
+        token_revocation.revoke(
+            db, payload["jti"], datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+        )
+    db.commit()
+    return {"message": "Выход выполнен"}
 
 @router.get("/me", response_model=UserSchema)
 def read_users_me(current_user: User = Depends(get_current_active_user)):
@@ -13,12 +13,123 @@ class Settings(BaseSettings):
     secret_key: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     algorithm: str = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    refresh_token_expire_days: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+    
+    # Отзыв токенов: local (хеш-множество в памяти, синхронизация с БД) или redis
+    token_revocation_backend: str = os.getenv("TOKEN_REVOCATION_BACKEND", "local")
+    token_revocation_sync_seconds: float = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", "5"))
+    token_cleanup_interval_seconds: float = float(os.getenv("TOKEN_CLEANUP_INTERVAL_SECONDS", "3600"))
+    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Ограничение частоты запросов: local (шардированная таблица в памяти) или redis
+    rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    rate_limit_backend: str = os.getenv("RATE_LIMIT_BACKEND", "local")
+    rate_limit_shards: int = int(os.getenv("RATE_LIMIT_SHARDS", "64"))
+    rate_limit_trust_proxy: bool = os.getenv("RATE_LIMIT_TRUST_PROXY", "False").lower() == "true"
+    rate_limit_auth_per_minute: float = float(os.getenv("RATE_LIMIT_AUTH_PER_MINUTE", "10"))
+    rate_limit_auth_burst: int = int(os.getenv("RATE_LIMIT_AUTH_BURST", "5"))
+    rate_limit_search_per_minute: float = float(os.getenv("RATE_LIMIT_SEARCH_PER_MINUTE", "120"))
+    rate_limit_search_burst: int = int(os.getenv("RATE_LIMIT_SEARCH_BURST", "30"))
+
+    # bcrypt: число раундов (при изменении хеши пересчитываются при входе) и пул проверки паролей
+    bcrypt_rounds: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    password_hash_workers: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    password_hash_queue_size: int = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
+    # Кеш авторизованных пользователей: изменения из других воркеров видны не позже чем через TTL
+    principal_cache_size: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+    principal_cache_ttl_seconds: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+    
     cors_origins: List[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]
+    debug: bool = os.getenv("DEBUG", "False").lower() == "true"
+    
+    # Порог SQL-запросов на HTTP-запрос, выше которого пишется предупреждение (в режиме DEBUG)
+    query_count_warn_threshold: int = int(os.getenv("QUERY_COUNT_WARN_THRESHOLD", "20"))
     
     # B2B скидки
     wholesale_discount_5: int = int(os.getenv("WHOLESALE_DISCOUNT_5", "5"))
     wholesale_discount_10: int = int(os.getenv("WHOLESALE_DISCOUNT_10", "10"))
     wholesale_discount_50: int = int(os.getenv("WHOLESALE_DISCOUNT_50", "15"))
+    
+    # Как часто проверять изменения правил ценообразования из других воркеров (сек)
+    pricing_rules_refresh_seconds: float = float(os.getenv("PRICING_RULES_REFRESH_SECONDS", "30"))
+    
+    # Битрикс24: входящий вебхук (https://домен.bitrix24.ru/rest/<user>/<код>/), ответственный за лиды и задачи
+    bitrix24_webhook_url: str = os.getenv("BITRIX24_WEBHOOK_URL", "")
+    bitrix24_domain: str = os.getenv("BITRIX24_DOMAIN", "")
+    bitrix24_user_id: int = int(os.getenv("BITRIX24_USER_ID", "1"))
+    
+    # Outbox: фоновая синхронизация заказов с Битрикс24
+    outbox_worker_enabled: bool = os.getenv("OUTBOX_WORKER_ENABLED", "False").lower() == "true"
+    outbox_concurrency: int = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+    outbox_poll_interval: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+    outbox_max_attempts: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    outbox_backoff_base: float = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+    outbox_backoff_max: float = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+    outbox_lease_seconds: int = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+    
+    # Интервал keepalive-комментариев в SSE потоках (сек)
+    sse_keepalive_seconds: float = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    
+    # Резервирование остатков: срок удержания товара за неподтвержденным заказом
+    stock_reservation_ttl_minutes: int = int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", "60"))
+    stock_sweep_interval_seconds: float = float(os.getenv("STOCK_SWEEP_INTERVAL_SECONDS", "60"))
+
+    # Быстрый заказ по списку артикулов
+    quick_order_max_lines: int = int(os.getenv("QUICK_ORDER_MAX_LINES", "1000"))
+    quick_order_max_file_bytes: int = int(os.getenv("QUICK_ORDER_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+    quick_order_fuzzy_cutoff: float = float(os.getenv("QUICK_ORDER_FUZZY_CUTOFF", "0.85"))
+    sku_index_refresh_seconds: float = float(os.getenv("SKU_INDEX_REFRESH_SECONDS", "60"))
+
+    # Векторный поиск: постоянный кеш embedding'ов по (модель, sha256 текста)
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+
+    # Поставщик embedding'ов: openai (API) или local (модель TF-IDF + проекция на CPU, без сети)
+    embedding_provider: str = os.getenv("EMBEDDING_PROVIDER", "openai")
+    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
+    local_embedding_model_path: str = os.getenv("LOCAL_EMBEDDING_MODEL_PATH", "data/local_embedding.npz")
+    local_embedding_dimension: int = int(os.getenv("LOCAL_EMBEDDING_DIMENSION", "256"))
+    local_embedding_workers: int = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "2"))
+
+    # Кеш embedding'ов поисковых запросов (в памяти воркера)
+    query_embedding_cache_size: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+    query_embedding_cache_ttl_seconds: float = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+
+    # Хранилище векторов: supabase (pgvector) или local (индекс в отображаемой в память матрице)
+    vector_search_backend: str = os.getenv("VECTOR_SEARCH_BACKEND", "supabase")
+    supabase_url: str = os.getenv("SUPABASE_URL", "")
+    supabase_service_key: str = os.getenv("SUPABASE_SERVICE_KEY", "")
+    vector_index_path: str = os.getenv("VECTOR_INDEX_PATH", "data/vector_index")
+    vector_index_dtype: str = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+    vector_index_ivf_threshold: int = int(os.getenv("VECTOR_INDEX_IVF_THRESHOLD", "20000"))
+    vector_index_nprobe: int = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+    # Квантование локального индекса: none, int8 или pq (0 подпространств - по 4 измерения на подпространство),
+    # точный пересчет limit * rerank лучших кандидатов
+    vector_index_quantization: str = os.getenv("VECTOR_INDEX_QUANTIZATION", "none")
+    vector_index_pq_subspaces: int = int(os.getenv("VECTOR_INDEX_PQ_SUBSPACES", "0"))
+    vector_index_rerank: int = int(os.getenv("VECTOR_INDEX_RERANK", "4"))
+    vector_store_workers: int = int(os.getenv("VECTOR_STORE_WORKERS", "8"))
+
+    # Гибридный поиск: как часто сверять индекс каталога с таблицей и порог близости векторных кандидатов
+    search_index_refresh_seconds: float = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "60"))
+    search_vector_threshold: float = float(os.getenv("SEARCH_VECTOR_THRESHOLD", "0.3"))
+
+    # Аналитика поиска: буфер в памяти, запись пачками, срок хранения отдельных событий
+    search_analytics_buffer_size: int = int(os.getenv("SEARCH_ANALYTICS_BUFFER_SIZE", "10000"))
+    search_analytics_batch_size: int = int(os.getenv("SEARCH_ANALYTICS_BATCH_SIZE", "500"))
+    search_analytics_flush_seconds: float = float(os.getenv("SEARCH_ANALYTICS_FLUSH_SECONDS", "5"))
+    search_analytics_retention_days: int = int(os.getenv("SEARCH_ANALYTICS_RETENTION_DAYS", "30"))
+
+    # Инкрементальная переиндексация измененных товаров (включать в одном процессе или запускать скриптом)
+    embedding_indexer_enabled: bool = os.getenv("EMBEDDING_INDEXER_ENABLED", "False").lower() == "true"
+    embedding_indexer_poll_seconds: float = float(os.getenv("EMBEDDING_INDEXER_POLL_SECONDS", "2"))
+    embedding_indexer_batch_size: int = int(os.getenv("EMBEDDING_INDEXER_BATCH_SIZE", "500"))
+
+    # Похожие товары: соседей на товар в каждом списке (своя категория / другие) и сверка таблицы в воркере
+    related_products_top_k: int = int(os.getenv("RELATED_PRODUCTS_TOP_K", "20"))
+    related_products_refresh_seconds: float = float(os.getenv("RELATED_PRODUCTS_REFRESH_SECONDS", "60"))
 
 settings = Settings()
 
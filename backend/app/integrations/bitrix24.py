@@ -9,7 +9,7 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 
-from app.core.config import settings
+from app.database import settings
 
 logger = logging.getLogger(__name__)
 
@@ -17,28 +17,36 @@ logger = logging.getLogger(__name__)
 class Bitrix24Integration:
     """Класс для работы с API Битрикс24"""
     
-    def __init__(self):
-        self.webhook_url = settings.BITRIX24_WEBHOOK_URL
-        self.domain = settings.BITRIX24_DOMAIN
-        self.user_id = settings.BITRIX24_USER_ID
+    def __init__(self, webhook_url: Optional[str] = None, client: Optional[httpx.AsyncClient] = None):
+        self.webhook_url = webhook_url or settings.bitrix24_webhook_url
+        self.domain = settings.bitrix24_domain
+        self.user_id = settings.bitrix24_user_id
         self.timeout = 30
+        # Общий HTTP-клиент с пулом соединений (например, для outbox воркера)
+        self._client = client
+        
+    async def _post(self, client: httpx.AsyncClient, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        response = await client.post(url, json=data)
+        response.raise_for_status()
+        
+        result = response.json()
+        
+        if "error" in result:
+            logger.error(f"Ошибка Битрикс24 API: {result['error']}")
+            raise Exception(f"Битрикс24 API ошибка: {result['error']}")
+        
+        return result
         
     async def _make_request(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Базовый метод для выполнения запросов к API Битрикс24"""
         url = f"{self.webhook_url}{method}"
         
         try:
+            if self._client is not None:
+                return await self._post(self._client, url, data)
+            
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(url, json=data)
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                if "error" in result:
-                    logger.error(f"Ошибка Битрикс24 API: {result['error']}")
-                    raise Exception(f"Битрикс24 API ошибка: {result['error']}")
-                
-                return result
+                return await self._post(client, url, data)
                 
         except httpx.RequestError as e:
             logger.error(f"Ошибка запроса к Битрикс24: {e}")
@@ -253,6 +261,31 @@ class Bitrix24Integration:
             logger.error(f"Ошибка создания счета для сделки {deal_id}: {e}")
             raise
 
+    async def sync_order(self, order_data: Dict[str, Any], progress: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Синхронизация заказа: лид с товарами -> сделка -> счет
+        
+        Используется outbox воркером. ID созданных сущностей сохраняются в progress,
+        поэтому при повторной попытке уже выполненные шаги пропускаются.
+        
+        Args:
+            order_data: Данные заказа
+            progress: Прогресс предыдущих попыток (изменяется на месте)
+            
+        Returns:
+            Прогресс с ID лида, сделки и счета
+        """
+        if not progress.get('lead_id'):
+            progress['lead_id'] = await self.create_lead(order_data)
+        
+        if not progress.get('deal_id'):
+            progress['deal_id'] = await self.create_deal_from_lead(progress['lead_id'], order_data)
+        
+        if not progress.get('invoice_id'):
+            progress['invoice_id'] = await self.create_invoice(progress['deal_id'], order_data)
+        
+        return progress
+
     async def update_lead_status(self, lead_id: int, status: str, comment: str = ""):
         """
         Обновление статуса лида
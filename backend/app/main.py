@@ -1,8 +1,17 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import settings, engine
 from app.models import Base
-from app.api import products, categories, users, orders
+from app.api import products, categories, users, orders, pricing, cart, stock, search
+from app.utils.query_counter import QueryCountMiddleware
+from app.utils.rate_limit import RateLimitMiddleware
+from app.services.order_events import order_events
+from app.services.stock import run_reservation_sweeper
+from app.services.token_revocation import run_token_cleanup
+from app.services.search_analytics import run_analytics_flusher, search_analytics
+from app.services.embedding_indexer import EmbeddingIndexer
+from app.utils.passwords import password_hasher
 
 # Создание таблиц
 Base.metadata.create_all(bind=engine)
@@ -13,6 +22,12 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Ограничение частоты запросов к входу, регистрации и поиску (ответ 429).
+# Добавляется до CORS: последний добавленный middleware - внешний,
+# поэтому CORS-заголовки получает и ответ 429
+if settings.rate_limit_enabled:
+    app.add_middleware(RateLimitMiddleware)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +37,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Подсчет SQL-запросов на каждый HTTP-запрос (заголовок X-Query-Count)
+if settings.debug:
+    app.add_middleware(
+        QueryCountMiddleware,
+        warn_threshold=settings.query_count_warn_threshold
+    )
+
 # Подключение роутеров
 app.include_router(
     products.router,
@@ -47,6 +69,101 @@ app.include_router(
     tags=["orders"]
 )
 
+app.include_router(
+    pricing.router,
+    prefix="/api/pricing",
+    tags=["pricing"]
+)
+
+app.include_router(
+    cart.router,
+    prefix="/api/cart",
+    tags=["cart"]
+)
+
+app.include_router(
+    stock.router,
+    prefix="/api/stock",
+    tags=["stock"]
+)
+
+app.include_router(
+    search.router,
+    prefix="/api/search",
+    tags=["search"]
+)
+
+@app.on_event("startup")
+async def start_outbox_worker():
+    """Запуск фоновой доставки событий outbox в Битрикс24"""
+    if settings.outbox_worker_enabled:
+        from app.services.outbox import create_bitrix24_outbox_worker
+        app.state.outbox_worker = create_bitrix24_outbox_worker()
+        app.state.outbox_task = asyncio.create_task(app.state.outbox_worker.run())
+
+@app.on_event("startup")
+async def start_order_events():
+    """Прием изменений статусов заказов от других воркеров (PostgreSQL LISTEN)"""
+    order_events.start()
+
+@app.on_event("shutdown")
+async def stop_order_events():
+    order_events.stop()
+
+@app.on_event("startup")
+async def start_reservation_sweeper():
+    """Возврат на склад просроченных резервов брошенных заказов"""
+    app.state.reservation_sweeper = asyncio.create_task(run_reservation_sweeper())
+
+@app.on_event("shutdown")
+async def stop_reservation_sweeper():
+    app.state.reservation_sweeper.cancel()
+
+@app.on_event("startup")
+async def start_token_cleanup():
+    """Удаление истекших refresh токенов и записей отзыва"""
+    app.state.token_cleanup = asyncio.create_task(run_token_cleanup())
+
+@app.on_event("shutdown")
+async def stop_token_cleanup():
+    app.state.token_cleanup.cancel()
+
+@app.on_event("startup")
+async def start_analytics_flusher():
+    """Фоновая запись аналитики поиска пачками"""
+    app.state.analytics_flusher = asyncio.create_task(run_analytics_flusher())
+
+@app.on_event("shutdown")
+async def stop_analytics_flusher():
+    app.state.analytics_flusher.cancel()
+    try:
+        await app.state.analytics_flusher
+    except asyncio.CancelledError:
+        pass
+
+@app.on_event("startup")
+async def start_embedding_indexer():
+    """Инкрементальная переиндексация измененных товаров для векторного поиска"""
+    if settings.embedding_indexer_enabled:
+        app.state.embedding_indexer = EmbeddingIndexer()
+        app.state.embedding_indexer_task = asyncio.create_task(app.state.embedding_indexer.run())
+
+@app.on_event("shutdown")
+async def stop_embedding_indexer():
+    if getattr(app.state, "embedding_indexer", None):
+        app.state.embedding_indexer.stop()
+        app.state.embedding_indexer_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_outbox_worker():
+    if getattr(app.state, "outbox_worker", None):
+        app.state.outbox_worker.stop()
+        app.state.outbox_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_password_hasher():
+    password_hasher.shutdown()
+
 @app.get("/")
 async def root():
     return {
@@ -57,7 +174,11 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "password_hasher": password_hasher.stats(),
+        "search_analytics": search_analytics.stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,6 +2,13 @@ from .categories import Category
 from .products import Product
 from .users import User, UserType
 from .orders import Order, OrderItem, OrderStatus
+from .pricing import PricingRule, PricingThreshold
+from .carts import Cart, CartLine
+from .outbox import OutboxEvent, OutboxStatus
+from .stock import StockLevel, StockReservation, ReservationStatus
+from .tokens import RefreshToken, RevokedToken
+from .search_analytics import SearchQuery, SearchEvent, SearchDailyStat, SearchLatencyBucket
+from .embedding_index import ProductIndexChange, ProductEmbeddingState, ProductRelation
 
 __all__ = [
     "Category",
@@ -10,5 +17,23 @@ __all__ = [
     "UserType",
     "Order",
     "OrderItem",
-    "OrderStatus"
+    "OrderStatus",
+    "PricingRule",
+    "PricingThreshold",
+    "Cart",
+    "CartLine",
+    "OutboxEvent",
+    "OutboxStatus",
+    "StockLevel",
+    "StockReservation",
+    "ReservationStatus",
+    "RefreshToken",
+    "RevokedToken",
+    "SearchQuery",
+    "SearchEvent",
+    "SearchDailyStat",
+    "SearchLatencyBucket",
+    "ProductIndexChange",
+    "ProductEmbeddingState",
+    "ProductRelation"
 ]
\ No newline at end of file
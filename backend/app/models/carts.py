@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+class Cart(Base):
+    __tablename__ = "carts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
+    
+    # Агрегаты корзины, поддерживаются инкрементально при изменении позиций
+    subtotal = Column(Float, nullable=False, default=0.0)  # Сумма без скидок
+    total_amount = Column(Float, nullable=False, default=0.0)
+    total_discount = Column(Float, nullable=False, default=0.0)
+    
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Связи
+    user = relationship("User")
+    lines = relationship("CartLine", back_populates="cart", cascade="all, delete-orphan")
+
+class CartLine(Base):
+    __tablename__ = "cart_lines"
+    __table_args__ = (
+        UniqueConstraint("cart_id", "product_id", name="uq_cart_lines_cart_product"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    
+    # Кеш расчета цены позиции
+    unit_price = Column(Float, nullable=False, default=0.0)  # Цена товара на момент расчета
+    quantity_discount = Column(Float, nullable=False, default=0.0)  # Скидка по порогу количества
+    discount_percent = Column(Float, nullable=False, default=0.0)  # Примененная скидка
+    total_price = Column(Float, nullable=False, default=0.0)
+    category_id = Column(Integer, nullable=True)  # Копия из товара для правил ценообразования
+    manufacturer = Column(String, nullable=True)
+    rules_version = Column(String, nullable=True)  # Версия правил, по которой рассчитана позиция
+    is_stale = Column(Boolean, nullable=False, default=False, index=True)  # Цена товара изменилась
+    
+    # Связи
+    cart = relationship("Cart", back_populates="lines")
+    product = relationship("Product")
+    
+    @property
+    def base_total(self):
+        """Стоимость позиции без скидки"""
+        return self.quantity * self.unit_price
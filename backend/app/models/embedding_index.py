@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class ProductIndexChange(Base):
+    """Журнал изменений товаров для векторного индекса (пишется в транзакции изменения)"""
+    __tablename__ = "product_index_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False, index=True)  # Удаленный товар просто отсутствует в products
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ProductEmbeddingState(Base):
+    """Какой текст товара сейчас проиндексирован (sha256 текста для embedding)"""
+    __tablename__ = "product_embedding_states"
+
+    product_id = Column(Integer, primary_key=True)
+    text_hash = Column(String(64), nullable=False)
+    indexed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ProductRelation(Base):
+    """Заранее посчитанный сосед товара по embedding (top-k своей категории и top-k других)"""
+    __tablename__ = "product_relations"
+    __table_args__ = (
+        Index("ix_product_relations_product_kind_rank", "product_id", "same_category", "rank"),
+        Index("ix_product_relations_related", "related_product_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False)
+    related_product_id = Column(Integer, nullable=False)
+    same_category = Column(Boolean, nullable=False)
+    rank = Column(Integer, nullable=False)  # 0 - самый близкий
+    similarity = Column(Float, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON, Text, Index
+from sqlalchemy.sql import func
+import enum
+from app.database import Base
+
+class OutboxStatus(enum.Enum):
+    pending = "pending"        # Ожидает отправки
+    processing = "processing"  # Захвачено воркером
+    done = "done"              # Успешно обработано
+    dead = "dead"              # Исчерпаны попытки (dead letter)
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String, nullable=False)  # Например, "order.created"
+    aggregate_id = Column(Integer, nullable=True, index=True)  # ID заказа
+    payload = Column(JSON, nullable=False)
+    
+    # Результаты уже выполненных шагов (ID лида, сделки, счета) для идемпотентных повторов
+    result = Column(JSON, nullable=True)
+    
+    status = Column(Enum(OutboxStatus), nullable=False, default=OutboxStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Enum
+from sqlalchemy.sql import func
+import enum
+from app.database import Base
+from app.models.users import UserType
+
+class PricingThreshold(enum.Enum):
+    quantity = "quantity"      # Порог по количеству товара в позиции
+    cart_total = "cart_total"  # Порог по сумме корзины (до скидок)
+
+class PricingRule(Base):
+    __tablename__ = "pricing_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=True)
+
+    # Область действия правила (NULL = для всех)
+    user_type = Column(Enum(UserType), nullable=True, index=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True, index=True)
+    manufacturer = Column(String, nullable=True)
+
+    # Порог и скидка
+    threshold_type = Column(Enum(PricingThreshold), nullable=False, default=PricingThreshold.quantity)
+    threshold = Column(Float, nullable=False, default=0)
+    discount_percent = Column(Float, nullable=False)
+
+    is_active = Column(Boolean, default=True)
+
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,58 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, LargeBinary, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+class SearchQuery(Base):
+    """Уникальный нормализованный запрос: текст и embedding хранятся один раз"""
+    __tablename__ = "search_queries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    query_hash = Column(String(64), unique=True, nullable=False, index=True)  # sha256 нормализованного запроса
+    query_text = Column(String, nullable=False)
+
+    # Embedding запроса в int8: компонента = байт * embedding_scale (1,5 КБ вместо 6 КБ для 1536 измерений)
+    embedding = Column(LargeBinary, nullable=True)
+    embedding_scale = Column(Float, nullable=True)
+
+    # Временные метки
+    first_seen_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_seen_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SearchEvent(Base):
+    """Отдельный поиск (хранится search_analytics_retention_days, статистика - в дневных свертках)"""
+    __tablename__ = "search_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    query_hash = Column(String(64), nullable=False, index=True)
+    user_session = Column(String, nullable=True)
+    mode = Column(String(16), nullable=True)  # vector, hybrid, lexical
+    results_count = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class SearchDailyStat(Base):
+    """Дневная свертка поисков по запросу (пополняется при каждой записи событий)"""
+    __tablename__ = "search_daily_stats"
+    __table_args__ = (
+        UniqueConstraint("day", "query_hash", name="uq_search_daily_stats_day_query"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    query_hash = Column(String(64), nullable=False)
+    searches = Column(Integer, nullable=False, default=0)
+    zero_results = Column(Integer, nullable=False, default=0)  # Поиски без результатов
+    results_total = Column(Integer, nullable=False, default=0)  # Для среднего числа результатов
+
+class SearchLatencyBucket(Base):
+    """Дневная гистограмма времени поиска: число поисков в интервале bucket (см. LATENCY_BUCKETS_MS)"""
+    __tablename__ = "search_latency_buckets"
+    __table_args__ = (
+        UniqueConstraint("day", "mode", "bucket", name="uq_search_latency_buckets_day_mode_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    mode = Column(String(16), nullable=False)
+    bucket = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
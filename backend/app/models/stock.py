@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Enum, CheckConstraint, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+import enum
+from app.database import Base
+
+class StockLevel(Base):
+    __tablename__ = "stock_levels"
+    __table_args__ = (
+        CheckConstraint("quantity >= 0", name="ck_stock_levels_quantity_non_negative"),
+    )
+
+    # Товар без строки в stock_levels считается неучитываемым (под заказ)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)  # Доступно к резервированию
+    
+    # Временные метки
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Связи
+    product = relationship("Product")
+
+class ReservationStatus(enum.Enum):
+    active = "active"        # Товар удержан под заказ
+    committed = "committed"  # Заказ подтвержден, списание окончательное
+    released = "released"    # Заказ отменен, товар возвращен
+    expired = "expired"      # Истек срок удержания, товар возвращен
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        Index("ix_stock_reservations_status_expires", "status", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(Enum(ReservationStatus), nullable=False, default=ReservationStatus.active)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, unique=True, nullable=False, index=True)  # ID токена из JWT
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    # Сессия: все токены, полученные ротацией от одного входа
+    family_id = Column(String, nullable=False, index=True)
+
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    replaced_by = Column(String, nullable=True)  # jti токена, выданного при ротации
+
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Связи
+    user = relationship("User")
+
+class RevokedToken(Base):
+    """Отозванные идентификаторы (jti токена или ID сессии) - источник истины для кеша отзыва"""
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_id = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # После этого запись не нужна
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,7 +1,11 @@
 from .categories import Category, CategoryCreate, CategoryUpdate, CategoryWithProducts
-from .products import Product, ProductCreate, ProductUpdate, ProductWithCategory, ProductFilter, ProductList
-from .users import User, UserCreate, UserUpdate, UserLogin, Token, UserType
+from .products import Product, ProductCreate, ProductUpdate, ProductWithCategory, ProductShort, ProductFilter, ProductList, RelatedProduct
+from .users import User, UserCreate, UserUpdate, UserLogin, Token, RefreshTokenRequest, UserType
 from .orders import Order, OrderCreate, OrderUpdate, OrderItem, OrderItemCreate, CartItem, CartCalculation
+from .pricing import PricingRule, PricingRuleCreate, PricingRuleUpdate
+from .carts import Cart, CartLine, CartLineCreate, CartLineUpdate, CartLineResult, CartTotals, QuickOrderLine, QuickOrderResult
+from .stock import StockLevel, StockLevelUpdate, StockAdjustment, StockReservation, CheckoutHold
+from .search import SearchHit, SearchResponse, SearchQueryStat, LatencyPercentiles, SearchAnalytics, SpecHit, SpecSearchResponse
 
 __all__ = [
     # Categories
@@ -15,8 +19,10 @@ __all__ = [
     "ProductCreate",
     "ProductUpdate", 
     "ProductWithCategory",
+    "ProductShort",
     "ProductFilter",
     "ProductList",
+    "RelatedProduct",
     
     # Users
     "User",
@@ -24,6 +30,7 @@ __all__ = [
     "UserUpdate",
     "UserLogin", 
     "Token",
+    "RefreshTokenRequest",
     "UserType",
     
     # Orders
@@ -33,5 +40,36 @@ __all__ = [
     "OrderItem",
     "OrderItemCreate",
     "CartItem",
-    "CartCalculation"
+    "CartCalculation",
+    
+    # Pricing
+    "PricingRule",
+    "PricingRuleCreate",
+    "PricingRuleUpdate",
+    
+    # Carts
+    "Cart",
+    "CartLine",
+    "CartLineCreate",
+    "CartLineUpdate",
+    "CartLineResult",
+    "CartTotals",
+    "QuickOrderLine",
+    "QuickOrderResult",
+    
+    # Stock
+    "StockLevel",
+    "StockLevelUpdate",
+    "StockAdjustment",
+    "StockReservation",
+    "CheckoutHold",
+    
+    # Search
+    "SearchHit",
+    "SearchResponse",
+    "SearchQueryStat",
+    "LatencyPercentiles",
+    "SearchAnalytics",
+    "SpecHit",
+    "SpecSearchResponse"
 ]
\ No newline at end of file
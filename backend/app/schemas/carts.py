@@ -0,0 +1,62 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+class CartLineCreate(BaseModel):
+    product_id: int
+    quantity: int = 1
+
+class CartLineUpdate(BaseModel):
+    quantity: int
+
+class CartLine(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: float
+    discount_percent: float
+    total_price: float
+    product: Optional["ProductShort"] = None
+
+    class Config:
+        from_attributes = True
+
+class CartTotals(BaseModel):
+    subtotal: float
+    total_amount: float
+    total_discount: float
+
+    class Config:
+        from_attributes = True
+
+class Cart(CartTotals):
+    id: int
+    items: List[CartLine] = []
+    updated_at: Optional[datetime] = None
+
+class CartLineResult(CartTotals):
+    """Ответ на изменение одной позиции: сама позиция и агрегаты корзины"""
+    item: Optional[CartLine] = None
+
+class QuickOrderLine(BaseModel):
+    """Строка быстрого заказа и найденный по ней товар"""
+    line: int
+    raw: str
+    sku: str
+    quantity: int
+    product_id: Optional[int] = None
+    matched_sku: Optional[str] = None
+    match: Optional[str] = None
+    suggestions: List[str] = []
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class QuickOrderResult(BaseModel):
+    cart: Cart
+    lines: List[QuickOrderLine] = []
+    unresolved: List[QuickOrderLine] = []
+
+# Импорт для forward references
+from .products import ProductShort
+CartLine.model_rebuild()
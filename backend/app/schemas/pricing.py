@@ -0,0 +1,39 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from app.models.users import UserType
+from app.models.pricing import PricingThreshold
+
+class PricingRuleBase(BaseModel):
+    name: Optional[str] = None
+    user_type: Optional[UserType] = None
+    category_id: Optional[int] = None
+    manufacturer: Optional[str] = None
+    threshold_type: PricingThreshold = PricingThreshold.quantity
+    threshold: float = 0
+    discount_percent: float
+    is_active: bool = True
+
+class PricingRuleCreate(PricingRuleBase):
+    pass
+
+class PricingRuleUpdate(BaseModel):
+    name: Optional[str] = None
+    user_type: Optional[UserType] = None
+    category_id: Optional[int] = None
+    manufacturer: Optional[str] = None
+    threshold_type: Optional[PricingThreshold] = None
+    threshold: Optional[float] = None
+    discount_percent: Optional[float] = None
+    is_active: Optional[bool] = None
+
+class PricingRuleInDBBase(PricingRuleBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class PricingRule(PricingRuleInDBBase):
+    pass
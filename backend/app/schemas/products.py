@@ -50,6 +50,22 @@ class ProductInDBBase(ProductBase):
 class Product(ProductInDBBase):
     pass
 
+class ProductShort(BaseModel):
+    """Краткая карточка товара для списков (позиции заказа, корзина)"""
+    id: int
+    name: str
+    sku: str
+    price: float
+    manufacturer: Optional[str] = None
+    power_watts: Optional[int] = None
+    luminous_flux: Optional[int] = None
+    color_temperature: Optional[int] = None
+    images: Optional[str] = None
+    category_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
 class ProductWithCategory(Product):
     category: Optional["Category"] = None
 
@@ -74,4 +90,8 @@ class ProductList(BaseModel):
 
 # Импорт для forward references
 from .categories import Category
-ProductWithCategory.model_rebuild()
\ No newline at end of file
+ProductWithCategory.model_rebuild()
+
+class RelatedProduct(BaseModel):
+    product: Product
+    similarity: float  # Косинусная близость embedding'ов
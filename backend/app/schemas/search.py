@@ -0,0 +1,44 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from .products import Product
+
+class SearchHit(BaseModel):
+    product: Product
+    score: float  # Оценка reciprocal rank fusion
+    lexical_rank: Optional[int] = None
+    vector_similarity: Optional[float] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    mode: str
+    items: List[SearchHit]
+
+class SearchQueryStat(BaseModel):
+    query: str
+    searches: int
+    zero_results: int
+    avg_results: float
+
+class LatencyPercentiles(BaseModel):
+    p50: Optional[float] = None  # мс, с точностью до интервала гистограммы (20%)
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+
+class SearchAnalytics(BaseModel):
+    period_days: int
+    total_searches: int
+    unique_queries: int
+    avg_results: float
+    zero_result_rate: float
+    top_queries: List[SearchQueryStat]
+    top_zero_result_queries: List[SearchQueryStat]
+    latency_ms: LatencyPercentiles
+    latency_ms_by_mode: Dict[str, LatencyPercentiles]
+
+class SpecHit(BaseModel):
+    product: Product
+    distance: float  # Взвешенное расстояние в пространстве характеристик
+    similarity: float
+
+class SpecSearchResponse(BaseModel):
+    items: List[SpecHit]
@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from app.models.stock import ReservationStatus
+
+class StockLevelUpdate(BaseModel):
+    quantity: int
+
+class StockAdjustment(BaseModel):
+    delta: int
+
+class StockLevel(BaseModel):
+    product_id: int
+    quantity: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class StockReservation(BaseModel):
+    id: int
+    product_id: int
+    order_id: Optional[int] = None
+    quantity: int
+    status: ReservationStatus
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class CheckoutHold(BaseModel):
+    """Товар корзины, удержанный на время оформления заказа"""
+    reservations: List[StockReservation]
+    expires_at: Optional[datetime] = None
@@ -0,0 +1,309 @@
+"""
+Серверная корзина EMC3 с инкрементальным пересчетом
+Каждая позиция хранит кеш расчета цены, поэтому при изменении позиции
+пересчитывается только она, а агрегаты корзины корректируются на разницу
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, insert, inspect, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only, selectinload
+
+from app.models.carts import Cart, CartLine
+from app.models.products import Product
+from app.models.users import User, UserType
+from app.services.pricing_engine import CompiledPricing
+
+logger = logging.getLogger(__name__)
+
+# Поля товара, изменение которых требует пересчета позиций корзины
+PRICING_FIELDS = ("price", "category_id", "manufacturer")
+
+# Колонки позиции, заполняемые при расчете (для пакетной вставки)
+LINE_FIELDS = (
+    "cart_id", "product_id", "quantity", "unit_price", "quantity_discount", "discount_percent",
+    "total_price", "category_id", "manufacturer", "rules_version", "is_stale"
+)
+
+
+def get_or_create_cart(db: Session, user: User) -> Cart:
+    """
+    Получить корзину пользователя, создав пустую при необходимости
+
+    Параллельные запросы могут одновременно не найти корзину: вторую вставку
+    отклоняет уникальный индекс carts.user_id, и тогда перечитывается корзина,
+    созданная первым. Вставка идет в savepoint, чтобы ошибка не откатывала
+    остальную транзакцию вызывающего кода.
+    """
+    cart = db.query(Cart).filter(Cart.user_id == user.id).first()
+    if cart is not None:
+        return cart
+
+    cart = Cart(user_id=user.id, subtotal=0.0, total_amount=0.0, total_discount=0.0)
+    try:
+        with db.begin_nested():
+            db.add(cart)
+    except IntegrityError:
+        return db.query(Cart).filter(Cart.user_id == user.id).one()
+    return cart
+
+
+def _add_to_totals(cart: Cart, line: CartLine, sign: int = 1):
+    cart.subtotal += sign * line.base_total
+    cart.total_amount += sign * line.total_price
+    cart.total_discount += sign * (line.base_total - line.total_price)
+
+
+def _copy_product(line: CartLine, product: Product):
+    line.unit_price = product.price
+    line.category_id = product.category_id
+    line.manufacturer = product.manufacturer
+    line.is_stale = False
+
+
+def _price_line(line: CartLine, rules: CompiledPricing, user_type: Optional[UserType], cart_total: float = 0.0):
+    """Пересчитать позицию по кешированной цене товара (без обращения к БД)"""
+    line.quantity_discount = rules.quantity_discount_for(
+        line.quantity, user_type, line.category_id, line.manufacturer
+    )
+    line.discount_percent = max(
+        line.quantity_discount,
+        rules.cart_discount_for(cart_total, user_type, line.category_id, line.manufacturer)
+    )
+    line.total_price = line.base_total * (1 - line.discount_percent / 100)
+    line.rules_version = rules.version
+
+
+def _apply_cart_rules(db: Session, cart: Cart, rules: CompiledPricing, user_type: Optional[UserType]):
+    """
+    Пересчитать скидки по сумме корзины
+
+    Порог по сумме зависит от всей корзины, поэтому при наличии таких правил
+    позиции пересчитываются целиком - по кешированным ценам, без чтения товаров.
+    """
+    if not rules.cart_ladders:
+        return
+
+    db.flush()
+    db.expire(cart, ["lines"])
+    cart.total_amount = 0.0
+    cart.total_discount = 0.0
+    for line in cart.lines:
+        _price_line(line, rules, user_type, cart.subtotal)
+        cart.total_amount += line.total_price
+        cart.total_discount += line.base_total - line.total_price
+
+
+def reconcile_stale_lines(db: Session, cart: Cart, rules: CompiledPricing, user_type: Optional[UserType]) -> int:
+    """
+    Пересчитать только устаревшие позиции
+
+    Позиция устарела, если у товара изменилась цена (флаг is_stale)
+    или она рассчитана по другой версии правил.
+    """
+    stale_lines = (
+        db.query(CartLine)
+        .options(selectinload(CartLine.product).load_only(
+            Product.id, Product.price, Product.category_id, Product.manufacturer
+        ))
+        .filter(
+            CartLine.cart_id == cart.id,
+            or_(
+                CartLine.is_stale == True,
+                CartLine.rules_version.is_(None),
+                CartLine.rules_version != rules.version
+            )
+        )
+        .all()
+    )
+
+    for line in stale_lines:
+        _add_to_totals(cart, line, -1)
+        _copy_product(line, line.product)
+        _price_line(line, rules, user_type)
+        _add_to_totals(cart, line, 1)
+
+    if stale_lines:
+        logger.info(f"Пересчитано {len(stale_lines)} устаревших позиций корзины {cart.id}")
+    return len(stale_lines)
+
+
+def recalculate_cart(db: Session, cart: Cart, rules: CompiledPricing, user_type: Optional[UserType]) -> List[CartLine]:
+    """
+    Полный пересчет агрегатов корзины по позициям
+
+    Используется при чтении всей корзины: позиции все равно загружаются для ответа,
+    а пересчет убирает накопленную погрешность инкрементальных обновлений.
+    """
+    lines = (
+        db.query(CartLine)
+        .options(selectinload(CartLine.product).load_only(
+            Product.id, Product.name, Product.sku, Product.price,
+            Product.manufacturer, Product.power_watts, Product.luminous_flux,
+            Product.color_temperature, Product.images, Product.category_id
+        ))
+        .filter(CartLine.cart_id == cart.id)
+        .order_by(CartLine.id)
+        .all()
+    )
+
+    cart.subtotal = 0.0
+    for line in lines:
+        if line.is_stale or line.rules_version != rules.version or line.unit_price != line.product.price:
+            _copy_product(line, line.product)
+            _price_line(line, rules, user_type)
+        cart.subtotal += line.base_total
+
+    cart.total_amount = 0.0
+    cart.total_discount = 0.0
+    for line in lines:
+        if rules.cart_ladders:
+            _price_line(line, rules, user_type, cart.subtotal)
+        cart.total_amount += line.total_price
+        cart.total_discount += line.base_total - line.total_price
+
+    return lines
+
+
+def set_line_quantity(
+    db: Session,
+    cart: Cart,
+    product_id: int,
+    quantity: int,
+    rules: CompiledPricing,
+    user_type: Optional[UserType],
+    increment: bool = False
+) -> Optional[CartLine]:
+    """
+    Установить (или увеличить) количество товара в корзине
+
+    Пересчитывается только затронутая позиция; товар читается из БД
+    лишь для новой позиции. Количество 0 удаляет позицию.
+
+    Raises:
+        LookupError: товар не найден
+    """
+    reconcile_stale_lines(db, cart, rules, user_type)
+
+    line = db.query(CartLine).filter(
+        CartLine.cart_id == cart.id,
+        CartLine.product_id == product_id
+    ).first()
+
+    if line is None:
+        if quantity <= 0:
+            return None
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if product is None:
+            raise LookupError(f"Товар с ID {product_id} не найден")
+        line = CartLine(cart_id=cart.id, product_id=product_id, quantity=quantity)
+        _copy_product(line, product)
+        _price_line(line, rules, user_type)
+        db.add(line)
+        _add_to_totals(cart, line, 1)
+    else:
+        new_quantity = line.quantity + quantity if increment else quantity
+        _add_to_totals(cart, line, -1)
+        if new_quantity <= 0:
+            db.delete(line)
+            line = None
+        else:
+            line.quantity = new_quantity
+            _price_line(line, rules, user_type)
+            _add_to_totals(cart, line, 1)
+
+    _apply_cart_rules(db, cart, rules, user_type)
+    return line
+
+
+def add_lines(
+    db: Session,
+    cart: Cart,
+    quantities: Dict[int, int],
+    rules: CompiledPricing,
+    user_type: Optional[UserType]
+) -> int:
+    """
+    Добавить в корзину сразу много товаров (быстрый заказ)
+
+    Существующие позиции и недостающие товары читаются двумя запросами
+    на весь список, новые позиции вставляются одним executemany.
+    Количество прибавляется к уже добавленному. Возвращает число затронутых позиций.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return 0
+
+    reconcile_stale_lines(db, cart, rules, user_type)
+
+    existing = {
+        line.product_id: line for line in db.query(CartLine).filter(
+            CartLine.cart_id == cart.id,
+            CartLine.product_id.in_(quantities)
+        )
+    }
+    missing = [product_id for product_id in quantities if product_id not in existing]
+    products = {
+        product.id: product for product in db.query(Product).options(load_only(
+            Product.id, Product.price, Product.category_id, Product.manufacturer
+        )).filter(Product.id.in_(missing))
+    } if missing else {}
+
+    changed = 0
+    new_lines = []
+    for product_id, quantity in quantities.items():
+        line = existing.get(product_id)
+        if line is not None:
+            _add_to_totals(cart, line, -1)
+            line.quantity += quantity
+        else:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            line = CartLine(cart_id=cart.id, product_id=product_id, quantity=quantity)
+            _copy_product(line, product)
+            new_lines.append(line)
+        _price_line(line, rules, user_type)
+        _add_to_totals(cart, line, 1)
+        changed += 1
+
+    if new_lines:
+        db.execute(insert(CartLine), [
+            {field: getattr(line, field) for field in LINE_FIELDS} for line in new_lines
+        ])
+        db.expire(cart, ["lines"])
+
+    _apply_cart_rules(db, cart, rules, user_type)
+    db.flush()
+    return changed
+
+
+def clear_cart(db: Session, cart: Cart):
+    """Удалить все позиции корзины"""
+    db.query(CartLine).filter(CartLine.cart_id == cart.id).delete(synchronize_session=False)
+    db.expire(cart, ["lines"])
+    cart.subtotal = 0.0
+    cart.total_amount = 0.0
+    cart.total_discount = 0.0
+
+
+@event.listens_for(Product, "after_update")
+def _mark_cart_lines_stale(mapper, connection, target):
+    """Изменение цены товара помечает его позиции в корзинах на пересчет"""
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in PRICING_FIELDS):
+        connection.execute(
+            update(CartLine.__table__)
+            .where(CartLine.__table__.c.product_id == target.id)
+            .values(is_stale=True)
+        )
+
+
+@event.listens_for(Product, "before_delete")
+def _delete_cart_lines(mapper, connection, target):
+    """Удаленный товар убирается из корзин; агрегаты пересчитаются при чтении корзины"""
+    connection.execute(
+        CartLine.__table__.delete().where(CartLine.__table__.c.product_id == target.id)
+    )
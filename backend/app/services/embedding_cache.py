@@ -0,0 +1,130 @@
+"""
+Постоянный кеш embedding'ов EMC3
+Ключ - (модель, sha256 текста), значение - вектор float32 в SQLite.
+Перед любым обращением к API embedding'ов проверяется кеш, поэтому
+переиндексация каталога после изменения цен почти не вызывает API
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Кеш embedding'ов в файле SQLite
+
+    Одно соединение на процесс (WAL) под блокировкой; векторы хранятся
+    компактно - 4 байта на компоненту (6 КБ для 1536 измерений).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self._connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Найти векторы по хешам текстов; отсутствующие в ответ не попадают"""
+        hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk]
+                )
+                for key, blob in rows:
+                    found[key] = unpack_vector(blob)
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = text_hash(text)
+        return self.get_many(model, [key]).get(key)
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, Sequence[float]]]):
+        """Сохранить пары (хеш текста, вектор)"""
+        rows = [(model, key, len(vector), pack_vector(vector)) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dimension, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._connection.commit()
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        self.put_many(model, [(text_hash(text), vector)])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        requests = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    """Кеш из настроек (None, если отключен или файл недоступен)"""
+    if not settings.embedding_cache_enabled:
+        return None
+    try:
+        return EmbeddingCache(settings.embedding_cache_path)
+    except Exception as e:
+        logger.error(f"Кеш embedding'ов недоступен ({settings.embedding_cache_path}): {e}")
+        return None
@@ -0,0 +1,227 @@
+"""
+Инкрементальная переиндексация товаров для векторного поиска
+События маппера пишут ID измененного товара в product_index_changes в той же
+транзакции, что и само изменение (в том числе из импорта CSV). Индексатор
+забирает журнал пачками, заново строит текст для embedding и отправляет в API
+и хранилище только товары, у которых этот текст действительно изменился
+(sha256 сравнивается с product_embedding_states). Свежесть индекса - интервал
+опроса журнала, стоимость пропорциональна числу изменений
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import SessionLocal, settings
+from app.models import Category, Product, ProductEmbeddingState, ProductIndexChange
+
+logger = logging.getLogger(__name__)
+
+# Поля товара, из которых строится текст для embedding (цена в текст не входит)
+INDEXED_FIELDS = ("name", "sku", "description", "category_id", "power_watts", "luminous_flux", "color_temperature")
+
+
+@dataclass
+class _IndexBatch:
+    change_ids: List[int]
+    to_index: List[Tuple[dict, str]] = field(default_factory=list)  # (данные товара, хеш текста)
+    removed: List[int] = field(default_factory=list)
+    unchanged: int = 0
+    oldest_change_at: Optional[datetime] = None
+
+
+def enqueue_all_products(db: Session) -> int:
+    """Поставить в журнал все товары (первичная индексация или сверка после записей в обход ORM)"""
+    result = db.execute(
+        insert(ProductIndexChange).from_select(["product_id"], select(Product.id))
+    )
+    db.commit()
+    return result.rowcount
+
+
+class EmbeddingIndexer:
+    """
+    Воркер журнала изменений товаров
+
+    Рассчитан на один экземпляр: пачка удаляется из журнала только после
+    записи векторов, при ошибке она остается в журнале и повторяется на
+    следующем опросе (embedding'и уже полученных текстов берутся из кеша).
+    """
+
+    def __init__(
+        self,
+        service=None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = settings.embedding_indexer_batch_size,
+        poll_interval: float = settings.embedding_indexer_poll_seconds,
+        update_related: bool = True,
+    ):
+        if service is None:
+            from app.services.vector_search import get_vector_search_service
+            service = get_vector_search_service()
+        self.service = service
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # Пересчитывать похожие товары для измененных (product_relations)
+        self.update_related = update_related
+        self._related = None
+
+        self.stats = {"changes": 0, "indexed": 0, "unchanged": 0, "deleted": 0, "errors": 0, "lag_seconds": 0.0}
+        self._running = False
+
+    def _load_batch(self) -> Optional[_IndexBatch]:
+        from app.services.embedding_cache import text_hash
+        from app.services.vector_search import product_embedding_data
+
+        db = self.session_factory()
+        try:
+            changes = (
+                db.query(ProductIndexChange.id, ProductIndexChange.product_id, ProductIndexChange.created_at)
+                .order_by(ProductIndexChange.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not changes:
+                return None
+
+            batch = _IndexBatch(change_ids=[change.id for change in changes])
+            batch.oldest_change_at = changes[0].created_at
+            product_ids = sorted({change.product_id for change in changes})
+
+            products = {
+                product.id: product
+                for product in db.query(Product).options(joinedload(Product.category)).filter(Product.id.in_(product_ids))
+            }
+            states = dict(
+                db.query(ProductEmbeddingState.product_id, ProductEmbeddingState.text_hash)
+                .filter(ProductEmbeddingState.product_id.in_(product_ids))
+            )
+
+            for product_id in product_ids:
+                product = products.get(product_id)
+                if product is None:
+                    batch.removed.append(product_id)
+                    continue
+                product_data = product_embedding_data(product)
+                key = text_hash(self.service._prepare_text_for_embedding(product_data))
+                if states.get(product_id) == key:
+                    batch.unchanged += 1
+                else:
+                    batch.to_index.append((product_data, key))
+            return batch
+        finally:
+            db.close()
+
+    def _complete(self, batch: _IndexBatch):
+        db = self.session_factory()
+        try:
+            for product_data, key in batch.to_index:
+                db.merge(ProductEmbeddingState(product_id=product_data['id'], text_hash=key))
+            if batch.removed:
+                db.query(ProductEmbeddingState).filter(
+                    ProductEmbeddingState.product_id.in_(batch.removed)
+                ).delete(synchronize_session=False)
+            db.query(ProductIndexChange).filter(
+                ProductIndexChange.id.in_(batch.change_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def run_once(self) -> int:
+        """Обработать одну пачку журнала; возвращает число обработанных записей"""
+        batch = await asyncio.to_thread(self._load_batch)
+        if batch is None:
+            return 0
+
+        if batch.to_index:
+            report = await self.service.index_products([product_data for product_data, _ in batch.to_index])
+            if report.failed or report.upserted < len(batch.to_index):
+                raise RuntimeError(
+                    f"записано {report.upserted} из {len(batch.to_index)} embedding'ов, ошибок {report.failed}"
+                )
+        for product_id in batch.removed:
+            if not await self.service.delete_product_embedding(product_id):
+                raise RuntimeError(f"не удалось удалить embedding товара {product_id}")
+
+        await asyncio.to_thread(self._complete, batch)
+
+        if self.update_related and (batch.to_index or batch.removed):
+            if self._related is None:
+                from app.services.related_products import RelatedProductsUpdater
+                self._related = RelatedProductsUpdater(self.service)
+
+            try:
+                await self._related.update([product_data['id'] for product_data, _ in batch.to_index] + batch.removed)
+            except Exception as e:
+                # Соседи досчитаются при следующем изменении или полном пересчете
+                logger.error(f"Ошибка пересчета похожих товаров: {e}")
+
+        self.stats["changes"] += len(batch.change_ids)
+        self.stats["indexed"] += len(batch.to_index)
+        self.stats["unchanged"] += batch.unchanged
+        self.stats["deleted"] += len(batch.removed)
+        if batch.oldest_change_at is not None:
+            oldest = batch.oldest_change_at
+            if oldest.tzinfo is None:
+                oldest = oldest.replace(tzinfo=timezone.utc)
+            self.stats["lag_seconds"] = round((datetime.now(timezone.utc) - oldest).total_seconds(), 2)
+        return len(batch.change_ids)
+
+    async def run(self):
+        """Основной цикл: разбирать журнал, пока он не пуст, затем ждать poll_interval"""
+        self._running = True
+        logger.info(f"Индексатор изменений товаров запущен (опрос каждые {self.poll_interval} с)")
+
+        while self._running:
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка инкрементальной индексации: {e}")
+                self.stats["errors"] += 1
+                processed = 0
+
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+        logger.info("Индексатор изменений товаров остановлен")
+
+    def stop(self):
+        self._running = False
+
+
+def _log_change(connection, product_id: int):
+    connection.execute(insert(ProductIndexChange.__table__).values(product_id=product_id))
+
+
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_delete")
+def _log_product_change(mapper, connection, target):
+    _log_change(connection, target.id)
+
+
+@event.listens_for(Product, "after_update")
+def _log_product_update(mapper, connection, target):
+    """Изменения цены и прочих полей вне текста для embedding журнал не пополняют"""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in INDEXED_FIELDS):
+        _log_change(connection, target.id)
+
+
+@event.listens_for(Category, "after_update")
+def _log_category_rename(mapper, connection, target):
+    """Название категории входит в текст всех ее товаров"""
+    if inspect(target).attrs.name.history.has_changes():
+        connection.execute(
+            insert(ProductIndexChange.__table__).from_select(
+                ["product_id"], select(Product.__table__.c.id).where(Product.__table__.c.category_id == target.id)
+            )
+        )
@@ -0,0 +1,249 @@
+"""
+Поставщики embedding'ов для векторного поиска
+- openai: text-embedding-ada-002 через API (1536 измерений);
+- local: модель на CPU без сети - хешированные основы слов и триграммы
+  (как в лексическом поиске) со взвешиванием TF-IDF, спроецированные в
+  dimension измерений. Проекция обучается на текстах каталога
+  (рандомизированный SVD, scripts/train_local_embeddings.py), без обучения -
+  случайная гауссова проекция. Большие пачки считаются в пуле процессов
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.database import settings
+from app.services.hybrid_search import _trigrams, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Размер хешированного пространства признаков
+N_FEATURES = 1 << 14
+
+# Вес триграммы относительно основы слова (триграммы сглаживают опечатки и словоформы)
+TRIGRAM_WEIGHT = 0.5
+
+# Пачки до этого размера считаются в потоке: передача в процесс дороже самого расчета
+INLINE_BATCH = 32
+
+# Сид случайной проекции необученной модели (одинаковый во всех процессах)
+RANDOM_PROJECTION_SEED = 20240601
+
+
+class EmbeddingProvider:
+    """Источник embedding'ов: model и dimension определяют совместимость векторов"""
+
+    name = "base"
+    model = "base"
+    dimension = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embedding'и текстов в том же порядке"""
+        raise NotImplementedError
+
+    def close(self):
+        """Освободить ресурсы (пул процессов)"""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI Embeddings API"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "text-embedding-ada-002", dimension: int = 1536):
+        import openai
+
+        if api_key:
+            openai.api_key = api_key
+        self._openai = openai
+        self.model = model
+        self.dimension = dimension
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self._openai.Embedding.acreate(model=self.model, input=texts)
+        data = sorted(response['data'], key=lambda item: item['index'])
+        return [item['embedding'] for item in data]
+
+
+def _bucket(feature: str) -> int:
+    # crc32, а не hash(): хеш строк в Python меняется между процессами
+    return zlib.crc32(feature.encode("utf-8")) % N_FEATURES
+
+
+def text_features(text: str) -> Dict[int, float]:
+    """Хешированные признаки текста: основы слов и триграммы слов с весами"""
+    counts: Dict[int, float] = {}
+    for token in tokenize(text):
+        bucket = _bucket("w:" + token)
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+        if token.isalpha():
+            # sorted: порядок множества зависит от хеша строк в процессе, а с ним - последние биты суммы
+            for trigram in sorted(_trigrams(token)):
+                bucket = _bucket("t:" + trigram)
+                counts[bucket] = counts.get(bucket, 0.0) + TRIGRAM_WEIGHT
+    return counts
+
+
+def _tfidf(text: str, idf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Разреженный нормированный TF-IDF вектор: (индексы, значения)"""
+    counts = text_features(text)
+    if not counts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = (1.0 + np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * idf[indices]
+    norm = float(np.linalg.norm(values))
+    return indices, values / (norm or 1.0)
+
+
+def encode(texts: Sequence[str], idf: np.ndarray, components: np.ndarray) -> np.ndarray:
+    """Embedding'и текстов (len(texts) x dimension), нормированные"""
+    result = np.zeros((len(texts), components.shape[1]), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices, values = _tfidf(text, idf)
+        if len(indices):
+            result[row] = values @ components[indices]
+    norms = np.linalg.norm(result, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return result / norms
+
+
+def fit_local_model(texts: Sequence[str], dimension: int, oversample: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Обучить модель на текстах каталога: (idf, проекция N_FEATURES x dimension)
+
+    Проекция - правые сингулярные векторы матрицы TF-IDF (LSA), считаются
+    рандомизированным SVD по разреженным строкам без построения плотной матрицы.
+    """
+    document_frequency = np.zeros(N_FEATURES, dtype=np.float64)
+    for text in texts:
+        document_frequency[list(text_features(text))] += 1
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1.0
+
+    rows = [_tfidf(text, idf) for text in texts]
+    rank = min(dimension + oversample, len(rows))
+    rng = np.random.default_rng(seed)
+    omega = rng.standard_normal((N_FEATURES, rank)).astype(np.float32)
+
+    # Y = X @ Omega, Q - ортонормированный базис столбцов Y
+    sketch = np.array([values @ omega[indices] if len(indices) else np.zeros(rank, dtype=np.float32)
+                       for indices, values in rows], dtype=np.float32)
+    basis, _ = np.linalg.qr(sketch)
+
+    # B = Q^T @ X (rank x N_FEATURES), затем SVD маленькой матрицы B
+    projected = np.zeros((basis.shape[1], N_FEATURES), dtype=np.float32)
+    for row, (indices, values) in enumerate(rows):
+        if len(indices):
+            projected[:, indices] += np.outer(basis[row], values)
+    _, _, right = np.linalg.svd(projected, full_matrices=False)
+
+    components = right[:dimension].T.astype(np.float32)
+    if components.shape[1] < dimension:
+        # Каталог меньше размерности: недостающие измерения нулевые
+        components = np.pad(components, ((0, 0), (0, dimension - components.shape[1])))
+    return idf, components
+
+
+def save_local_model(path: str, idf: np.ndarray, components: np.ndarray):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez(f, idf=idf, components=components)
+
+
+def random_projection(dimension: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Необученная модель: idf = 1 и случайная гауссова проекция"""
+    rng = np.random.default_rng(RANDOM_PROJECTION_SEED)
+    components = (rng.standard_normal((N_FEATURES, dimension)) / math.sqrt(dimension)).astype(np.float32)
+    return np.ones(N_FEATURES, dtype=np.float32), components
+
+
+_worker_model: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
+def _init_worker(idf: np.ndarray, components: np.ndarray):
+    global _worker_model
+    _worker_model = (idf, components)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return encode(texts, *_worker_model)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Локальная модель TF-IDF + проекция
+
+    Имя модели включает отпечаток весов: после переобучения кеш
+    embedding'ов не отдает векторы старой модели.
+    """
+
+    name = "local"
+
+    def __init__(self, path: Optional[str] = None, dimension: int = 256, workers: int = 2):
+        self.path = path
+        self.workers = workers
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                self.idf, self.components = data["idf"], data["components"]
+            logger.info(f"Локальная модель embedding'ов загружена из {path}")
+        else:
+            self.idf, self.components = random_projection(dimension)
+            if path:
+                logger.warning(f"Модель {path} не найдена, используется необученная случайная проекция")
+
+        self.dimension = int(self.components.shape[1])
+        fingerprint = hashlib.sha256(self.idf.tobytes() + self.components[:64].tobytes()).hexdigest()[:12]
+        self.model = f"local-tfidf-{self.dimension}-{fingerprint}"
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return encode(texts, self.idf, self.components)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: воркер сервера многопоточный, fork с захваченными блокировками небезопасен
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.idf, self.components)
+            )
+        return self._pool
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) <= INLINE_BATCH or self.workers <= 1:
+            return (await asyncio.to_thread(self.encode, texts)).tolist()
+
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        chunk = math.ceil(len(texts) / self.workers)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, _encode_in_worker, texts[start:start + chunk])
+            for start in range(0, len(texts), chunk)
+        ))
+        return np.concatenate(parts).tolist()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def create_embedding_provider(
+    backend: str = settings.embedding_provider, openai_api_key: Optional[str] = None
+) -> EmbeddingProvider:
+    """Поставщик embedding'ов по настройке EMBEDDING_PROVIDER"""
+    if backend == "local":
+        return LocalEmbeddingProvider(
+            settings.local_embedding_model_path,
+            dimension=settings.local_embedding_dimension,
+            workers=settings.local_embedding_workers
+        )
+    return OpenAIEmbeddingProvider(api_key=openai_api_key)
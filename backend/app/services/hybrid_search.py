@@ -0,0 +1,365 @@
+"""
+Гибридный поиск товаров EMC3
+Лексические кандидаты (BM25 по названию, артикулу, категории и описанию,
+с триграммным расширением слов с опечатками) объединяются с векторными
+методом reciprocal rank fusion. Структурные фильтры (мощность, цена,
+категория, степень защиты IP) применяются до поиска: по каталогу строится
+битовая маска, и кандидаты обоих видов выбираются только из нее
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from app.database import SessionLocal, settings
+from app.models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+_IP_RE = re.compile(r"\bip\s?-?(\d{2})\b", re.IGNORECASE)
+
+# Длина основы слова: "светильник", "светильники", "светильника" -> "светил"
+STEM_LENGTH = 6
+
+# Константа reciprocal rank fusion (вклад позиции r: 1 / (RRF_K + r))
+RRF_K = 60
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    tokens = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [token[:STEM_LENGTH] if token.isalpha() else token for token in tokens]
+
+
+def _trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_protection(value: Any) -> Optional[int]:
+    """Степень защиты как число: "IP65" -> 65"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    match = _IP_RE.search(str(value)) or re.fullmatch(r"\s*(\d{2})\s*", str(value))
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class SearchFilters:
+    """Структурные фильтры поиска (границы включительно)"""
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    min_power: Optional[float] = None
+    max_power: Optional[float] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_protection: Optional[int] = None  # IP65 и выше: 65
+
+    @classmethod
+    def from_dict(cls, filters: Optional[Dict[str, Any]]) -> "SearchFilters":
+        """Фильтры в формате VectorSearchService.search_products"""
+        filters = filters or {}
+        return cls(
+            category_id=filters.get("category_id"),
+            category=filters.get("category"),
+            min_power=filters.get("power_min", filters.get("min_power")),
+            max_power=filters.get("power_max", filters.get("max_power")),
+            min_price=filters.get("price_min", filters.get("min_price")),
+            max_price=filters.get("price_max", filters.get("max_price")),
+            min_protection=parse_protection(filters.get("protection_rating", filters.get("min_protection"))),
+        )
+
+    def is_empty(self) -> bool:
+        return all(value is None or value == "" for value in vars(self).values())
+
+
+class _CatalogSnapshot:
+    """Неизменяемый снимок каталога: колонки для фильтров и инвертированный индекс"""
+
+    def __init__(self, rows: Sequence[tuple], k1: float, b: float):
+        self.k1 = k1
+        self.b = b
+        count = len(rows)
+        self.ids = np.empty(count, dtype=np.int64)
+        self.price = np.full(count, np.nan)
+        self.power = np.full(count, np.nan)
+        self.flux = np.full(count, np.nan)
+        self.color_temperature = np.full(count, np.nan)
+        self.category_id = np.full(count, -1, dtype=np.int64)
+        self.protection = np.full(count, -1, dtype=np.int16)
+        self.category_names: Dict[str, List[int]] = {}
+
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_len = np.zeros(count, dtype=np.float32)
+
+        for position, (product_id, name, sku, description, manufacturer, price, power,
+                       category_id, category_name, flux, color_temperature) in enumerate(rows):
+            self.ids[position] = product_id
+            if price is not None:
+                self.price[position] = price
+            if power is not None:
+                self.power[position] = power
+            if flux is not None:
+                self.flux[position] = flux
+            if color_temperature is not None:
+                self.color_temperature[position] = color_temperature
+            if category_id is not None:
+                self.category_id[position] = category_id
+            if category_name:
+                self.category_names.setdefault(category_name.strip().lower(), []).append(category_id)
+            protection = parse_protection(f"{name} {description or ''}")
+            if protection is not None:
+                self.protection[position] = protection
+
+            # Название учитывается дважды: совпадение в нем важнее, чем в описании
+            tokens = tokenize(name) * 2 + tokenize(sku) + tokenize(category_name) \
+                + tokenize(manufacturer) + tokenize(description)
+            doc_len[position] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[position] = counts.get(position, 0) + 1
+
+        self.doc_len = doc_len
+        self.avg_len = float(doc_len.mean()) if count else 0.0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            token: (np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)),
+                    np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            for token, counts in postings.items()
+        }
+        self.trigrams: Dict[str, List[str]] = {}
+        for token in self.postings:
+            if token.isalpha():
+                for trigram in _trigrams(token):
+                    self.trigrams.setdefault(trigram, []).append(token)
+
+    def expand(self, token: str, cutoff: float = 0.5, limit: int = 3) -> List[Tuple[str, float]]:
+        """Слова словаря, похожие на token по триграммам (для опечаток)"""
+        if token in self.postings:
+            return [(token, 1.0)]
+        if not token.isalpha():
+            return []
+        grams = _trigrams(token)
+        shared: Dict[str, int] = {}
+        for trigram in grams:
+            for candidate in self.trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, common in shared.items():
+            similarity = common / (len(grams) + len(_trigrams(candidate)) - common)
+            if similarity >= cutoff:
+                scored.append((candidate, similarity))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def mask(self, filters: SearchFilters) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        if filters.category_id is not None:
+            mask &= self.category_id == filters.category_id
+        if filters.category:
+            category_ids = self.category_names.get(filters.category.strip().lower(), [])
+            mask &= np.isin(self.category_id, category_ids)
+        # Сравнение с NaN дает False: товары без значения не проходят фильтр
+        if filters.min_power is not None:
+            mask &= self.power >= filters.min_power
+        if filters.max_power is not None:
+            mask &= self.power <= filters.max_power
+        if filters.min_price is not None:
+            mask &= self.price >= filters.min_price
+        if filters.max_price is not None:
+            mask &= self.price <= filters.max_price
+        if filters.min_protection is not None:
+            mask &= self.protection >= filters.min_protection
+        return mask
+
+    def bm25(self, query: str, limit: int, mask: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        total = len(self.ids)
+        for token in dict.fromkeys(tokenize(query)):
+            for term, weight in self.expand(token):
+                docs, tf = self.postings[term]
+                idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / (self.avg_len or 1))
+                scores[docs] += weight * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if mask is not None:
+            scores[~mask] = 0
+        matched = np.nonzero(scores > 0)[0]
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(self.ids[i]), float(scores[i])) for i in matched]
+
+
+class CatalogIndex:
+    """
+    Каталог в памяти для лексического поиска и префильтрации
+
+    Перестраивается при изменении товаров (после commit в этом процессе
+    или по сигнатуре таблицы не чаще чем раз в refresh_interval секунд).
+    """
+
+    def __init__(self, refresh_interval: float = 60.0, k1: float = 1.2, b: float = 0.75):
+        self.refresh_interval = refresh_interval
+        self.k1 = k1
+        self.b = b
+        self._snapshot: Optional[_CatalogSnapshot] = None
+        self._signature = None
+        self._dirty = True
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def snapshot(self, db: Session) -> _CatalogSnapshot:
+        if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+            return self._snapshot
+
+        with self._lock:
+            if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+                return self._snapshot
+
+            force = self._dirty
+            self._dirty = False
+            signature = tuple(db.query(
+                func.count(Product.id), func.max(Product.id), func.max(Product.updated_at)
+            ).one())
+
+            if force or signature != self._signature or self._snapshot is None:
+                rows = db.query(
+                    Product.id, Product.name, Product.sku, Product.description, Product.manufacturer,
+                    Product.price, Product.power_watts, Product.category_id, Category.name,
+                    Product.luminous_flux, Product.color_temperature
+                ).outerjoin(Category, Product.category_id == Category.id).order_by(Product.id).all()
+                self._snapshot = _CatalogSnapshot(rows, self.k1, self.b)
+                self._signature = signature
+                logger.info(f"Индекс каталога для поиска загружен: {len(rows)} товаров")
+
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def allowed_ids(self, db: Session, filters: SearchFilters) -> Tuple[Optional[np.ndarray], float]:
+        """ID товаров, прошедших фильтры (None - без фильтров), и их доля в каталоге"""
+        if filters.is_empty():
+            return None, 1.0
+        snapshot = self.snapshot(db)
+        mask = snapshot.mask(filters)
+        return snapshot.ids[mask], float(mask.mean()) if len(mask) else 0.0
+
+    def lexical(
+        self, db: Session, query: str, limit: int, filters: Optional[SearchFilters] = None
+    ) -> List[Tuple[int, float]]:
+        """Лексические кандидаты: список (ID товара, оценка BM25)"""
+        snapshot = self.snapshot(db)
+        mask = snapshot.mask(filters) if filters and not filters.is_empty() else None
+        return snapshot.bm25(query, limit, mask)
+
+
+# Глобальный индекс каталога
+catalog_index = CatalogIndex(refresh_interval=settings.search_index_refresh_seconds)
+
+
+def allowed_product_ids(filters: Dict[str, Any]) -> Tuple[Optional[np.ndarray], float]:
+    """Префильтр по словарю фильтров в отдельной сессии (для сервиса векторного поиска)"""
+    db = SessionLocal()
+    try:
+        return catalog_index.allowed_ids(db, SearchFilters.from_dict(filters))
+    finally:
+        db.close()
+
+
+def reciprocal_rank_fusion(*rankings: Sequence[int], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Объединение ранжированных списков ID: сумма 1 / (k + позиция)"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, product_id in enumerate(ranking, start=1):
+            scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+async def hybrid_search(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    filters: Optional[SearchFilters] = None,
+    mode: str = "hybrid",
+    vector_service=None
+) -> List[Dict[str, Any]]:
+    """
+    Поиск товаров: mode - hybrid, lexical или vector
+
+    Возвращает список {product_id, score, lexical_rank, vector_similarity}
+    в порядке убывания score. Кандидатов каждого вида берется больше limit,
+    чтобы после объединения осталось limit результатов.
+    """
+    filters = filters or SearchFilters()
+    depth = max(limit * 3, 50)
+
+    lexical: List[Tuple[int, float]] = []
+    if mode in ("hybrid", "lexical"):
+        lexical = await run_in_threadpool(catalog_index.lexical, db, query, depth, filters)
+
+    vector: List[Dict[str, Any]] = []
+    if mode in ("hybrid", "vector") and vector_service is not None:
+        allowed_ids, selectivity = await run_in_threadpool(catalog_index.allowed_ids, db, filters)
+        try:
+            query_embedding = await vector_service.embed_query(query)
+            vector = await vector_service.search_candidates(
+                query_embedding, depth, settings.search_vector_threshold, allowed_ids, selectivity
+            )
+        except Exception as e:
+            # Лексический поиск работает и без API embedding'ов
+            if mode == "vector":
+                raise
+            logger.error(f"Векторные кандидаты недоступны, только лексический поиск: {e}")
+
+    lexical_rank = {product_id: rank for rank, (product_id, _) in enumerate(lexical, start=1)}
+    similarity = {item['product_id']: item['similarity'] for item in vector}
+    fused = reciprocal_rank_fusion(
+        [product_id for product_id, _ in lexical],
+        [item['product_id'] for item in vector]
+    )
+    return [
+        {
+            'product_id': product_id,
+            'score': score,
+            'lexical_rank': lexical_rank.get(product_id),
+            'vector_similarity': similarity.get(product_id),
+        }
+        for product_id, score in fused[:limit]
+    ]
+
+
+def _mark_catalog_index_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["catalog_index_dirty"] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Product, _event_name, _mark_catalog_index_dirty)
+    event.listen(Category, _event_name, _mark_catalog_index_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog_index_after_commit(session):
+    if session.info.pop("catalog_index_dirty", False):
+        catalog_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_index_dirty(session):
+    session.info.pop("catalog_index_dirty", None)
@@ -0,0 +1,192 @@
+"""
+Рассылка изменений статусов заказов (pub/sub) для SSE
+Внутри процесса события раздаются подписчикам через asyncio-очереди,
+между воркерами - через PostgreSQL LISTEN/NOTIFY
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+from app.database import engine, settings
+from app.models.orders import Order
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "order_status"
+
+# Идентификатор процесса: свои NOTIFY уже доставлены локально и пропускаются
+PROCESS_ID = uuid.uuid4().hex
+
+
+class OrderEventBroker:
+    """
+    In-process pub/sub: подписки по ID пользователя
+
+    Подписки меняются из event loop'ов, рассылка идет и из потоков
+    синхронных обработчиков, поэтому словарь подписчиков - под блокировкой.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._listener_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Подписаться на события пользователя (вызывается из event loop)"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if not subscribers:
+                return
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    @property
+    def subscribers_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, payload: Dict[str, Any]):
+        # Медленный клиент не должен блокировать рассылку: вытесняем самое старое событие
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+    def publish(self, payload: Dict[str, Any]):
+        """Разослать событие локальным подписчикам (потокобезопасно)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(payload["user_id"], ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, payload)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.unsubscribe(payload["user_id"], queue)
+
+    @staticmethod
+    def _connect_listener():
+        """Соединение с LISTEN на канал (блокирующее, выполняется в потоке)"""
+        import psycopg2
+
+        connection = psycopg2.connect(settings.database_url)
+        try:
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    async def _listen(self):
+        """Прием NOTIFY от других воркеров с переподключением"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            connection = None
+            try:
+                # Подключение не блокирует event loop (в том числе при недоступной БД)
+                connection = await asyncio.to_thread(self._connect_listener)
+
+                ready = asyncio.Event()
+                loop.add_reader(connection.fileno(), ready.set)
+                logger.info(f"Подписка на канал {NOTIFY_CHANNEL} активна")
+
+                try:
+                    while True:
+                        await ready.wait()
+                        ready.clear()
+                        connection.poll()
+                        while connection.notifies:
+                            notify = connection.notifies.pop(0)
+                            self._dispatch_notify(notify.payload)
+                finally:
+                    loop.remove_reader(connection.fileno())
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на {NOTIFY_CHANNEL}, переподключение: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _dispatch_notify(self, raw_payload: str):
+        try:
+            payload = json.loads(raw_payload)
+        except ValueError:
+            logger.warning(f"Некорректное событие {NOTIFY_CHANNEL}: {raw_payload}")
+            return
+
+        if payload.pop("origin", None) == PROCESS_ID:
+            return
+        self.publish(payload)
+
+    def start(self):
+        """Запустить прием событий других воркеров (только для PostgreSQL)"""
+        if engine.dialect.name != "postgresql" or self._listener_task is not None:
+            return
+        self._listener_task = asyncio.get_running_loop().create_task(self._listen())
+
+    def stop(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            self._listener_task = None
+
+
+# Глобальный брокер событий
+order_events = OrderEventBroker()
+
+
+@event.listens_for(Order, "after_update")
+def _capture_status_change(mapper, connection, target):
+    """Изменение статуса заказа: NOTIFY в той же транзакции и локальная рассылка после commit"""
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+
+    previous = history.deleted[0] if history.deleted else None
+    payload = {
+        "order_id": target.id,
+        "user_id": target.user_id,
+        "status": target.status.value if target.status else None,
+        "previous_status": previous.value if previous else None,
+    }
+
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("order_events", []).append(payload)
+
+    if connection.dialect.name == "postgresql":
+        # NOTIFY транзакционный: другие воркеры получат событие только после commit
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": json.dumps({**payload, "origin": PROCESS_ID})}
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    for payload in session.info.pop("order_events", []):
+        order_events.publish(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("order_events", None)
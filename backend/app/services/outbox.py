@@ -0,0 +1,252 @@
+"""
+Transactional outbox для интеграций EMC3
+События пишутся в outbox_events в одной транзакции с заказом, а фоновый воркер
+доставляет их во внешние системы (Битрикс24) с ограничением параллелизма,
+повторами с экспоненциальной задержкой и переводом в dead letter
+"""
+
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, settings
+from app.models.outbox import OutboxEvent, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+# Типы событий
+ORDER_CREATED = "order.created"
+
+# Обработчик получает payload и словарь прогресса; выполненные шаги записываются
+# в прогресс, чтобы при повторе не создавать дубликаты во внешней системе
+Handler = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+
+def enqueue_event(
+    db: Session,
+    event_type: str,
+    payload: Dict[str, Any],
+    aggregate_id: Optional[int] = None
+) -> OutboxEvent:
+    """Добавить событие в outbox (commit выполняет вызывающий код)"""
+    event = OutboxEvent(
+        event_type=event_type,
+        aggregate_id=aggregate_id,
+        payload=payload,
+        status=OutboxStatus.pending,
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc)
+    )
+    db.add(event)
+    return event
+
+
+def build_order_payload(order, user, order_products: List[Tuple[Any, Any]], order_items_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Снимок заказа в формате, который ожидает Bitrix24Integration"""
+    items = []
+    for (item, product), item_data in zip(order_products, order_items_data):
+        base_total = item_data["unit_price"] * item_data["quantity"]
+        items.append({
+            "product_id": product.id,
+            "product_name": product.name,
+            "article": product.sku,
+            "quantity": item_data["quantity"],
+            "unit_price": item_data["unit_price"],
+            "discount_percent": item_data["discount_percent"],
+            "total_price": base_total * (1 - item_data["discount_percent"] / 100),
+            "power": product.power_watts,
+            "luminous_flux": product.luminous_flux,
+            "color_temperature": product.color_temperature,
+        })
+
+    address_parts = [order.delivery_postal_code, order.delivery_city, order.delivery_address]
+
+    return {
+        "id": order.id,
+        "user_id": user.id,
+        "company_name": user.company_name or "",
+        "contact_person": " ".join(filter(None, [user.first_name, user.last_name])),
+        "phone": order.contact_phone or user.phone or "",
+        "email": order.contact_email or user.email,
+        "address": ", ".join(filter(None, address_parts)),
+        "comment": order.notes,
+        "total_amount": order.total_amount,
+        "created_at": datetime.now().strftime("%d.%m.%Y %H:%M"),
+        "items": items,
+    }
+
+
+class OutboxWorker:
+    """
+    Асинхронный воркер доставки событий outbox
+
+    Захват событий выполняется через SELECT ... FOR UPDATE SKIP LOCKED с арендой
+    (locked_until), поэтому несколько воркеров не обрабатывают одно событие дважды,
+    а события упавшего воркера возвращаются в работу после истечения аренды.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, Handler],
+        session_factory: Callable[[], Session] = SessionLocal,
+        concurrency: int = settings.outbox_concurrency,
+        batch_size: int = settings.outbox_batch_size,
+        poll_interval: float = settings.outbox_poll_interval,
+        max_attempts: int = settings.outbox_max_attempts,
+        backoff_base: float = settings.outbox_backoff_base,
+        backoff_max: float = settings.outbox_backoff_max,
+        lease_seconds: int = settings.outbox_lease_seconds,
+    ):
+        self.handlers = handlers
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+
+        self.stats = {"delivered": 0, "retried": 0, "dead": 0}
+        self._running = False
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Экспоненциальная задержка с джиттером"""
+        delay = min(self.backoff_base * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _claim_batch(self) -> List[Tuple[int, str, Dict[str, Any], Dict[str, Any], int]]:
+        db = self.session_factory()
+        try:
+            now = datetime.now(timezone.utc)
+            events = (
+                db.query(OutboxEvent)
+                .filter(or_(
+                    and_(OutboxEvent.status == OutboxStatus.pending, OutboxEvent.next_attempt_at <= now),
+                    and_(OutboxEvent.status == OutboxStatus.processing, OutboxEvent.locked_until < now)
+                ))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+
+            claimed = []
+            for event in events:
+                event.status = OutboxStatus.processing
+                event.locked_until = now + timedelta(seconds=self.lease_seconds)
+                event.attempts += 1
+                claimed.append((event.id, event.event_type, event.payload, dict(event.result or {}), event.attempts))
+
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _complete(self, event_id: int, progress: Dict[str, Any]):
+        db = self.session_factory()
+        try:
+            event = db.query(OutboxEvent).filter(OutboxEvent.id == event_id).first()
+            if event is None:
+                return
+            event.status = OutboxStatus.done
+            event.result = progress
+            event.locked_until = None
+            event.last_error = None
+            event.processed_at = datetime.now(timezone.utc)
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, event_id: int, attempts: int, error: str, progress: Dict[str, Any], permanent: bool = False) -> bool:
+        """Записать ошибку; возвращает True, если событие ушло в dead letter"""
+        db = self.session_factory()
+        try:
+            event = db.query(OutboxEvent).filter(OutboxEvent.id == event_id).first()
+            if event is None:
+                return False
+            event.result = progress
+            event.last_error = error
+            event.locked_until = None
+
+            dead = permanent or attempts >= self.max_attempts
+            if dead:
+                event.status = OutboxStatus.dead
+                event.processed_at = datetime.now(timezone.utc)
+            else:
+                event.status = OutboxStatus.pending
+                event.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=self.backoff_delay(attempts))
+            db.commit()
+            return dead
+        finally:
+            db.close()
+
+    async def _process(self, event_id: int, event_type: str, payload: Dict[str, Any], progress: Dict[str, Any], attempts: int):
+        async with self._semaphore:
+            handler = self.handlers.get(event_type)
+            if handler is None:
+                logger.error(f"Нет обработчика для события outbox {event_type} (#{event_id})")
+                await asyncio.to_thread(self._fail, event_id, attempts, f"Неизвестный тип события: {event_type}", progress, True)
+                self.stats["dead"] += 1
+                return
+
+            try:
+                await handler(payload, progress)
+            except Exception as e:
+                dead = await asyncio.to_thread(self._fail, event_id, attempts, str(e), progress)
+                if dead:
+                    self.stats["dead"] += 1
+                    logger.error(f"Событие outbox #{event_id} ({event_type}) переведено в dead letter после {attempts} попыток: {e}")
+                else:
+                    self.stats["retried"] += 1
+                    logger.warning(f"Ошибка обработки события outbox #{event_id} ({event_type}), попытка {attempts}: {e}")
+                return
+
+            await asyncio.to_thread(self._complete, event_id, progress)
+            self.stats["delivered"] += 1
+
+    async def run_once(self) -> int:
+        """Обработать одну пачку событий; возвращает количество захваченных событий"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        events = await asyncio.to_thread(self._claim_batch)
+        if events:
+            await asyncio.gather(*(self._process(*event) for event in events))
+        return len(events)
+
+    async def run(self):
+        """Основной цикл воркера"""
+        self._running = True
+        logger.info(f"Outbox воркер запущен (параллелизм {self.concurrency})")
+
+        while self._running:
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка цикла outbox воркера: {e}")
+                processed = 0
+
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+        logger.info("Outbox воркер остановлен")
+
+    def stop(self):
+        self._running = False
+
+
+def create_bitrix24_outbox_worker(bitrix=None, **kwargs) -> OutboxWorker:
+    """Воркер, доставляющий события заказов в Битрикс24"""
+    if bitrix is None:
+        from app.integrations.bitrix24 import bitrix24 as bitrix
+
+    return OutboxWorker(handlers={ORDER_CREATED: bitrix.sync_order}, **kwargs)
@@ -0,0 +1,289 @@
+"""
+Движок B2B ценообразования для EMC3
+Правила из таблицы pricing_rules компилируются в память: для каждой области
+(тип клиента, категория, производитель) хранится отсортированная лестница порогов,
+поэтому скидка на позицию находится бинарным поиском без обращений к БД
+"""
+
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+
+from app.database import settings
+from app.models.categories import Category
+from app.models.pricing import PricingRule, PricingThreshold
+from app.models.users import UserType
+
+logger = logging.getLogger(__name__)
+
+# Ключ области действия правила: (тип клиента, ID категории, производитель)
+ScopeKey = Tuple[Optional[UserType], Optional[int], Optional[str]]
+# Лестница: отсортированные пороги и соответствующие им скидки
+Ladder = Tuple[List[float], List[float]]
+
+
+def _normalize_manufacturer(manufacturer: Optional[str]) -> Optional[str]:
+    if not manufacturer:
+        return None
+    return manufacturer.strip().lower() or None
+
+
+class CompiledPricing:
+    """Неизменяемый снимок правил ценообразования"""
+
+    def __init__(
+        self,
+        quantity_ladders: Dict[ScopeKey, Ladder],
+        cart_ladders: Dict[ScopeKey, Ladder],
+        category_parents: Dict[int, Optional[int]],
+        rules_count: int = 0,
+        version: str = "default",
+    ):
+        self.quantity_ladders = quantity_ladders
+        self.cart_ladders = cart_ladders
+        self.rules_count = rules_count
+        # Версия снимка одинакова во всех воркерах, загрузивших одну и ту же таблицу правил
+        self.version = version
+        self._category_chains = self._build_category_chains(category_parents)
+
+    @staticmethod
+    def _build_category_chains(category_parents: Dict[int, Optional[int]]) -> Dict[int, Tuple[int, ...]]:
+        """Предрасчет цепочек категория -> родитель -> ... для фоллбэков"""
+        chains = {}
+        for category_id in category_parents:
+            chain = []
+            current = category_id
+            while current is not None and current not in chain:
+                chain.append(current)
+                current = category_parents.get(current)
+            chains[category_id] = tuple(chain)
+        return chains
+
+    def _scope_keys(
+        self,
+        user_type: Optional[UserType],
+        category_id: Optional[int],
+        manufacturer: Optional[str],
+    ) -> List[ScopeKey]:
+        """Области поиска от самой конкретной к самой общей"""
+        categories = list(self._category_chains.get(category_id, (category_id,) if category_id else ()))
+        categories.append(None)
+        manufacturers = [manufacturer, None] if manufacturer else [None]
+        user_types = [user_type, None] if user_type else [None]
+
+        return [
+            (ut, cat, mfr)
+            for ut in user_types
+            for cat in categories
+            for mfr in manufacturers
+        ]
+
+    @staticmethod
+    def _lookup(ladders: Dict[ScopeKey, Ladder], keys: List[ScopeKey], value: float) -> Optional[float]:
+        for key in keys:
+            ladder = ladders.get(key)
+            if not ladder:
+                continue
+            thresholds, discounts = ladder
+            index = bisect.bisect_right(thresholds, value) - 1
+            if index >= 0:
+                return discounts[index]
+        return None
+
+    def quantity_discount_for(
+        self,
+        quantity: int,
+        user_type: Optional[UserType] = None,
+        category_id: Optional[int] = None,
+        manufacturer: Optional[str] = None,
+    ) -> float:
+        """Скидка (%) по порогам количества в позиции"""
+        keys = self._scope_keys(user_type, category_id, _normalize_manufacturer(manufacturer))
+        return self._lookup(self.quantity_ladders, keys, quantity) or 0.0
+
+    def cart_discount_for(
+        self,
+        cart_total: float,
+        user_type: Optional[UserType] = None,
+        category_id: Optional[int] = None,
+        manufacturer: Optional[str] = None,
+    ) -> float:
+        """Скидка (%) по порогам суммы корзины"""
+        if not cart_total or not self.cart_ladders:
+            return 0.0
+        keys = self._scope_keys(user_type, category_id, _normalize_manufacturer(manufacturer))
+        return self._lookup(self.cart_ladders, keys, cart_total) or 0.0
+
+    def discount_for(
+        self,
+        quantity: int,
+        user_type: Optional[UserType] = None,
+        category_id: Optional[int] = None,
+        manufacturer: Optional[str] = None,
+        cart_total: float = 0.0,
+    ) -> float:
+        """
+        Скидка (%) для позиции
+
+        Берется первый сработавший порог в порядке от конкретной области к общей.
+        Скидки по количеству и по сумме корзины не суммируются - применяется большая.
+        """
+        return max(
+            self.quantity_discount_for(quantity, user_type, category_id, manufacturer),
+            self.cart_discount_for(cart_total, user_type, category_id, manufacturer),
+        )
+
+
+def _build_ladders(entries: Dict[ScopeKey, Dict[float, float]]) -> Dict[ScopeKey, Ladder]:
+    ladders = {}
+    for key, tiers in entries.items():
+        thresholds = sorted(tiers)
+        ladders[key] = (thresholds, [tiers[t] for t in thresholds])
+    return ladders
+
+
+def _default_quantity_tiers() -> Dict[float, float]:
+    """Базовая лестница из настроек (5+, 10+, 50+ шт)"""
+    return {
+        5: float(settings.wholesale_discount_5),
+        10: float(settings.wholesale_discount_10),
+        50: float(settings.wholesale_discount_50),
+    }
+
+
+def compile_pricing(
+    rules: List[PricingRule],
+    category_parents: Optional[Dict[int, Optional[int]]] = None,
+    version: str = "default",
+) -> CompiledPricing:
+    """Скомпилировать правила в структуру для быстрого поиска"""
+    quantity_entries: Dict[ScopeKey, Dict[float, float]] = {}
+    cart_entries: Dict[ScopeKey, Dict[float, float]] = {}
+
+    for rule in rules:
+        if not rule.is_active:
+            continue
+        key = (rule.user_type, rule.category_id, _normalize_manufacturer(rule.manufacturer))
+        target = cart_entries if rule.threshold_type == PricingThreshold.cart_total else quantity_entries
+        tiers = target.setdefault(key, {})
+        threshold = float(rule.threshold or 0)
+        # При совпадении порогов побеждает большая скидка
+        tiers[threshold] = max(tiers.get(threshold, 0.0), float(rule.discount_percent))
+
+    # Если общая лестница в БД не задана, используем значения из настроек
+    quantity_entries.setdefault((None, None, None), _default_quantity_tiers())
+
+    return CompiledPricing(
+        quantity_ladders=_build_ladders(quantity_entries),
+        cart_ladders=_build_ladders(cart_entries),
+        category_parents=category_parents or {},
+        rules_count=len(rules),
+        version=version,
+    )
+
+
+# Сигнатура дерева категорий по существующим колонкам: количество, max(id) и
+# контрольная сумма пар (id, parent_id) - перенос категории меняет сумму
+# на (новый родитель - старый) * вес строки, вес от id не бывает нулевым
+CATEGORY_TREE_SIGNATURE = (
+    select(func.count(Category.id)).scalar_subquery(),
+    select(func.max(Category.id)).scalar_subquery(),
+    select(
+        func.coalesce(func.sum(func.coalesce(Category.parent_id, 0) * (Category.id % 1009 + 1)), 0)
+    ).scalar_subquery(),
+)
+
+
+class PricingEngine:
+    """
+    Держит скомпилированные правила и перезагружает их при изменении
+
+    Изменения в текущем процессе инвалидируют снимок сразу после commit,
+    изменения из других воркеров замечаются по сигнатуре правил (количество
+    строк и max(updated_at)) и дерева категорий (CATEGORY_TREE_SIGNATURE),
+    которая проверяется не чаще чем раз в refresh_interval секунд.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self._compiled = compile_pricing([])
+        self._signature = None
+        self._dirty = True
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> CompiledPricing:
+        """Текущий снимок без обращения к БД"""
+        return self._compiled
+
+    def invalidate(self):
+        self._dirty = True
+
+    def get_rules(self, db: Session) -> CompiledPricing:
+        """Снимок правил; при необходимости перезагружается из БД"""
+        if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+            return self._compiled
+
+        with self._lock:
+            if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+                return self._compiled
+
+            try:
+                force = self._dirty
+                self._dirty = False
+                # Правила наследуются по дереву категорий, поэтому перенос
+                # категории в другом воркере тоже должен перезагрузить снимок
+                signature = tuple(db.query(
+                    select(func.count(PricingRule.id)).scalar_subquery(),
+                    select(func.max(PricingRule.updated_at)).scalar_subquery(),
+                    *CATEGORY_TREE_SIGNATURE
+                ).one())
+
+                if force or signature != self._signature:
+                    self._reload(db, version=str(signature))
+                    self._signature = signature
+            except Exception as e:
+                logger.error(f"Ошибка загрузки правил ценообразования: {e}")
+                self._dirty = True
+            finally:
+                self._checked_at = time.monotonic()
+
+        return self._compiled
+
+    def _reload(self, db: Session, version: str):
+        rules = db.query(PricingRule).filter(PricingRule.is_active == True).all()
+        category_parents = dict(db.query(Category.id, Category.parent_id).all())
+        self._compiled = compile_pricing(rules, category_parents, version)
+        logger.info(f"Загружено {len(rules)} правил ценообразования")
+
+
+# Глобальный экземпляр движка
+pricing_engine = PricingEngine(refresh_interval=settings.pricing_rules_refresh_seconds)
+
+
+def _mark_pricing_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["pricing_dirty"] = True
+
+
+for _model in (PricingRule, Category):
+    for _event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event_name, _mark_pricing_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_pricing_after_commit(session):
+    if session.info.pop("pricing_dirty", False):
+        pricing_engine.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pricing_dirty(session):
+    session.info.pop("pricing_dirty", None)
@@ -0,0 +1,100 @@
+"""
+Кеш embedding'ов поисковых запросов EMC3
+Запросы нормализуются (регистр, ё, пробелы, пунктуация по краям), поэтому
+"Прожектор " и "прожектор" дают одну запись. Одновременные одинаковые
+запросы, которых еще нет в кеше, ждут один общий вызов API (single-flight)
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from app.database import settings
+from app.utils.principal_cache import BoundedTTLCache
+
+_SPACES_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,;:!?\"'«»()[]"
+
+
+def normalize_query(query: str) -> str:
+    query = query.lower().replace("ё", "е")
+    return _SPACES_RE.sub(" ", query).strip(_EDGE_PUNCTUATION)
+
+
+class QueryEmbeddingCache:
+    """
+    LRU-кеш с TTL для embedding'ов запросов
+
+    Метрики: попадания, промахи, запросы, дождавшиеся чужого вызова API,
+    и сэкономленное время (средняя длительность вызова API на каждый
+    избежанный вызов).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = BoundedTTLCache(maxsize, ttl)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.coalesced = 0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+
+    async def get_or_create(
+        self, model: str, query: str, create: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Embedding запроса из кеша или через create(нормализованный запрос)"""
+        text = normalize_query(query)
+        key = (model, text)
+
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            return embedding
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        started = time.perf_counter()
+        try:
+            embedding = await create(text)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; если их нет - не пишем "never retrieved"
+            future.exception()
+            raise
+        except BaseException:
+            # Запрос-инициатор отменен: ожидающие тоже получают отмену
+            future.cancel()
+            raise
+        else:
+            self.api_calls += 1
+            self.api_seconds += time.perf_counter() - started
+            self._cache.put(key, embedding)
+            future.set_result(embedding)
+            return embedding
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses = self._cache.hits, self._cache.misses
+        requests = hits + misses
+        average = self.api_seconds / self.api_calls if self.api_calls else 0.0
+        return {
+            "entries": len(self._cache),
+            "hits": hits,
+            "misses": misses,
+            "coalesced": self.coalesced,
+            "api_calls": self.api_calls,
+            "hit_rate": round((hits + self.coalesced) / requests, 4) if requests else 0.0,
+            "avg_api_latency_ms": round(average * 1000, 1),
+            "saved_seconds": round((hits + self.coalesced) * average, 2),
+        }
+
+
+def create_query_embedding_cache() -> QueryEmbeddingCache:
+    return QueryEmbeddingCache(
+        maxsize=settings.query_embedding_cache_size,
+        ttl=settings.query_embedding_cache_ttl_seconds
+    )
@@ -0,0 +1,287 @@
+"""
+Быстрый заказ по списку артикулов EMC3
+Вставленный текст или таблица (CSV/XLSX) разбирается в строки "артикул - количество",
+все артикулы ищутся одним IN-запросом по индексу sku, а промахи - по нормализованному
+и нечеткому совпадению в кешированном индексе артикулов
+"""
+
+import csv
+import difflib
+import io
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from app.database import settings
+from app.models.products import Product
+
+logger = logging.getLogger(__name__)
+
+# Кириллические буквы, похожие на латинские: артикулы часто копируют из русских документов
+_LOOKALIKES = str.maketrans("АВЕКМНОРСТУХ", "ABEKMHOPCTYX")
+
+# "EMC-HW-80 x 50", "EMC-HW-80; 50", "EMC-HW-80 50 шт", "EMC-HW-80"
+_LINE_RE = re.compile(
+    r"^\s*(?P<sku>.+?)(?:\s+[xх×*]\s*|\s*[;,\t|:]\s*|\s+)(?P<quantity>\d+)\s*(?:шт\.?|pcs\.?)?\s*$",
+    re.IGNORECASE
+)
+
+SKU_HEADERS = {"sku", "артикул", "article", "код", "code"}
+QUANTITY_HEADERS = {"quantity", "qty", "количество", "кол-во", "кол", "шт"}
+
+
+class QuickOrderError(ValueError):
+    """Некорректный файл или список"""
+
+
+@dataclass
+class QuickOrderLine:
+    line: int
+    raw: str
+    sku: str
+    quantity: int
+    product_id: Optional[int] = None
+    matched_sku: Optional[str] = None
+    match: Optional[str] = None  # exact, normalized, fuzzy
+    suggestions: List[str] = field(default_factory=list)
+    error: Optional[str] = None  # Строка не принята (например, количество <= 0)
+
+
+def _make_line(number: int, raw: str, sku: str, quantity: int) -> QuickOrderLine:
+    line = QuickOrderLine(line=number, raw=raw, sku=sku, quantity=quantity)
+    if quantity <= 0:
+        line.error = "Количество должно быть больше нуля"
+    return line
+
+
+def normalize_sku(sku: str) -> str:
+    """Ключ сравнения: верхний регистр, латиница вместо кириллицы, без разделителей"""
+    return re.sub(r"[^0-9A-ZА-ЯЁ]", "", sku.upper().translate(_LOOKALIKES))
+
+
+def parse_text(text: str) -> List[QuickOrderLine]:
+    """Разбор вставленного списка: одна позиция на строку, без количества - 1 шт"""
+    lines = []
+    for number, raw in enumerate(text.splitlines(), start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+
+        match = _LINE_RE.match(raw)
+        if match:
+            sku, quantity = match.group("sku").strip(), int(match.group("quantity"))
+        else:
+            sku, quantity = raw, 1
+        lines.append(_make_line(number, raw, sku, quantity))
+    return lines
+
+
+def _parse_quantity(value) -> Optional[int]:
+    if value is None:
+        return None
+    match = re.search(r"-?\d+", str(value).replace(" ", ""))
+    return int(match.group()) if match else None
+
+
+def _parse_rows(rows: List[List]) -> List[QuickOrderLine]:
+    """Строки таблицы: колонки ищутся по заголовку, иначе первая - артикул, вторая - количество"""
+    rows = [row for row in rows if any(str(cell).strip() for cell in row if cell is not None)]
+    if not rows:
+        return []
+
+    sku_column, quantity_column, start = 0, 1, 0
+    header = [str(cell).strip().lower() if cell is not None else "" for cell in rows[0]]
+    if any(name in SKU_HEADERS for name in header):
+        sku_column = next(i for i, name in enumerate(header) if name in SKU_HEADERS)
+        quantity_column = next((i for i, name in enumerate(header) if name in QUANTITY_HEADERS), None)
+        start = 1
+
+    lines = []
+    for number, row in enumerate(rows[start:], start=start + 1):
+        sku = row[sku_column] if sku_column < len(row) else None
+        if sku is None or not str(sku).strip() or str(sku).strip().lower() == "nan":
+            continue
+        sku = str(sku).strip()
+
+        quantity = None
+        if quantity_column is not None and quantity_column < len(row):
+            quantity = _parse_quantity(row[quantity_column])
+        raw = ";".join("" if cell is None else str(cell) for cell in row)
+        # Пустая ячейка - 1 шт, а явный 0 или отрицательное число - ошибка строки
+        lines.append(_make_line(number, raw, sku, 1 if quantity is None else quantity))
+    return lines
+
+
+def parse_file(filename: str, content: bytes) -> List[QuickOrderLine]:
+    """Разбор загруженного CSV или XLSX"""
+    name = (filename or "").lower()
+
+    if name.endswith((".xlsx", ".xls")):
+        import pandas as pd
+
+        try:
+            frame = pd.read_excel(io.BytesIO(content), header=None, dtype=str)
+        except ImportError:
+            raise QuickOrderError("Чтение Excel не поддерживается на сервере, загрузите CSV")
+        except Exception as e:
+            raise QuickOrderError(f"Не удалось прочитать файл Excel: {e}")
+        rows = frame.where(frame.notna(), None).values.tolist()
+        return _parse_rows(rows)
+
+    if name.endswith((".csv", ".txt")) or not name:
+        for encoding in ("utf-8-sig", "cp1251"):
+            try:
+                text = content.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise QuickOrderError("Не удалось определить кодировку файла")
+
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=";,\t")
+        except csv.Error:
+            # Одна колонка или вставленный текст - разбираем построчно
+            return parse_text(text)
+        return _parse_rows(list(csv.reader(io.StringIO(text), dialect)))
+
+    raise QuickOrderError("Поддерживаются файлы CSV и XLSX")
+
+
+class SkuIndex:
+    """
+    Кеш нормализованных артикулов для поиска промахов
+
+    Загружается только при первом промахе точного поиска и перечитывается
+    при изменении товаров (после commit в этом процессе или по сигнатуре
+    таблицы не чаще чем раз в refresh_interval секунд).
+    """
+
+    def __init__(self, refresh_interval: float = 60.0):
+        self.refresh_interval = refresh_interval
+        self._by_key: Dict[str, Tuple[int, str]] = {}
+        self._buckets: Dict[str, List[str]] = {}
+        self._signature = None
+        self._dirty = True
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _ensure(self, db: Session):
+        if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+
+        with self._lock:
+            if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+
+            force = self._dirty
+            self._dirty = False
+            signature = tuple(db.query(
+                func.count(Product.id), func.max(Product.id), func.max(Product.updated_at)
+            ).one())
+
+            if force or signature != self._signature:
+                by_key: Dict[str, Tuple[int, str]] = {}
+                buckets: Dict[str, List[str]] = {}
+                for product_id, sku in db.query(Product.id, Product.sku):
+                    key = normalize_sku(sku)
+                    if key and key not in by_key:
+                        by_key[key] = (product_id, sku)
+                        buckets.setdefault(key[:2], []).append(key)
+                self._by_key, self._buckets = by_key, buckets
+                self._signature = signature
+                logger.info(f"Индекс артикулов загружен: {len(by_key)} товаров")
+
+            self._checked_at = time.monotonic()
+
+    def get(self, sku: str) -> Optional[Tuple[int, str]]:
+        return self._by_key.get(normalize_sku(sku))
+
+    def find(self, db: Session, sku: str, cutoff: float) -> Tuple[Optional[Tuple[int, str]], str, List[str]]:
+        """Найти товар: (product_id, sku) или None, тип совпадения и варианты"""
+        self._ensure(db)
+        key = normalize_sku(sku)
+        if not key:
+            return None, "", []
+
+        found = self._by_key.get(key)
+        if found:
+            return found, "normalized", []
+
+        # Нечеткий поиск сначала среди артикулов с тем же началом
+        candidates = self._buckets.get(key[:2]) or list(self._by_key)
+        close = difflib.get_close_matches(key, candidates, n=3, cutoff=cutoff)
+        return None, "fuzzy", [self._by_key[match][1] for match in close]
+
+
+# Глобальный индекс артикулов
+sku_index = SkuIndex(refresh_interval=settings.sku_index_refresh_seconds)
+
+
+def resolve_lines(
+    db: Session,
+    lines: List[QuickOrderLine],
+    accept_fuzzy: bool = False,
+    cutoff: float = settings.quick_order_fuzzy_cutoff
+) -> List[QuickOrderLine]:
+    """
+    Сопоставить строки с товарами
+
+    Точные артикулы ищутся одним запросом; для остальных используется
+    нормализованное совпадение, затем нечеткое. Нечеткое совпадение
+    подставляется только при accept_fuzzy, иначе возвращается как вариант.
+    Строки с ошибкой не сопоставляются.
+    """
+    lines_to_resolve = [line for line in lines if line.error is None]
+    skus = {line.sku for line in lines_to_resolve}
+    exact = dict(
+        db.query(Product.sku, Product.id).filter(Product.sku.in_(skus)).all()
+    ) if skus else {}
+
+    for line in lines_to_resolve:
+        product_id = exact.get(line.sku)
+        if product_id is not None:
+            line.product_id, line.matched_sku, line.match = product_id, line.sku, "exact"
+            continue
+
+        found, match, suggestions = sku_index.find(db, line.sku, cutoff)
+        if found:
+            line.product_id, line.matched_sku, line.match = found[0], found[1], match
+        elif suggestions and accept_fuzzy:
+            line.product_id, line.matched_sku = sku_index.get(suggestions[0])
+            line.match = "fuzzy"
+            line.suggestions = suggestions[1:]
+        else:
+            line.suggestions = suggestions
+
+    return lines
+
+
+def _mark_sku_index_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["sku_index_dirty"] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Product, _event_name, _mark_sku_index_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_sku_index_after_commit(session):
+    if session.info.pop("sku_index_dirty", False):
+        sku_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_sku_index_dirty(session):
+    session.info.pop("sku_index_dirty", None)
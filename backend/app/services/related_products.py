@@ -0,0 +1,375 @@
+"""
+Похожие товары EMC3
+Соседи каждого товара считаются заранее: матрица embedding'ов каталога
+умножается на себя блоками строк, для товара сохраняются top-k из своей
+категории и top-k из других (product_relations). Страница товара получает
+рекомендации из словаря в памяти воркера, без запроса к хранилищу векторов.
+После переиндексации пересчитываются только измененные товары и те, в чьи
+списки они входили или теперь попадают; индексатор держит матрицу каталога
+в памяти и заменяет в ней только строки измененных товаров
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import SessionLocal, settings
+from app.models import Category, Product, ProductRelation
+
+logger = logging.getLogger(__name__)
+
+# Строк матрицы на один шаг умножения (block x N оценок во временной памяти)
+BLOCK_ROWS = 1024
+
+# Товары без категории считаются отдельной категорией
+NO_CATEGORY = -1
+
+Neighbours = List[Tuple[int, float]]
+
+
+@dataclass
+class ProductVectors:
+    """Нормированные embedding'и каталога: строка i - товар ids[i] из категории categories[i]"""
+    ids: np.ndarray
+    categories: np.ndarray
+    vectors: np.ndarray
+
+    @classmethod
+    def from_dict(cls, vectors: Dict[int, Sequence[float]], categories: Dict[int, Optional[int]]) -> "ProductVectors":
+        ids = np.array(sorted(vectors), dtype=np.int64)
+        matrix = np.array([vectors[product_id] for product_id in ids], dtype=np.float32).reshape(len(ids), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return cls(
+            ids=ids,
+            categories=np.array([categories.get(int(product_id)) or NO_CATEGORY for product_id in ids], dtype=np.int64),
+            vectors=matrix / norms,
+        )
+
+    def _find(self, product_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Позиции товаров в матрице и маска найденных"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self.ids) or not len(product_ids):
+            return np.zeros(len(product_ids), dtype=np.int64), np.zeros(len(product_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.ids, product_ids), len(self.ids) - 1)
+        return positions, self.ids[positions] == product_ids
+
+    def rows(self, product_ids: Sequence[int]) -> np.ndarray:
+        """Строки матрицы для товаров (товары без вектора пропускаются)"""
+        positions, found = self._find(product_ids)
+        return positions[found]
+
+    def patch(
+        self, vectors: Dict[int, Sequence[float]], categories: Dict[int, Optional[int]], removed: Iterable[int] = ()
+    ) -> "ProductVectors":
+        """
+        Матрица после изменения товаров: строки vectors заменяются на месте,
+        новые товары добавляются, removed удаляются
+
+        Новый объект (с копией массивов) создается только при добавлении
+        или удалении строк.
+        """
+        changed = ProductVectors.from_dict(vectors, categories) if vectors else None
+        positions, found = self._find(changed.ids) if changed is not None else (None, None)
+        if changed is not None and found.any():
+            self.vectors[positions[found]] = changed.vectors[found]
+            self.categories[positions[found]] = changed.categories[found]
+
+        drop = self.rows(sorted(set(removed)))
+        added = changed is not None and not found.all()
+        if not len(drop) and not added:
+            return self
+        if not len(self.ids):
+            return changed
+
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[drop] = False
+        parts = [(self.ids[keep], self.categories[keep], self.vectors[keep])]
+        if added:
+            parts.append((changed.ids[~found], changed.categories[~found], changed.vectors[~found]))
+        ids, categories, matrix = (np.concatenate(arrays) for arrays in zip(*parts))
+        order = np.argsort(ids, kind="stable")
+        return ProductVectors(ids=ids[order], categories=categories[order], vectors=matrix[order])
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Индексы и оценки k лучших в каждой строке по убыванию"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=np.float32)
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1)
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+def compute_neighbours(
+    data: ProductVectors, rows: np.ndarray, k: int, block_rows: int = BLOCK_ROWS
+) -> Dict[int, Tuple[Neighbours, Neighbours]]:
+    """Для строк rows: (top-k своей категории, top-k других категорий) в виде [(ID товара, близость)]"""
+    result = {}
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        scores = data.vectors[block] @ data.vectors.T
+        scores[np.arange(len(block)), block] = -np.inf
+        same = data.categories[block][:, None] == data.categories[None, :]
+
+        same_columns, same_scores = _top_k(np.where(same, scores, -np.inf), k)
+        cross_columns, cross_scores = _top_k(np.where(same, -np.inf, scores), k)
+        for i, row in enumerate(block):
+            result[int(data.ids[row])] = tuple(
+                [
+                    (int(data.ids[column]), float(score))
+                    for column, score in zip(columns[i], row_scores[i]) if np.isfinite(score)
+                ]
+                for columns, row_scores in ((same_columns, same_scores), (cross_columns, cross_scores))
+            )
+    return result
+
+
+def _kth_thresholds(db: Session, data: ProductVectors, k: int) -> np.ndarray:
+    """k-я близость в каждом списке (-inf, если список неполный - туда попадет любой)"""
+    thresholds = np.full((len(data.ids), 2), -np.inf, dtype=np.float32)
+    kth = db.query(
+        ProductRelation.product_id, ProductRelation.same_category, ProductRelation.similarity
+    ).filter(ProductRelation.rank == k - 1).all()
+    if kth:
+        product_ids, same_category, similarity = (np.array(column) for column in zip(*kth))
+        positions, found = data._find(product_ids)
+        thresholds[positions[found], np.where(same_category[found], 0, 1)] = similarity[found]
+    return thresholds
+
+
+def _load_relations(db: Session) -> Dict[int, Tuple[Neighbours, Neighbours]]:
+    relations: Dict[int, Tuple[Neighbours, Neighbours]] = {}
+    rows = db.query(
+        ProductRelation.product_id, ProductRelation.same_category,
+        ProductRelation.related_product_id, ProductRelation.similarity
+    ).order_by(ProductRelation.product_id, ProductRelation.same_category, ProductRelation.rank)
+    for product_id, same_category, related_id, similarity in rows:
+        lists = relations.setdefault(product_id, ([], []))
+        lists[0 if same_category else 1].append((related_id, similarity))
+    return relations
+
+
+def _write_relations(db: Session, neighbours: Dict[int, Tuple[Neighbours, Neighbours]], stale: Iterable[int]):
+    stale = list(stale)
+    for start in range(0, len(stale), 500):
+        db.query(ProductRelation).filter(
+            ProductRelation.product_id.in_(stale[start:start + 500])
+        ).delete(synchronize_session=False)
+    rows = [
+        {
+            "product_id": product_id,
+            "related_product_id": related_id,
+            "same_category": same_category,
+            "rank": rank,
+            "similarity": similarity,
+        }
+        for product_id, lists in neighbours.items()
+        for same_category, items in zip((True, False), lists)
+        for rank, (related_id, similarity) in enumerate(items)
+    ]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(ProductRelation), rows[start:start + 5000])
+    db.commit()
+
+
+def rebuild_relations(db: Session, data: ProductVectors, k: int = settings.related_products_top_k) -> int:
+    """Пересчитать соседей всего каталога; возвращает число товаров"""
+    neighbours = compute_neighbours(data, np.arange(len(data.ids)), k)
+    db.query(ProductRelation).delete(synchronize_session=False)
+    _write_relations(db, neighbours, [])
+    return len(neighbours)
+
+
+def refresh_relations(
+    db: Session, data: ProductVectors, changed_ids: Iterable[int], k: int = settings.related_products_top_k
+) -> int:
+    """
+    Пересчитать соседей после изменения товаров changed_ids (в том числе удаленных)
+
+    Список товара меняется, только если в нем был измененный товар или
+    измененный товар теперь ближе его k-го соседа, поэтому близость
+    считается к измененным товарам (N x C), а полный пересчет строки -
+    только для затронутых. Из product_relations читаются только списки
+    с измененными товарами и k-е близости. Возвращает число пересчитанных товаров.
+    """
+    changed = sorted(set(changed_ids))
+    if db.query(ProductRelation.id).first() is None:
+        return rebuild_relations(db, data, k)
+
+    changed_rows = data.rows(changed)
+    affected = {int(product_id) for product_id in data.ids[changed_rows]}
+    affected.update(changed)
+    for start in range(0, len(changed), 500):
+        affected.update(
+            product_id for product_id, in db.query(ProductRelation.product_id).filter(
+                ProductRelation.related_product_id.in_(changed[start:start + 500])
+            ).distinct()
+        )
+
+    if len(changed_rows):
+        thresholds = _kth_thresholds(db, data, k)
+        for start in range(0, len(changed_rows), BLOCK_ROWS):
+            block = changed_rows[start:start + BLOCK_ROWS]
+            scores = data.vectors @ data.vectors[block].T
+            scores[block, np.arange(len(block))] = -np.inf
+            same = data.categories[:, None] == data.categories[block][None, :]
+            entered = (
+                (np.where(same, scores, -np.inf).max(axis=1) > thresholds[:, 0])
+                | (np.where(same, -np.inf, scores).max(axis=1) > thresholds[:, 1])
+            )
+            affected.update(int(product_id) for product_id in data.ids[entered])
+
+    rows = data.rows(sorted(affected))
+    neighbours = compute_neighbours(data, rows, k)
+    # У удаленных товаров нет строки в матрице: их списки только удаляются
+    _write_relations(db, neighbours, affected)
+    return len(neighbours)
+
+
+async def load_product_vectors(service, db: Session) -> ProductVectors:
+    """Embedding'и текущих текстов товаров (кеш embedding'ов, недостающие - через API)"""
+    from app.services.vector_search import product_embedding_data
+
+    products = db.query(Product).options(joinedload(Product.category)).order_by(Product.id).all()
+    vectors = await service.get_product_vectors([product_embedding_data(product) for product in products])
+    return ProductVectors.from_dict(vectors, {product.id: product.category_id for product in products})
+
+
+class RelatedProductsUpdater:
+    """
+    Пересчет похожих товаров после пачек индексатора
+
+    Матрица каталога загружается один раз и держится в памяти; после пачки
+    берутся embedding'и только измененных товаров (только что записаны в кеш)
+    и заменяются их строки, так что стоимость пачки не включает чтение и
+    хеширование всего каталога. Все изменения товаров проходят через журнал
+    индексатора, поэтому матрица не расходится с каталогом.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.data: Optional[ProductVectors] = None
+
+    async def _patched(self, db: Session, changed_ids: List[int]) -> ProductVectors:
+        from app.services.vector_search import product_embedding_data
+
+        if self.data is None:
+            return await load_product_vectors(self.service, db)
+
+        products = db.query(Product).options(joinedload(Product.category)).filter(Product.id.in_(changed_ids)).all()
+        vectors = await self.service.get_product_vectors([product_embedding_data(product) for product in products])
+        return self.data.patch(
+            vectors, {product.id: product.category_id for product in products}, set(changed_ids) - set(vectors)
+        )
+
+    async def update(self, changed_ids: Iterable[int]) -> int:
+        """Пересчитать соседей после изменения changed_ids и сбросить словарь этого процесса"""
+        changed_ids = list(changed_ids)
+        db = SessionLocal()
+        try:
+            try:
+                self.data = await self._patched(db, changed_ids)
+            except Exception:
+                # Строки измененных товаров не заменены: при следующей пачке матрица загрузится заново
+                self.data = None
+                raise
+            count = await asyncio.to_thread(refresh_relations, db, self.data, changed_ids)
+        finally:
+            db.close()
+        related_products.invalidate()
+        logger.info(f"Пересчитаны похожие товары для {count} товаров")
+        return count
+
+
+class RelatedProductsMap:
+    """
+    Таблица product_relations в памяти воркера
+
+    Перезагружается после пересчета в этом процессе или по сигнатуре
+    таблицы не чаще чем раз в refresh_interval секунд.
+    """
+
+    def __init__(self, refresh_interval: float = 60.0):
+        self.refresh_interval = refresh_interval
+        self._relations: Dict[int, Tuple[Neighbours, Neighbours]] = {}
+        self._merged: Dict[int, Neighbours] = {}
+        self._fields: Dict[int, Dict[str, Any]] = {}
+        self._signature = None
+        self._dirty = True
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _refresh(self, db: Session):
+        if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+
+        with self._lock:
+            if not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+
+            force = self._dirty
+            self._dirty = False
+            signature = tuple(db.query(
+                func.count(ProductRelation.id), func.max(ProductRelation.id), func.max(ProductRelation.computed_at)
+            ).one())
+
+            if force or signature != self._signature:
+                relations = _load_relations(db)
+                fields = {
+                    product_id: {"article": sku, "product_name": name, "category_name": category_name}
+                    for product_id, sku, name, category_name in db.query(
+                        Product.id, Product.sku, Product.name, Category.name
+                    ).outerjoin(Category, Product.category_id == Category.id)
+                }
+                self._merged = {
+                    product_id: sorted(same + cross, key=lambda item: -item[1])
+                    for product_id, (same, cross) in relations.items()
+                }
+                self._relations, self._fields = relations, fields
+                self._signature = signature
+                logger.info(f"Похожие товары загружены: {len(relations)} товаров")
+
+            self._checked_at = time.monotonic()
+
+    def get(
+        self, db: Session, product_id: int, limit: int = 10, exclude_same_category: bool = False
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Соседи товара в формате результатов поиска; None, если они еще не посчитаны
+
+        Общий top-k - слияние двух списков (готовится при загрузке): лучшие k
+        из всего каталога всегда входят в top-k своей категории или top-k других.
+        """
+        self._refresh(db)
+        lists = self._relations.get(product_id)
+        if lists is None:
+            return None
+
+        same, cross = lists
+        items = cross if exclude_same_category else self._merged[product_id]
+        results = []
+        for related_id, similarity in items:
+            fields = self._fields.get(related_id)
+            if fields is None:
+                continue
+            results.append({"product_id": related_id, **fields, "similarity": similarity})
+            if len(results) >= limit:
+                break
+        return results
+
+
+# Глобальный словарь похожих товаров
+related_products = RelatedProductsMap(refresh_interval=settings.related_products_refresh_seconds)
@@ -0,0 +1,370 @@
+"""
+Аналитика поиска EMC3
+Поиск только кладет событие в кольцевой буфер в памяти; фоновая задача
+раз в flush_interval секунд записывает накопленное пачкой. Текст запроса
+и его embedding (int8) хранятся один раз на нормализованный запрос.
+Вместе с событиями пополняются дневные свертки (по запросу и гистограмма
+времени поиска), из них и строится отчет; сами события хранятся только
+search_analytics_retention_days
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, settings
+from app.models import SearchDailyStat, SearchEvent, SearchLatencyBucket, SearchQuery
+from app.services.query_embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы интервалов гистограммы времени поиска (мс): шаг 20%, от 0,5 мс до ~50 с;
+# процентиль оценивается верхней границей интервала, т.е. с точностью до 20%
+LATENCY_BUCKETS_MS = tuple(round(0.5 * 1.2 ** i, 3) for i in range(64))
+
+
+class SearchRecord(NamedTuple):
+    query: str  # Нормализованный запрос
+    embedding: Optional[Sequence[float]]
+    results_count: int
+    user_session: Optional[str]
+    mode: Optional[str]
+    latency_ms: Optional[float]
+    created_at: datetime
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def quantize_embedding(embedding: Sequence[float]) -> Tuple[bytes, float]:
+    """int8 с общим масштабом: компонента = байт * scale"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8).tobytes(), scale
+
+
+def dequantize_embedding(data: bytes, scale: float) -> List[float]:
+    return (np.frombuffer(data, dtype=np.int8).astype(np.float32) * scale).tolist()
+
+
+def latency_bucket(latency_ms: float) -> int:
+    return min(bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms), len(LATENCY_BUCKETS_MS) - 1)
+
+
+def latency_percentiles(counts: Dict[int, int], percentiles: Sequence[int] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+    """Процентили времени поиска (мс) по гистограмме {интервал: число поисков}"""
+    total = sum(counts.values())
+    result: Dict[str, Optional[float]] = {f"p{p}": None for p in percentiles}
+    if not total:
+        return result
+    buckets = sorted(counts.items())
+    for p in percentiles:
+        rank = total * p / 100
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = LATENCY_BUCKETS_MS[bucket]
+                break
+    return result
+
+
+class SearchAnalyticsBuffer:
+    """
+    Кольцевой буфер событий поиска
+
+    record() не обращается к БД и не блокирует поиск; при переполнении
+    (БД недоступна дольше, чем помещается в буфер) теряются самые старые
+    события, их число видно в stats().
+    """
+
+    def __init__(self, capacity: int = 10000, batch_size: int = 500):
+        self.batch_size = batch_size
+        self._buffer: deque = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(
+        self,
+        query: str,
+        embedding: Optional[Sequence[float]] = None,
+        results_count: int = 0,
+        user_session: Optional[str] = None,
+        mode: Optional[str] = None,
+        latency_ms: Optional[float] = None
+    ):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(SearchRecord(
+            normalize_query(query), embedding, results_count, user_session, mode, latency_ms,
+            datetime.now(timezone.utc)
+        ))
+        self.recorded += 1
+
+    def _drain(self) -> List[SearchRecord]:
+        records = []
+        while len(records) < self.batch_size:
+            try:
+                records.append(self._buffer.popleft())
+            except IndexError:
+                break
+        return records
+
+    def flush(self, db: Session) -> int:
+        """Записать накопленные события пачками; возвращает число записанных"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                records = self._drain()
+                if not records:
+                    return written
+                try:
+                    self._write(db, records)
+                except Exception:
+                    db.rollback()
+                    # Вернуть пачку в буфер, чтобы повторить при следующей записи
+                    self._buffer.extendleft(reversed(records))
+                    raise
+                written += len(records)
+                self.flushed += len(records)
+
+    def _write(self, db: Session, records: List[SearchRecord]):
+        keys = [query_hash(record.query) for record in records]
+
+        # По запросу: текст, embedding из любого события, где он есть, и время последнего поиска
+        queries: Dict[str, list] = {}
+        for key, record in zip(keys, records):
+            item = queries.setdefault(key, [record.query, None, record.created_at])
+            item[2] = record.created_at
+            if item[1] is None:
+                item[1] = record.embedding
+
+        existing = {
+            row.query_hash: row
+            for row in db.query(SearchQuery).filter(SearchQuery.query_hash.in_(list(queries)))
+        }
+        for key, (text, embedding, last_seen_at) in queries.items():
+            row = existing.get(key)
+            if row is None:
+                row = SearchQuery(query_hash=key, query_text=text, first_seen_at=last_seen_at)
+                db.add(row)
+            row.last_seen_at = last_seen_at
+            if row.embedding is None and embedding is not None:
+                row.embedding, row.embedding_scale = quantize_embedding(embedding)
+
+        db.execute(insert(SearchEvent), [
+            {
+                "query_hash": key,
+                "user_session": record.user_session,
+                "mode": record.mode,
+                "results_count": record.results_count,
+                "latency_ms": record.latency_ms,
+                "created_at": record.created_at,
+            }
+            for key, record in zip(keys, records)
+        ])
+        self._add_rollups(db, keys, records)
+        db.commit()
+
+    def _add_rollups(self, db: Session, keys: List[str], records: List[SearchRecord]):
+        """
+        Добавить пачку в дневные свертки
+
+        Существующие строки увеличиваются на стороне SQL (SET searches =
+        searches + n), поэтому одновременная запись той же строки другим
+        процессом не теряет приращение. Строка свертки, одновременно созданная
+        другим процессом, дает ошибку уникальности: транзакция откатывается
+        целиком, пачка возвращается в буфер и при повторе попадает в уже
+        существующую строку.
+        """
+        stats: Dict[Tuple[date, str], List[int]] = {}
+        latencies: Counter = Counter()
+        for key, record in zip(keys, records):
+            day = record.created_at.date()
+            item = stats.setdefault((day, key), [0, 0, 0])
+            item[0] += 1
+            item[1] += record.results_count == 0
+            item[2] += record.results_count
+            if record.latency_ms is not None:
+                latencies[(day, record.mode or "", latency_bucket(record.latency_ms))] += 1
+
+        days = {day for day, _ in stats}
+        existing_stats = {
+            (day, query_hash): row_id
+            for row_id, day, query_hash in db.query(
+                SearchDailyStat.id, SearchDailyStat.day, SearchDailyStat.query_hash
+            ).filter(
+                SearchDailyStat.day.in_(days), SearchDailyStat.query_hash.in_([key for _, key in stats])
+            )
+        }
+        for (day, key), (searches, zero_results, results_total) in stats.items():
+            row_id = existing_stats.get((day, key))
+            if row_id is None:
+                db.add(SearchDailyStat(
+                    day=day, query_hash=key, searches=searches, zero_results=zero_results, results_total=results_total
+                ))
+                continue
+            db.query(SearchDailyStat).filter(SearchDailyStat.id == row_id).update({
+                SearchDailyStat.searches: SearchDailyStat.searches + searches,
+                SearchDailyStat.zero_results: SearchDailyStat.zero_results + zero_results,
+                SearchDailyStat.results_total: SearchDailyStat.results_total + results_total,
+            }, synchronize_session=False)
+
+        if not latencies:
+            return
+        existing_buckets = {
+            (day, mode, bucket): row_id
+            for row_id, day, mode, bucket in db.query(
+                SearchLatencyBucket.id, SearchLatencyBucket.day, SearchLatencyBucket.mode, SearchLatencyBucket.bucket
+            ).filter(SearchLatencyBucket.day.in_(days))
+        }
+        for (day, mode, bucket), count in latencies.items():
+            row_id = existing_buckets.get((day, mode, bucket))
+            if row_id is None:
+                db.add(SearchLatencyBucket(day=day, mode=mode, bucket=bucket, count=count))
+            else:
+                db.query(SearchLatencyBucket).filter(SearchLatencyBucket.id == row_id).update(
+                    {SearchLatencyBucket.count: SearchLatencyBucket.count + count}, synchronize_session=False
+                )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+
+# Глобальный буфер аналитики поиска
+search_analytics = SearchAnalyticsBuffer(
+    capacity=settings.search_analytics_buffer_size,
+    batch_size=settings.search_analytics_batch_size
+)
+
+
+def purge_old_events(db: Session, retention_days: int = settings.search_analytics_retention_days) -> int:
+    """Удалить события старше срока хранения (их статистика уже в дневных свертках)"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    removed = db.query(SearchEvent).filter(SearchEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+def search_analytics_report(db: Session, days: int = 7, top: int = 10) -> Dict[str, Any]:
+    """
+    Отчет по поиску за последние days дней (включая сегодня)
+
+    Считается агрегатами по дневным сверткам: объем чтения зависит от числа
+    различных запросов за период, а не от числа поисков.
+    """
+    start = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    in_period = SearchDailyStat.day >= start
+
+    searches, zero_results, results_total, unique_queries = db.query(
+        func.coalesce(func.sum(SearchDailyStat.searches), 0),
+        func.coalesce(func.sum(SearchDailyStat.zero_results), 0),
+        func.coalesce(func.sum(SearchDailyStat.results_total), 0),
+        func.count(func.distinct(SearchDailyStat.query_hash)),
+    ).filter(in_period).one()
+
+    def top_queries(order_column, only_zero: bool = False) -> List[Dict[str, Any]]:
+        total = func.sum(order_column).label("total")
+        grouped = db.query(
+            SearchDailyStat.query_hash,
+            func.sum(SearchDailyStat.searches).label("searches"),
+            func.sum(SearchDailyStat.zero_results).label("zero_results"),
+            func.sum(SearchDailyStat.results_total).label("results_total"),
+            total,
+        ).filter(in_period).group_by(SearchDailyStat.query_hash)
+        if only_zero:
+            grouped = grouped.having(func.sum(SearchDailyStat.zero_results) > 0)
+        grouped = grouped.order_by(total.desc()).limit(top).subquery()
+
+        rows = db.query(
+            SearchQuery.query_text, grouped.c.searches, grouped.c.zero_results, grouped.c.results_total
+        ).join(grouped, grouped.c.query_hash == SearchQuery.query_hash).order_by(grouped.c.total.desc())
+        return [
+            {
+                "query": text,
+                "searches": count,
+                "zero_results": zero,
+                "avg_results": round(results / count, 2) if count else 0.0,
+            }
+            for text, count, zero, results in rows
+        ]
+
+    latency: Dict[str, Dict[int, int]] = {}
+    for mode, bucket, count in db.query(
+        SearchLatencyBucket.mode, SearchLatencyBucket.bucket, func.sum(SearchLatencyBucket.count)
+    ).filter(SearchLatencyBucket.day >= start).group_by(SearchLatencyBucket.mode, SearchLatencyBucket.bucket):
+        latency.setdefault(mode or "unknown", {})[bucket] = count
+    overall: Counter = Counter()
+    for counts in latency.values():
+        overall.update(counts)
+
+    return {
+        "period_days": days,
+        "total_searches": searches,
+        "unique_queries": unique_queries,
+        "avg_results": round(results_total / searches, 2) if searches else 0.0,
+        "zero_result_rate": round(zero_results / searches, 4) if searches else 0.0,
+        "top_queries": top_queries(SearchDailyStat.searches),
+        "top_zero_result_queries": top_queries(SearchDailyStat.zero_results, only_zero=True),
+        "latency_ms": latency_percentiles(overall),
+        "latency_ms_by_mode": {mode: latency_percentiles(counts) for mode, counts in sorted(latency.items())},
+    }
+
+
+async def run_analytics_flusher(
+    interval: float = settings.search_analytics_flush_seconds,
+    purge_interval: float = 3600
+):
+    """Фоновая запись буфера аналитики и удаление старых событий"""
+
+    def flush() -> int:
+        db = SessionLocal()
+        try:
+            return search_analytics.flush(db)
+        finally:
+            db.close()
+
+    def purge() -> int:
+        db = SessionLocal()
+        try:
+            return purge_old_events(db)
+        finally:
+            db.close()
+
+    purged_at = 0.0
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(flush)
+            if time.monotonic() - purged_at >= purge_interval:
+                purged_at = time.monotonic()
+                removed = await asyncio.to_thread(purge)
+                if removed:
+                    logger.info(f"Удалено {removed} событий поиска старше срока хранения")
+        except asyncio.CancelledError:
+            # Дописать накопленное при остановке
+            try:
+                await asyncio.to_thread(flush)
+            except Exception as e:
+                logger.error(f"Ошибка записи аналитики поиска при остановке: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка записи аналитики поиска: {e}")
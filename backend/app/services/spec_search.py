@@ -0,0 +1,195 @@
+"""
+Поиск похожих товаров по характеристикам EMC3
+Товар - точка в пространстве числовых характеристик (мощность, световой
+поток, цветовая температура, светоотдача, степень защиты IP, цена). Значения
+приводятся к шкалам, где важна относительная разница (логарифм для мощности,
+потока, светоотдачи и цены, майреды для цветовой температуры), и делятся на
+разброс по каталогу. Ближайшие товары - взвешенное евклидово расстояние,
+один векторизованный проход NumPy по колонкам снимка каталога из
+hybrid_search (без обращения к API embedding'ов)
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.services.hybrid_search import SearchFilters, _CatalogSnapshot, catalog_index, parse_protection
+
+logger = logging.getLogger(__name__)
+
+SPEC_FEATURES = ("power", "luminous_flux", "color_temperature", "efficacy", "protection", "price")
+
+# Вес характеристики в расстоянии: для подбора аналога важнее всего мощность и поток, цена - уточняет
+DEFAULT_WEIGHTS = {
+    "power": 3.0,
+    "luminous_flux": 2.0,
+    "color_temperature": 1.0,
+    "efficacy": 1.0,
+    "protection": 1.0,
+    "price": 0.2,
+}
+
+# Вклад характеристики, которой нет у товара (в квадратах стандартного отклонения)
+MISSING_PENALTY = 1.0
+
+
+def _log(values: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(values > 0, np.log(values), np.nan)
+
+
+def _transform(power, flux, color_temperature, protection, price) -> np.ndarray:
+    """Колонки характеристик (N x len(SPEC_FEATURES)) в шкалах для расстояния; NaN - нет значения"""
+    power, flux, color_temperature, protection, price = (
+        np.asarray(values, dtype=np.float64) for values in (power, flux, color_temperature, protection, price)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mireds = np.where(color_temperature > 0, 1e6 / color_temperature, np.nan)
+        efficacy = np.where((power > 0) & (flux > 0), flux / power, np.nan)
+    protection = np.where(protection >= 0, protection, np.nan)
+    return np.column_stack([_log(power), _log(flux), mireds, _log(efficacy), protection, _log(price)])
+
+
+@dataclass
+class SpecQuery:
+    """Характеристики, к которым ищутся похожие товары (None - не учитывать)"""
+    power: Optional[float] = None
+    luminous_flux: Optional[float] = None
+    color_temperature: Optional[float] = None
+    protection: Optional[int] = None
+    price: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, specs: Optional[Dict[str, Any]]) -> "SpecQuery":
+        """Характеристики в формате VectorSearchService (technical_specs) или модели Product"""
+        specs = specs or {}
+
+        def number(*keys) -> Optional[float]:
+            for key in keys:
+                value = specs.get(key)
+                if value not in (None, ""):
+                    try:
+                        return float(value)
+                    except (TypeError, ValueError):
+                        return None
+            return None
+
+        return cls(
+            power=number("power", "power_watts"),
+            luminous_flux=number("luminous_flux", "flux"),
+            color_temperature=number("color_temperature"),
+            protection=parse_protection(specs.get("protection_rating", specs.get("protection"))),
+            price=number("price"),
+        )
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in vars(self).values())
+
+    def vector(self) -> np.ndarray:
+        nan = np.nan
+        return _transform(
+            [self.power if self.power is not None else nan],
+            [self.luminous_flux if self.luminous_flux is not None else nan],
+            [self.color_temperature if self.color_temperature is not None else nan],
+            [self.protection if self.protection is not None else -1],
+            [self.price if self.price is not None else nan],
+        )[0]
+
+
+class _SpecMatrix:
+    """Характеристики каталога из снимка: значения в шкалах расстояния и их разброс"""
+
+    def __init__(self, snapshot: _CatalogSnapshot):
+        self.snapshot = snapshot
+        self.values = _transform(
+            snapshot.power, snapshot.flux, snapshot.color_temperature, snapshot.protection, snapshot.price
+        )
+        with np.errstate(invalid="ignore"):
+            scale = np.nanstd(self.values, axis=0) if len(self.values) else np.ones(len(SPEC_FEATURES))
+        self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    def distances(self, query: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Взвешенное расстояние от query до каждого товара (учитываются характеристики, заданные в query)"""
+        used = ~np.isnan(query) & (weights > 0)
+        if not used.any():
+            return np.full(len(self.values), np.inf)
+        diff = (self.values[:, used] - query[used]) / self.scale[used]
+        squared = np.where(np.isnan(diff), MISSING_PENALTY, diff * diff)
+        return np.sqrt(squared @ weights[used] / weights[used].sum())
+
+
+class SpecIndex:
+    """Поиск по характеристикам поверх снимка каталога (перестраивается вместе с ним)"""
+
+    def __init__(self, catalog=catalog_index):
+        self.catalog = catalog
+        self._matrix: Optional[_SpecMatrix] = None
+        self._lock = threading.Lock()
+
+    def _current(self, db: Session) -> _SpecMatrix:
+        snapshot = self.catalog.snapshot(db)
+        matrix = self._matrix
+        if matrix is None or matrix.snapshot is not snapshot:
+            with self._lock:
+                matrix = self._matrix
+                if matrix is None or matrix.snapshot is not snapshot:
+                    matrix = self._matrix = _SpecMatrix(snapshot)
+        return matrix
+
+    def product_specs(self, db: Session, product_id: int) -> Optional[SpecQuery]:
+        """Характеристики товара из снимка (для подбора аналога)"""
+        snapshot = self.catalog.snapshot(db)
+        position = int(np.searchsorted(snapshot.ids, product_id))
+        if position >= len(snapshot.ids) or snapshot.ids[position] != product_id:
+            return None
+
+        def value(column) -> Optional[float]:
+            return None if np.isnan(column[position]) else float(column[position])
+
+        protection = int(snapshot.protection[position])
+        return SpecQuery(
+            power=value(snapshot.power),
+            luminous_flux=value(snapshot.flux),
+            color_temperature=value(snapshot.color_temperature),
+            protection=protection if protection >= 0 else None,
+            price=value(snapshot.price),
+        )
+
+    def similar(
+        self,
+        db: Session,
+        query: SpecQuery,
+        limit: int = 15,
+        weights: Optional[Dict[str, float]] = None,
+        filters: Optional[SearchFilters] = None,
+        exclude: Sequence[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """Ближайшие товары: список (ID товара, расстояние) по возрастанию расстояния"""
+        matrix = self._current(db)
+        snapshot = matrix.snapshot
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        distances = matrix.distances(query.vector(), np.array([weights[name] for name in SPEC_FEATURES]))
+
+        if filters is not None and not filters.is_empty():
+            distances[~snapshot.mask(filters)] = np.inf
+        if exclude:
+            distances[np.isin(snapshot.ids, list(exclude))] = np.inf
+
+        candidates = np.nonzero(np.isfinite(distances))[0]
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(distances[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(int(snapshot.ids[i]), float(distances[i])) for i in candidates]
+
+
+# Глобальный индекс характеристик
+spec_index = SpecIndex()
+
+
+def spec_similarity(distance: float) -> float:
+    """Близость 0..1 для выдачи (1 - совпадение всех заданных характеристик)"""
+    return 1.0 / (1.0 + distance)
@@ -0,0 +1,282 @@
+"""
+Резервирование складских остатков EMC3
+Списание выполняется атомарным условным UPDATE (quantity >= :n), поэтому
+параллельные заказы не могут продать больше, чем есть на складе,
+а блокировка строки держится только до commit короткой транзакции заказа
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, settings
+from app.models.orders import Order, OrderStatus
+from app.models.stock import StockLevel, StockReservation, ReservationStatus
+
+logger = logging.getLogger(__name__)
+
+# Все позиции заказа резервируются одним запросом. Строки блокируются
+# в порядке product_id, чтобы встречные заказы не ловили deadlock,
+# а условие quantity >= :n перепроверяется после ожидания блокировки
+_BATCH_RESERVE_SQL = text("""
+    WITH requested AS (
+        SELECT *
+        FROM unnest(CAST(:product_ids AS integer[]), CAST(:quantities AS integer[]))
+            AS r(product_id, quantity)
+    ),
+    locked AS (
+        SELECT s.product_id
+        FROM stock_levels s
+        JOIN requested r ON r.product_id = s.product_id
+        WHERE s.quantity >= r.quantity
+        ORDER BY s.product_id
+        FOR UPDATE OF s
+    )
+    UPDATE stock_levels s
+    SET quantity = s.quantity - r.quantity, updated_at = now()
+    FROM requested r, locked l
+    WHERE s.product_id = r.product_id
+      AND l.product_id = s.product_id
+      AND s.quantity >= r.quantity
+    RETURNING s.product_id
+""")
+
+
+# Резервы, по которым товар снят со склада и возвращается при отмене
+_HELD_STATUSES = (ReservationStatus.active, ReservationStatus.committed)
+
+
+class InsufficientStock(Exception):
+    """Недостаточно остатка; вызывающий код обязан откатить транзакцию"""
+
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f"Недостаточно товара на складе: {', '.join(map(str, product_ids))}")
+
+
+def aggregate_quantities(items: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    """Сложить количества одинаковых товаров"""
+    totals: Dict[int, int] = {}
+    for product_id, quantity in items:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return totals
+
+
+def _reserve_batch(db: Session, wanted: Dict[int, int]) -> set:
+    product_ids = list(wanted)
+    rows = db.execute(_BATCH_RESERVE_SQL, {
+        "product_ids": product_ids,
+        "quantities": [wanted[product_id] for product_id in product_ids],
+    })
+    return {row[0] for row in rows}
+
+
+def _reserve_each(db: Session, wanted: Dict[int, int]) -> set:
+    """Поштучное условное списание для СУБД без unnest (SQLite в разработке)"""
+    reserved = set()
+    for product_id, quantity in wanted.items():
+        result = db.execute(
+            update(StockLevel)
+            .where(StockLevel.product_id == product_id, StockLevel.quantity >= quantity)
+            .values(quantity=StockLevel.quantity - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            reserved.add(product_id)
+    return reserved
+
+
+def reserve_items(
+    db: Session,
+    items: Dict[int, int],
+    user_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    ttl_minutes: Optional[int] = None
+) -> List[StockReservation]:
+    """
+    Зарезервировать товары
+
+    Товары без строки в stock_levels не учитываются на складе и не резервируются.
+    Если хотя бы одной позиции не хватает, выбрасывается InsufficientStock -
+    частичное списание отменяется откатом транзакции.
+    """
+    requested = {product_id: quantity for product_id, quantity in items.items() if quantity > 0}
+    if not requested:
+        return []
+
+    tracked = {
+        product_id for (product_id,) in
+        db.query(StockLevel.product_id).filter(StockLevel.product_id.in_(requested))
+    }
+    if not tracked:
+        return []
+
+    wanted = {product_id: requested[product_id] for product_id in sorted(tracked)}
+
+    if db.get_bind().dialect.name == "postgresql":
+        reserved = _reserve_batch(db, wanted)
+    else:
+        reserved = _reserve_each(db, wanted)
+
+    missing = sorted(set(wanted) - reserved)
+    if missing:
+        raise InsufficientStock(missing)
+
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=ttl_minutes or settings.stock_reservation_ttl_minutes
+    )
+    reservations = [
+        StockReservation(
+            product_id=product_id,
+            order_id=order_id,
+            user_id=user_id,
+            quantity=quantity,
+            status=ReservationStatus.active,
+            expires_at=expires_at
+        )
+        for product_id, quantity in wanted.items()
+    ]
+    db.add_all(reservations)
+    return reservations
+
+
+def release_reservations(
+    db: Session,
+    reservations: List[StockReservation],
+    status: ReservationStatus = ReservationStatus.released
+) -> int:
+    """Вернуть товар на склад по резервам (удержанным или списанным под заказ)"""
+    active = [r for r in reservations if r.status in _HELD_STATUSES]
+    totals = aggregate_quantities((r.product_id, r.quantity) for r in active)
+
+    for product_id in sorted(totals):
+        db.execute(
+            update(StockLevel)
+            .where(StockLevel.product_id == product_id)
+            .values(quantity=StockLevel.quantity + totals[product_id])
+            .execution_options(synchronize_session=False)
+        )
+
+    for reservation in active:
+        reservation.status = status
+    return len(active)
+
+
+def release_order_reservations(db: Session, order_id: int) -> int:
+    """Вернуть на склад товар отмененного заказа"""
+    reservations = db.query(StockReservation).filter(
+        StockReservation.order_id == order_id,
+        StockReservation.status.in_(_HELD_STATUSES)
+    ).all()
+    return release_reservations(db, reservations)
+
+
+def release_checkout_hold(db: Session, user_id: int) -> int:
+    """Вернуть на склад удержание оформления пользователя (резервы без заказа)"""
+    reservations = db.query(StockReservation).filter(
+        StockReservation.user_id == user_id,
+        StockReservation.order_id.is_(None),
+        StockReservation.status == ReservationStatus.active
+    ).all()
+    return release_reservations(db, reservations)
+
+
+def place_checkout_hold(
+    db: Session,
+    user_id: int,
+    items: Dict[int, int],
+    ttl_minutes: Optional[int] = None
+) -> List[StockReservation]:
+    """
+    Удержать товар на время оформления заказа
+
+    Прежнее удержание пользователя заменяется новым. Брошенное оформление
+    возвращается на склад очисткой просроченных резервов, а при создании
+    заказа удержание переходит в резерв заказа (release_checkout_hold и
+    reserve_items в одной транзакции).
+    """
+    release_checkout_hold(db, user_id)
+    return reserve_items(db, items, user_id=user_id, ttl_minutes=ttl_minutes)
+
+
+def commit_order_reservations(db: Session, order_id: int) -> int:
+    """Сделать списание окончательным (заказ оформлен): такой резерв не истекает"""
+    # Резервы, только что добавленные в сессию, должны попасть под UPDATE
+    db.flush()
+    return db.query(StockReservation).filter(
+        StockReservation.order_id == order_id,
+        StockReservation.status == ReservationStatus.active
+    ).update({StockReservation.status: ReservationStatus.committed}, synchronize_session=False)
+
+
+def expire_reservations(db: Session, limit: int = 500) -> int:
+    """
+    Вернуть на склад просроченные удержания оформления (резервы без заказа, place_checkout_hold)
+
+    Резервы оформленных заказов списываются окончательно при создании заказа и сюда
+    не попадают; оставшиеся активные резервы заказа (созданные до этого) фиксируются
+    как списание, если заказ не отменен. Возвращает количество обработанных резервов.
+    """
+    now = datetime.now(timezone.utc)
+    expired = (
+        db.query(StockReservation)
+        .filter(
+            StockReservation.status == ReservationStatus.active,
+            StockReservation.expires_at <= now
+        )
+        .order_by(StockReservation.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not expired:
+        return 0
+
+    order_ids = {r.order_id for r in expired if r.order_id is not None}
+    statuses = dict(
+        db.query(Order.id, Order.status).filter(Order.id.in_(order_ids)).all()
+    ) if order_ids else {}
+
+    abandoned = []
+    for reservation in expired:
+        status = statuses.get(reservation.order_id)
+        if reservation.order_id is None or status in (None, OrderStatus.cancelled):
+            abandoned.append(reservation)
+        else:
+            reservation.status = ReservationStatus.committed
+
+    released = release_reservations(db, abandoned, status=ReservationStatus.expired)
+    db.commit()
+
+    if released:
+        logger.info(f"Возвращено на склад {released} просроченных резервов")
+    return len(expired)
+
+
+async def run_reservation_sweeper(interval: float = settings.stock_sweep_interval_seconds):
+    """Фоновая очистка просроченных резервов"""
+
+    def sweep() -> int:
+        db = SessionLocal()
+        try:
+            total = 0
+            while True:
+                processed = expire_reservations(db)
+                total += processed
+                if not processed:
+                    return total
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка очистки просроченных резервов: {e}")
+        await asyncio.sleep(interval)
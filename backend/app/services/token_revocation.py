@@ -0,0 +1,185 @@
+"""
+Отзыв токенов EMC3
+Отозванные идентификаторы (jti токена или ID сессии) хранятся в таблице
+revoked_tokens - источнике истины, а проверка на каждом запросе идет по
+хранилищу с O(1) поиском: локальному хеш-множеству, которое догоняет таблицу
+не реже раза в sync_interval секунд, или общему Redis
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, settings
+from app.models.tokens import RefreshToken, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationBackend:
+    """Хранилище отозванных идентификаторов для проверки на каждом запросе"""
+
+    def add(self, token_id: str, expires_at: float):
+        raise NotImplementedError
+
+    def contains(self, token_id: str) -> bool:
+        raise NotImplementedError
+
+    def sync(self, db: Session):
+        """Догнать источник истины (для локальных хранилищ)"""
+
+
+class LocalRevocationBackend(RevocationBackend):
+    """
+    Хеш-множество в памяти процесса
+
+    Отзывы из этого процесса видны сразу после commit, из других воркеров -
+    после очередной синхронизации с таблицей revoked_tokens.
+    """
+
+    def __init__(self, sync_interval: float = 5.0):
+        self.sync_interval = sync_interval
+        self._revoked: Dict[str, float] = {}
+        self._last_seen: Optional[datetime] = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, token_id: str, expires_at: float):
+        self._revoked[token_id] = expires_at
+
+    def contains(self, token_id: str) -> bool:
+        expires_at = self._revoked.get(token_id)
+        return expires_at is not None and expires_at > time.time()
+
+    def sync(self, db: Session):
+        if time.monotonic() - self._synced_at < self.sync_interval:
+            return
+
+        with self._lock:
+            if time.monotonic() - self._synced_at < self.sync_interval:
+                return
+
+            try:
+                query = db.query(RevokedToken.token_id, RevokedToken.expires_at, RevokedToken.revoked_at)
+                if self._last_seen is None:
+                    query = query.filter(RevokedToken.expires_at > datetime.now(timezone.utc))
+                else:
+                    # Перекрытие окна: транзакции других воркеров могут закоммититься с опозданием
+                    query = query.filter(RevokedToken.revoked_at >= self._last_seen - timedelta(seconds=60))
+
+                for token_id, expires_at, revoked_at in query:
+                    self._revoked[token_id] = _timestamp(expires_at)
+                    if self._last_seen is None or revoked_at > self._last_seen:
+                        self._last_seen = revoked_at
+
+                now = time.time()
+                for token_id in [key for key, expires_at in self._revoked.items() if expires_at <= now]:
+                    del self._revoked[token_id]
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации отозванных токенов: {e}")
+            finally:
+                self._synced_at = time.monotonic()
+
+
+class RedisRevocationBackend(RevocationBackend):
+    """Общее для всех воркеров хранилище в Redis: ключ с TTL до истечения токена"""
+
+    def __init__(self, url: str, prefix: str = "emc3:revoked:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def add(self, token_id: str, expires_at: float):
+        ttl = int(expires_at - time.time()) + 1
+        if ttl > 0:
+            self.client.set(self.prefix + token_id, 1, ex=ttl)
+
+    def contains(self, token_id: str) -> bool:
+        return bool(self.client.exists(self.prefix + token_id))
+
+
+def _timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def create_revocation_backend(name: str = settings.token_revocation_backend) -> RevocationBackend:
+    if name == "redis":
+        return RedisRevocationBackend(settings.redis_url)
+    return LocalRevocationBackend(sync_interval=settings.token_revocation_sync_seconds)
+
+
+class TokenRevocation:
+    """Отзыв токенов: запись в БД и хранилище для быстрой проверки"""
+
+    def __init__(self, backend: RevocationBackend):
+        self.backend = backend
+
+    def revoke(self, db: Session, token_id: str, expires_at: datetime):
+        """Отозвать идентификатор (commit выполняет вызывающий код)"""
+        exists = db.query(RevokedToken.id).filter(RevokedToken.token_id == token_id).first()
+        if exists is None:
+            db.add(RevokedToken(
+                token_id=token_id,
+                expires_at=expires_at,
+                revoked_at=datetime.now(timezone.utc)
+            ))
+        db.info.setdefault("revoked_tokens", []).append((token_id, _timestamp(expires_at)))
+
+    def is_revoked(self, db: Session, *token_ids: Optional[str]) -> bool:
+        self.backend.sync(db)
+        return any(token_id and self.backend.contains(token_id) for token_id in token_ids)
+
+
+# Глобальный список отзыва
+token_revocation = TokenRevocation(create_revocation_backend())
+
+
+def purge_expired_tokens(db: Session) -> int:
+    """Удалить истекшие записи отзыва и refresh-токены"""
+    now = datetime.now(timezone.utc)
+    removed = db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+    removed += db.query(RefreshToken).filter(RefreshToken.expires_at <= now).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+async def run_token_cleanup(interval: float = settings.token_cleanup_interval_seconds):
+    """Фоновая очистка истекших токенов"""
+
+    def cleanup() -> int:
+        db = SessionLocal()
+        try:
+            return purge_expired_tokens(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(cleanup)
+            if removed:
+                logger.info(f"Удалено {removed} истекших записей токенов")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка очистки истекших токенов: {e}")
+        await asyncio.sleep(interval)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_revocations_after_commit(session):
+    for token_id, expires_at in session.info.pop("revoked_tokens", []):
+        token_revocation.backend.add(token_id, expires_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_revocations_after_rollback(session):
+    session.info.pop("revoked_tokens", None)
@@ -0,0 +1,675 @@
+"""
+Локальный векторный индекс EMC3
+Векторы товаров лежат в отображаемой в память матрице float32/float16
+(vectors.npy), соответствие товар - строка и данные для выдачи - в SQLite
+(index.sqlite3) рядом. Запуск воркера не читает матрицу целиком: страницы
+подгружаются ОС по мере обращения.
+
+Поиск - косинусная близость (векторы нормируются при записи):
+- небольшой каталог: точный перебор всей матрицы одним умножением;
+- от ivf_threshold векторов: IVF - векторы разбиты на кластеры k-means,
+  запрос сравнивается только с векторами nprobe ближайших кластеров
+
+Квантование (quantization) держит в памяти воркера компактные коды
+векторов (codes.npz), матрица остается на диске:
+- int8: компонента - байт со своим масштабом у каждого вектора (в 4 раза
+  меньше float32);
+- pq: product quantization - вектор делится на pq_subspaces частей, каждая
+  заменяется номером ближайшего из 256 центроидов своей части (при
+  подпространствах по 4 измерения - в 16 раз меньше float32).
+Запрос не квантуется (асимметричное расстояние): для int8 - умножение на
+коды, для pq - сумма по таблице близостей запроса к центроидам. Лучшие
+limit * rerank кандидатов пересчитываются точно по векторам из матрицы.
+
+Индекс в одном каталоге могут открывать несколько процессов (воркеры API и
+индексатор). Изменения выполняются под файловой блокировкой write.lock и
+увеличивают счетчик поколений в SQLite; остальные процессы сверяют его при
+поиске и перечитывают соответствие товар - строка и матрицу (после ее
+увеличения файл заменяется). Освободившаяся строка переиспользуется только
+после фиксации удаления, а поиск, во время которого поколение сменилось,
+повторяется - строка не может быть выдана под чужим ID товара. Без fcntl
+(Windows) блокировки нет: писать в индекс должен один процесс.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Строк матрицы на один шаг умножения (ограничивает временную память для float16)
+BLOCK_ROWS = 16384
+
+QUANTIZATIONS = ("none", "int8", "pq")
+
+# Центроидов в каждом подпространстве PQ (код - один байт)
+PQ_CENTROIDS = 256
+
+# PQ обучается, когда векторов хватает на устойчивые центроиды; до этого - точный поиск
+PQ_MIN_TRAIN = PQ_CENTROIDS * 4
+
+# Выборка для обучения PQ; после обучения на полной выборке центроиды не переобучаются
+PQ_TRAIN_SAMPLE = PQ_CENTROIDS * 32
+
+# Строк int8 на одно умножение: копия блока во float32 остается в кеше процессора
+CODE_BLOCK_ROWS = 1024
+
+# Попыток поиска, если другой процесс изменил индекс во время поиска
+SEARCH_ATTEMPTS = 3
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex:
+    """
+    Векторный индекс в каталоге path
+
+    Добавление и удаление инкрементальные: вектор пишется прямо в свою
+    строку матрицы, освободившиеся строки переиспользуются. flush()
+    сбрасывает изменения матрицы на диск (SQLite фиксируется сразу).
+    Изменения из других процессов подхватываются по счетчику поколений.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dimension: int,
+        dtype: str = "float32",
+        ivf_threshold: int = 20000,
+        nprobe: int = 16,
+        initial_capacity: int = 1024,
+        quantization: str = "none",
+        pq_subspaces: Optional[int] = None,
+        rerank: int = 4
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Неподдерживаемый тип векторов: {dtype}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Неподдерживаемое квантование: {quantization}")
+        pq_subspaces = pq_subspaces or max(1, dimension // 4)
+        if quantization == "pq" and dimension % pq_subspaces:
+            raise ValueError(f"Размерность {dimension} не делится на {pq_subspaces} подпространств PQ")
+
+        self.path = path
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.rerank = max(1, rerank)
+
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(path, "write.lock"), "a+")
+        self._lock_depth = 0
+
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._centroids_path = os.path.join(path, "centroids.npy")
+        self._codes_path = os.path.join(path, "codes.npz")
+
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        with self._file_lock():
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    product_id INTEGER PRIMARY KEY,
+                    slot INTEGER NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    generation INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Индексы, созданные до счетчика поколений
+            if "generation" not in {row[1] for row in self._db.execute("PRAGMA table_info(items)")}:
+                self._db.execute("ALTER TABLE items ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+            self._db.commit()
+
+            # Поколение читается до строк: изменение между ними вызовет повторное чтение при поиске
+            self._seen = self._generation()
+            rows = self._db.execute("SELECT product_id, slot FROM items").fetchall()
+            self._vectors = self._open_vectors(initial_capacity)
+        self._vectors_inode = os.stat(self._vectors_path).st_ino
+
+        capacity = self._vectors.shape[0]
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._slot_of: Dict[int, int] = {}
+        for product_id, slot in rows:
+            self._ids[slot] = product_id
+            self._slot_of[product_id] = slot
+
+        self._size = max(self._slot_of.values()) + 1 if self._slot_of else 0
+        self._free = [slot for slot in range(self._size) if self._ids[slot] < 0]
+
+        # IVF: центроиды кластеров и номер кластера каждой строки
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.full(capacity, -1, dtype=np.int32)
+        self._trained_size = 0
+        if os.path.exists(self._centroids_path) and len(self) >= ivf_threshold:
+            self._centroids = np.load(self._centroids_path)
+            self._assign_slots(np.arange(self._size))
+            self._trained_size = len(self)
+
+        self._load_codes()
+
+        logger.info(
+            f"Локальный векторный индекс {path}: {len(self)} векторов, IVF: {self._centroids is not None}, "
+            f"квантование: {quantization}"
+        )
+
+    def _open_vectors(self, initial_capacity: int) -> np.ndarray:
+        if os.path.exists(self._vectors_path):
+            vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if vectors.shape[1] != self.dimension or vectors.dtype != self.dtype:
+                raise ValueError(
+                    f"Индекс {self.path} создан для {vectors.shape[1]} измерений {vectors.dtype}, "
+                    f"ожидается {self.dimension} {self.dtype}"
+                )
+            return vectors
+        return np.lib.format.open_memmap(
+            self._vectors_path, mode="w+", dtype=self.dtype, shape=(initial_capacity, self.dimension)
+        )
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._slot_of
+
+    # Согласование процессов
+
+    @contextmanager
+    def _file_lock(self):
+        """Межпроцессная блокировка записи (flock на write.lock), повторно входимая внутри процесса"""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        """Изменение индекса: блокировка записи поверх актуального состояния"""
+        with self._file_lock():
+            self._refresh()
+            yield
+
+    def _generation(self) -> int:
+        return self._db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _next_generation(self) -> int:
+        """Новое поколение; фиксируется вместе с изменением строк items"""
+        self._seen += 1
+        self._db.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (self._seen,))
+        return self._seen
+
+    def _refresh(self):
+        """Подхватить изменения других процессов, если поколение сменилось"""
+        generation = self._generation()
+        if generation != self._seen:
+            self._reload(generation)
+
+    def _reload(self, generation: int):
+        """Перечитать соответствие товар - строка, матрицу (если файл заменен) и коды измененных строк"""
+        rows = self._db.execute("SELECT product_id, slot, generation FROM items").fetchall()
+
+        # Файл читается после строк: строки за пределами старой матрицы есть только в новом файле
+        inode = os.stat(self._vectors_path).st_ino
+        if inode != self._vectors_inode:
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            self._vectors_inode = inode
+            if self._vectors.shape[0] > len(self._ids):
+                self._extend(self._vectors.shape[0])
+
+        self._ids[:] = -1
+        self._slot_of = {}
+        changed = []
+        for product_id, slot, item_generation in rows:
+            self._ids[slot] = product_id
+            self._slot_of[product_id] = slot
+            if item_generation > self._seen:
+                changed.append(slot)
+
+        self._size = max(self._slot_of.values()) + 1 if self._slot_of else 0
+        self._free = [slot for slot in range(self._size) if self._ids[slot] < 0]
+        self._assign[self._ids < 0] = -1
+
+        changed = np.array(sorted(changed), dtype=np.int64)
+        self._encode_slots(changed)
+        if self._centroids is not None and len(changed):
+            self._assign_slots(changed)
+        self._seen = generation
+        self._maybe_train_pq()
+
+    # Изменение
+
+    def _extend(self, capacity: int):
+        """Увеличить массивы процесса (ID, кластеры, коды) до новой емкости матрицы"""
+        old = len(self._ids)
+        self._ids = np.concatenate([self._ids, np.full(capacity - old, -1, dtype=np.int64)])
+        self._assign = np.concatenate([self._assign, np.full(capacity - old, -1, dtype=np.int32)])
+        if self._codes is not None:
+            axis = 0 if self.quantization == "int8" else 1
+            shape = list(self._codes.shape)
+            shape[axis] = capacity - old
+            self._codes = np.concatenate([self._codes, np.zeros(shape, self._codes.dtype)], axis=axis)
+            self._scales = np.concatenate([self._scales, np.zeros(capacity - old, dtype=np.float32)])
+
+    def _grow(self, capacity: int):
+        """Увеличить матрицу: новый файл с копией данных заменяет старый"""
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, self.dimension))
+        grown[:self._size] = self._vectors[:self._size]
+        grown.flush()
+        del grown
+        self._vectors.flush()
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+        self._vectors_inode = os.stat(self._vectors_path).st_ino
+        self._extend(capacity)
+
+    def _allocate_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size >= self._vectors.shape[0]:
+            self._grow(max(self._vectors.shape[0] * 2, 1024))
+        self._size += 1
+        return self._size - 1
+
+    def add(self, items: Sequence[Tuple[int, Sequence[float], Dict[str, Any]]]):
+        """Добавить или заменить векторы: (ID товара, вектор, данные для выдачи)"""
+        if not items:
+            return
+
+        vectors = normalize([vector for _, vector, _ in items])
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Размерность вектора {vectors.shape[1]}, индекс - {self.dimension}")
+
+        with self._writing():
+            generation = self._next_generation()
+            slots = []
+            for product_id, _, _ in items:
+                slot = self._slot_of.get(product_id)
+                if slot is None:
+                    slot = self._allocate_slot()
+                    self._slot_of[product_id] = slot
+                    self._ids[slot] = product_id
+                slots.append(slot)
+
+            slots = np.array(slots)
+            self._vectors[slots] = vectors.astype(self.dtype)
+            self._encode_slots(slots, vectors)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO items (product_id, slot, payload, generation) VALUES (?, ?, ?, ?)",
+                [
+                    (product_id, int(slot), json.dumps(payload, ensure_ascii=False, default=str), generation)
+                    for (product_id, _, payload), slot in zip(items, slots)
+                ]
+            )
+            self._db.commit()
+
+            if self._centroids is not None:
+                self._assign_slots(slots)
+            self._maybe_train()
+
+    def remove(self, product_ids: Iterable[int]) -> int:
+        """Удалить векторы товаров; возвращает число удаленных"""
+        with self._writing():
+            removed, freed = [], []
+            for product_id in product_ids:
+                slot = self._slot_of.pop(product_id, None)
+                if slot is None:
+                    continue
+                self._ids[slot] = -1
+                self._assign[slot] = -1
+                freed.append(slot)
+                removed.append((product_id,))
+
+            if removed:
+                self._next_generation()
+                self._db.executemany("DELETE FROM items WHERE product_id = ?", removed)
+                self._db.commit()
+                # Строки переиспользуются только после фиксации удаления:
+                # другие процессы к этому моменту видят их свободными
+                self._free.extend(freed)
+            return len(removed)
+
+    def flush(self):
+        """Сбросить изменения матрицы, центроиды и коды на диск"""
+        with self._writing():
+            self._vectors.flush()
+            if self._centroids is not None:
+                np.save(self._centroids_path, self._centroids)
+            if self._codes is not None:
+                # Коды пишутся после матрицы: файл кодов не старше матрицы - признак, что они актуальны
+                tmp_path = self._codes_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(
+                        f,
+                        kind=np.array(self.quantization),
+                        codes=self._codes[:self._size] if self.quantization == "int8" else self._codes[:, :self._size],
+                        scales=self._scales[:self._size],
+                        codebooks=self._codebooks if self._codebooks is not None else np.empty(0, dtype=np.float32),
+                        trained_size=np.array(self._pq_trained_size),
+                    )
+                os.replace(tmp_path, self._codes_path)
+
+    # IVF
+
+    def _maybe_train(self):
+        count = len(self)
+        # Переобучение, когда индекс вырос вдвое с прошлого обучения
+        if count >= self.ivf_threshold and (self._centroids is None or count >= 2 * self._trained_size):
+            self.train_ivf()
+        self._maybe_train_pq()
+
+    def train_ivf(self, iterations: int = 10, seed: int = 0):
+        """Кластеризация векторов (сферический k-means по выборке)"""
+        with self._lock:
+            slots = np.nonzero(self._ids[:self._size] >= 0)[0]
+            if len(slots) == 0:
+                return
+            nlist = max(1, min(int(np.sqrt(len(slots))), len(slots)))
+            rng = np.random.default_rng(seed)
+            sample = slots if len(slots) <= nlist * 64 else rng.choice(slots, nlist * 64, replace=False)
+            data = np.asarray(self._vectors[np.sort(sample)], dtype=np.float32)
+
+            centroids = data[rng.choice(len(data), nlist, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                sums[empty] = centroids[empty]
+                centroids = normalize(sums)
+
+            self._centroids = centroids
+            self._assign_slots(slots)
+            self._trained_size = len(slots)
+            logger.info(f"IVF: {nlist} кластеров по {len(slots)} векторам")
+
+    def _assign_slots(self, slots: np.ndarray):
+        for start in range(0, len(slots), BLOCK_ROWS):
+            block = slots[start:start + BLOCK_ROWS]
+            vectors = np.asarray(self._vectors[block], dtype=np.float32)
+            self._assign[block] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+    # Квантование
+
+    def _load_codes(self):
+        """Коды из codes.npz; если матрица менялась после их сохранения - пересчитываются по матрице"""
+        capacity = self._vectors.shape[0]
+        self._codebooks: Optional[np.ndarray] = None
+        self._pq_trained_size = 0
+        if self.quantization == "none":
+            self._codes = self._scales = None
+            return
+
+        # int8 - строка на вектор; pq - строка на подпространство (поиск идет по подпространствам)
+        if self.quantization == "int8":
+            self._codes = np.zeros((capacity, self.dimension), dtype=np.int8)
+        else:
+            self._codes = np.zeros((self.pq_subspaces, capacity), dtype=np.uint8)
+        self._scales = np.zeros(capacity, dtype=np.float32)
+
+        loaded = False
+        if os.path.exists(self._codes_path):
+            fresh = os.path.getmtime(self._codes_path) >= os.path.getmtime(self._vectors_path)
+            with np.load(self._codes_path) as data:
+                codes, size = data["codes"], len(data["scales"])
+                if str(data["kind"]) == self.quantization and codes.ndim == 2 and size <= capacity:
+                    if self.quantization == "int8" and codes.shape[1] == self.dimension:
+                        self._codes[:size] = codes
+                    elif self.quantization == "pq" and len(codes) == self.pq_subspaces:
+                        if data["codebooks"].size:
+                            self._codebooks = data["codebooks"]
+                            self._pq_trained_size = int(data["trained_size"])
+                        self._codes[:, :size] = codes
+                    else:
+                        fresh = False
+                    self._scales[:size] = data["scales"]
+                    loaded = fresh
+
+        if not loaded:
+            self._encode_slots(np.nonzero(self._ids[:self._size] >= 0)[0])
+        self._maybe_train_pq()
+
+    def _quantized(self) -> bool:
+        """Идет ли поиск по кодам (PQ до обучения - точный поиск по матрице)"""
+        return self.quantization == "int8" or self._codebooks is not None
+
+    def _encode_slots(self, slots: np.ndarray, vectors: Optional[np.ndarray] = None):
+        """Пересчитать коды строк slots (vectors - их нормированные векторы, если уже в памяти)"""
+        if not self._quantized() or len(slots) == 0:
+            return
+        for start in range(0, len(slots), BLOCK_ROWS):
+            block = slots[start:start + BLOCK_ROWS]
+            data = (
+                np.asarray(self._vectors[block], dtype=np.float32) if vectors is None
+                else vectors[start:start + BLOCK_ROWS]
+            )
+            if self.quantization == "int8":
+                scales = np.abs(data).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                self._codes[block] = np.round(data / scales[:, None]).astype(np.int8)
+                self._scales[block] = scales
+            else:
+                self._codes[:, block] = self._pq_encode(data).T
+
+    def _pq_encode(self, data: np.ndarray) -> np.ndarray:
+        """Номер ближайшего центроида в каждом подпространстве"""
+        parts = data.reshape(len(data), self.pq_subspaces, -1)
+        codes = np.empty((len(data), self.pq_subspaces), dtype=np.uint8)
+        for part, centroids in enumerate(self._codebooks):
+            # |x - c|^2 без |x|^2, одинакового для всех центроидов
+            distances = (centroids * centroids).sum(axis=1) - 2.0 * parts[:, part] @ centroids.T
+            codes[:, part] = np.argmin(distances, axis=1)
+        return codes
+
+    def _maybe_train_pq(self):
+        if self.quantization != "pq":
+            return
+        count = len(self)
+        if count < PQ_MIN_TRAIN:
+            return
+        if self._codebooks is None or (self._pq_trained_size < PQ_TRAIN_SAMPLE and count >= 2 * self._pq_trained_size):
+            self.train_pq()
+
+    def train_pq(self, iterations: int = 10, seed: int = 0):
+        """Центроиды подпространств PQ (k-means по выборке) и коды всех векторов"""
+        with self._lock:
+            slots = np.nonzero(self._ids[:self._size] >= 0)[0]
+            if len(slots) < PQ_CENTROIDS:
+                return
+            rng = np.random.default_rng(seed)
+            sample = slots if len(slots) <= PQ_TRAIN_SAMPLE else rng.choice(slots, PQ_TRAIN_SAMPLE, replace=False)
+            data = np.asarray(self._vectors[np.sort(sample)], dtype=np.float32)
+            parts = data.reshape(len(data), self.pq_subspaces, -1)
+
+            codebooks = np.empty((self.pq_subspaces, PQ_CENTROIDS, parts.shape[2]), dtype=np.float32)
+            for part in range(self.pq_subspaces):
+                points = parts[:, part]
+                centroids = points[rng.choice(len(points), PQ_CENTROIDS, replace=False)]
+                for _ in range(iterations):
+                    labels = np.argmin((centroids * centroids).sum(axis=1) - 2.0 * points @ centroids.T, axis=1)
+                    # Суммы по кластерам через bincount: измерений в подпространстве мало
+                    sums = np.stack([
+                        np.bincount(labels, weights=points[:, column], minlength=PQ_CENTROIDS)
+                        for column in range(points.shape[1])
+                    ], axis=1)
+                    counts = np.bincount(labels, minlength=PQ_CENTROIDS)
+                    filled = counts > 0
+                    centroids[filled] = sums[filled] / counts[filled, None]
+                codebooks[part] = centroids
+
+            self._codebooks = codebooks
+            self._encode_slots(slots)
+            self._pq_trained_size = len(slots)
+            logger.info(f"PQ: {self.pq_subspaces} подпространств по {len(slots)} векторам")
+
+    # Поиск
+
+    def _candidates(self, query: np.ndarray, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        """Строки для сравнения с запросом: None - вся матрица (точный поиск)"""
+        if self._centroids is None:
+            return None
+        nprobe = min(nprobe or self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return np.nonzero(np.isin(self._assign[:self._size], probes) & (self._ids[:self._size] >= 0))[0]
+
+    def _allowed_slots(self, query: np.ndarray, allowed: Iterable[int], nprobe: Optional[int]) -> np.ndarray:
+        slots = np.fromiter(
+            (slot for slot in map(self._slot_of.get, allowed) if slot is not None), dtype=np.int64
+        )
+        if self._centroids is None or len(slots) <= BLOCK_ROWS:
+            return np.sort(slots)
+        candidates = self._candidates(query, nprobe)
+        return candidates[np.isin(candidates, slots)]
+
+    def _scores(self, slots: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Близость строк к запросу: точная по матрице или приближенная по кодам"""
+        total = self._size if slots is None else len(slots)
+        scores = np.empty(total, dtype=np.float32)
+        step = CODE_BLOCK_ROWS if self.quantization == "int8" else BLOCK_ROWS
+        if self.quantization == "pq" and self._codebooks is not None:
+            # Таблица близостей частей запроса к центроидам: строка - сумма близостей по своим кодам
+            table = np.einsum("pcd,pd->pc", self._codebooks, query.reshape(self.pq_subspaces, -1))
+        for start in range(0, total, step):
+            end = min(start + step, total)
+            rows = slice(start, end) if slots is None else slots[start:end]
+            if self.quantization == "int8":
+                scores[start:end] = (self._codes[rows].astype(np.float32) @ query) * self._scales[rows]
+            elif self._codebooks is not None:
+                block = np.zeros(end - start, dtype=np.float32)
+                for part_table, part_codes in zip(table, self._codes):
+                    block += part_table.take(part_codes[rows])
+                scores[start:end] = block
+            else:
+                scores[start:end] = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+        return scores
+
+    def search(
+        self,
+        query: Sequence[float],
+        limit: int = 20,
+        threshold: float = -1.0,
+        exclude: Iterable[int] = (),
+        nprobe: Optional[int] = None,
+        allowed: Optional[Iterable[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Ближайшие товары: список (ID товара, косинусная близость) по убыванию
+
+        allowed - товары, прошедшие структурные фильтры: сравниваются только
+        их векторы (при IVF - если их меньше блока, иначе пересечение с кластерами)
+        """
+        query = normalize(np.asarray(query, dtype=np.float32))
+        exclude = list(exclude)
+        allowed = list(allowed) if allowed is not None else None
+        with self._lock:
+            for _ in range(SEARCH_ATTEMPTS):
+                self._refresh()
+                result = self._search(query, limit, threshold, exclude, nprobe, allowed)
+                # Индекс изменили во время поиска (строка могла перейти к другому товару) - повтор
+                if self._generation() == self._seen:
+                    break
+            return result
+
+    def _search(
+        self,
+        query: np.ndarray,
+        limit: int,
+        threshold: float,
+        exclude: List[int],
+        nprobe: Optional[int],
+        allowed: Optional[List[int]]
+    ) -> List[Tuple[int, float]]:
+        if allowed is not None:
+            slots = self._allowed_slots(query, allowed, nprobe)
+        else:
+            slots = self._candidates(query, nprobe)
+        ids = self._ids[:self._size].copy() if slots is None else self._ids[slots]
+        if len(ids) == 0:
+            return []
+        scores = self._scores(slots, query)
+
+        scores[ids < 0] = -np.inf
+        if exclude:
+            scores[np.isin(ids, exclude)] = -np.inf
+
+        if self._quantized():
+            # Точный пересчет лучших по кодам: читаются только их строки матрицы
+            k = min(limit * self.rerank, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.isfinite(scores[top])]
+            rows = np.sort(top if slots is None else slots[top])
+            ids = self._ids[rows]
+            scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            if len(ids) == 0:
+                return []
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(ids[i]), float(scores[i]))
+            for i in top if scores[i] > threshold
+        ]
+
+    def get_vector(self, product_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            self._refresh()
+            slot = self._slot_of.get(product_id)
+            if slot is None:
+                return None
+            return np.asarray(self._vectors[slot], dtype=np.float32)
+
+    def payloads(self, product_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        """Данные для выдачи по ID товаров"""
+        if not product_ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT product_id, payload FROM items WHERE product_id IN ({','.join('?' * len(product_ids))})",
+                list(product_ids)
+            ).fetchall()
+        return {product_id: json.loads(payload) for product_id, payload in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        if self._quantized():
+            bytes_per_vector = self.dimension + 4 if self.quantization == "int8" else self.pq_subspaces
+        else:
+            bytes_per_vector = self.dimension * self.dtype.itemsize
+        return {
+            "vectors": len(self),
+            "capacity": int(self._vectors.shape[0]),
+            "dtype": str(self.dtype),
+            "ivf_lists": 0 if self._centroids is None else int(len(self._centroids)),
+            "quantization": self.quantization if self._quantized() else "none",
+            # Байт на вектор, которые перебирает поиск (коды в памяти или строки матрицы)
+            "bytes_per_vector": bytes_per_vector,
+        }
@@ -4,38 +4,115 @@
 """
 
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+import functools
+from typing import List, Dict, Any, Optional, Tuple, Callable, Sequence
 import json
 import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
 
-import openai
-from supabase import create_client, Client
 import httpx
 
-from app.core.config import settings
+from app.database import SessionLocal, settings
+from app.services.embedding_cache import EmbeddingCache, create_embedding_cache, text_hash
+from app.services.embedding_provider import EmbeddingProvider, create_embedding_provider
+from app.services.query_embedding_cache import create_query_embedding_cache
+from app.services.search_analytics import search_analytics, search_analytics_report
+from app.services.vector_store import VectorStore, create_store_executor, create_vector_store
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class IndexingReport:
+    """Ход массовой индексации"""
+    total: int = 0
+    embedded: int = 0  # Получено через API
+    cached: int = 0  # Взято из кеша
+    upserted: int = 0
+    failed: int = 0
+    api_requests: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.embedded + self.cached + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'total': self.total,
+            'embedded': self.embedded,
+            'cached': self.cached,
+            'upserted': self.upserted,
+            'failed': self.failed,
+            'api_requests': self.api_requests,
+            'elapsed_seconds': round(self.elapsed, 2),
+        }
+
+
+def product_embedding_data(product) -> Dict[str, Any]:
+    """Данные товара из модели Product в формате сервиса векторного поиска"""
+    return {
+        'id': product.id,
+        'article': product.sku,
+        'name': product.name,
+        'description': product.description or '',
+        'category_name': product.category.name if product.category else '',
+        'price': product.price or 0,
+        'power': product.power_watts,
+        'luminous_flux': product.luminous_flux,
+        'color_temperature': product.color_temperature,
+    }
+
+
+def _estimate_tokens(text: str) -> int:
+    # Грубая оценка сверху: для кириллицы токен не короче 2 байт UTF-8
+    return len(text.encode('utf-8')) // 2 + 1
+
+
 class VectorSearchService:
     """Сервис для работы с векторным поиском товаров"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vector_store: Optional[VectorStore] = None,
+        embedding_provider: Optional[EmbeddingProvider] = None
+    ):
         """Инициализация сервиса"""
         try:
-            # Подключение к Supabase
-            self.supabase: Client = create_client(
-                settings.SUPABASE_URL,
-                settings.SUPABASE_SERVICE_KEY
+            # Поставщик embedding'ов (OpenAI API или локальная модель)
+            self.embedding_provider = embedding_provider or create_embedding_provider(
+                openai_api_key=settings.openai_api_key
             )
             
-            # Настройка OpenAI
-            openai.api_key = settings.OPENAI_API_KEY
-            
             # Параметры embedding
-            self.embedding_model = "text-embedding-ada-002"
-            self.embedding_dimension = 1536
+            self.embedding_model = self.embedding_provider.model
+            self.embedding_dimension = self.embedding_provider.dimension
+            
+            # Кеш embedding'ов по хешу текста: неизменный текст товара не отправляется в API повторно
+            self.embedding_cache = embedding_cache or create_embedding_cache()
+            
+            # Кеш embedding'ов запросов: популярные запросы не отправляются в API повторно
+            self.query_cache = create_query_embedding_cache()
+            
+            # Максимум результатов одного запроса к хранилищу при поиске с фильтрами
+            self.max_overfetch = 2000
+            
+            # Хранилище векторов для поиска (Supabase или локальный индекс);
+            # клиент Supabase создается только для хранилища supabase
+            self.vector_store = vector_store or create_vector_store(self.embedding_dimension)
+            
+            # Синхронные клиенты хранилищ работают в отдельном пуле потоков,
+            # чтобы сетевой запрос не блокировал цикл событий воркера
+            self.store_executor = create_store_executor()
             
             logger.info("VectorSearchService успешно инициализирован")
             
@@ -57,44 +134,118 @@ class VectorSearchService:
             # Формируем богатый текст для embedding
             text_for_embedding = self._prepare_text_for_embedding(product_data)
             
-            # Создаем embedding через OpenAI
-            embedding = await self._create_openai_embedding(text_for_embedding)
-            
-            # Подготавливаем технические характеристики
-            technical_specs = self._extract_technical_specs(product_data)
-            
-            # Подготавливаем метаданные
-            metadata = {
-                'price': float(product_data.get('price', 0)),
-                'b2b_price': float(product_data.get('b2b_price', 0)),
-                'stock_quantity': product_data.get('stock_quantity', 0),
-                'weight': float(product_data.get('weight', 0)),
-                'dimensions': product_data.get('dimensions', ''),
-                'warranty_years': product_data.get('warranty_years', 0),
-                'is_featured': product_data.get('is_featured', False),
-                'tags': product_data.get('tags', '').split(',') if product_data.get('tags') else []
-            }
-            
-            # Сохраняем в Supabase
-            result = self.supabase.table('product_embeddings').upsert({
-                'product_id': product_data['id'],
-                'article': product_data['article'],
-                'product_name': product_data['name'],
-                'description': product_data.get('description', ''),
-                'category_name': product_data.get('category_name', ''),
-                'technical_specs': technical_specs,
-                'embedding': embedding,
-                'metadata': metadata,
-                'updated_at': datetime.now().isoformat()
-            }, on_conflict='product_id').execute()
+            # Создаем embedding (через кеш, поставщик только для нового текста)
+            embedding = await self._embed_text(text_for_embedding)
+            
+            # Сохраняем в хранилище векторов
+            row = self._embedding_row(product_data, embedding)
+            await self._store_call(self.vector_store.upsert, [row])
+            await self._store_call(self.vector_store.flush)
             
             logger.info(f"Создан embedding для товара {product_data['article']}")
-            return result.data[0] if result.data else {}
+            return row
             
         except Exception as e:
             logger.error(f"Ошибка создания embedding для товара {product_data.get('article', 'unknown')}: {e}")
             raise
 
+    async def index_products(
+        self,
+        products: List[Dict[str, Any]],
+        batch_size: int = 128,
+        max_batch_tokens: int = 100_000,
+        concurrency: int = 4,
+        upsert_chunk: int = 200,
+        max_retries: int = 5,
+        store: bool = True,
+        progress: Optional[Callable[[IndexingReport], None]] = None
+    ) -> IndexingReport:
+        """
+        Массовая индексация товаров
+        
+        Тексты без embedding в кеше группируются в запросы к API по batch_size
+        входов и не больше max_batch_tokens токенов, запросы идут параллельно
+        (не больше concurrency одновременно) с повтором и экспоненциальной
+        задержкой, векторы записываются в хранилище пачками по upsert_chunk.
+        
+        Args:
+            products: Данные товаров
+            store: Записывать векторы в хранилище (иначе только прогрев кеша)
+            progress: Вызывается после каждого запроса к API и записи пачки
+            
+        Returns:
+            Отчет об индексации
+        """
+        report = IndexingReport(total=len(products))
+        prepared = []
+        for product_data in products:
+            text = self._prepare_text_for_embedding(product_data)
+            prepared.append((product_data, text, text_hash(text)))
+
+        vectors: Dict[str, List[float]] = {}
+        if self.embedding_cache is not None:
+            vectors = await self._store_call(
+                self.embedding_cache.get_many, self.embedding_model, [key for _, _, key in prepared]
+            )
+
+        # Одинаковые тексты разных товаров запрашиваются один раз
+        pending: Dict[str, str] = {}
+        owners: Dict[str, int] = {}
+        for _, text, key in prepared:
+            if key in vectors:
+                report.cached += 1
+            else:
+                pending.setdefault(key, text)
+                owners[key] = owners.get(key, 0) + 1
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def embed_batch(batch: List[Tuple[str, str]]):
+            async with semaphore:
+                try:
+                    embeddings = await self._create_embeddings_with_retry(
+                        [text for _, text in batch], max_retries, report
+                    )
+                except Exception as e:
+                    logger.error(f"Не удалось получить embedding для {len(batch)} текстов: {e}")
+                    report.failed += sum(owners[key] for key, _ in batch)
+                    return
+
+            batch_vectors = {key: embedding for (key, _), embedding in zip(batch, embeddings)}
+            vectors.update(batch_vectors)
+            report.embedded += sum(owners[key] for key in batch_vectors)
+            if self.embedding_cache is not None:
+                try:
+                    await self._store_call(
+                        self.embedding_cache.put_many, self.embedding_model, list(batch_vectors.items())
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка записи в кеш embedding'ов: {e}")
+            if progress:
+                progress(report)
+
+        await asyncio.gather(*(
+            embed_batch(batch) for batch in self._make_batches(list(pending.items()), batch_size, max_batch_tokens)
+        ))
+
+        if store:
+            rows = [
+                self._embedding_row(product_data, vectors[key])
+                for product_data, _, key in prepared if key in vectors
+            ]
+            for start in range(0, len(rows), upsert_chunk):
+                chunk = rows[start:start + upsert_chunk]
+                try:
+                    report.upserted += await self._store_call(self.vector_store.upsert, chunk)
+                except Exception as e:
+                    logger.error(f"Ошибка записи пачки из {len(chunk)} embedding'ов: {e}")
+                if progress:
+                    progress(report)
+            await self._store_call(self.vector_store.flush)
+
+        logger.info(f"Индексация завершена: {report.as_dict()}")
+        return report
+
     async def search_products(
         self, 
         query: str, 
@@ -114,25 +265,26 @@ class VectorSearchService:
         Returns:
             Список найденных товаров с показателями релевантности
         """
+        started = time.perf_counter()
         try:
             # Создаем embedding для поискового запроса
-            query_embedding = await self._create_openai_embedding(query)
-            
-            # Выполняем поиск в Supabase
-            result = self.supabase.rpc('search_similar_products', {
-                'query_embedding': query_embedding,
-                'match_threshold': threshold,
-                'match_count': limit
-            }).execute()
-            
-            search_results = result.data or []
+            query_embedding = await self.embed_query(query)
             
-            # Применяем дополнительные фильтры если есть
+            # Структурные фильтры применяются до поиска: кандидаты только из подходящих товаров
+            allowed_ids, selectivity = None, 1.0
             if filters:
-                search_results = self._apply_filters(search_results, filters)
+                from app.services.hybrid_search import allowed_product_ids
+                allowed_ids, selectivity = await asyncio.to_thread(allowed_product_ids, filters)
+            
+            # Выполняем поиск в хранилище векторов
+            search_results = await self.search_candidates(
+                query_embedding, limit, threshold, allowed_ids, selectivity
+            )
             
             # Логируем поисковый запрос для аналитики
-            await self._log_search_query(query, query_embedding, len(search_results))
+            await self._log_search_query(
+                query, query_embedding, len(search_results), latency_ms=(time.perf_counter() - started) * 1000
+            )
             
             logger.info(f"Найдено {len(search_results)} товаров по запросу: {query}")
             return search_results
@@ -141,6 +293,44 @@ class VectorSearchService:
             logger.error(f"Ошибка поиска товаров по запросу '{query}': {e}")
             return []
 
+    async def embed_query(self, query: str) -> List[float]:
+        """Embedding поискового запроса (через кеш запросов)"""
+        return await self.query_cache.get_or_create(self.embedding_model, query, self._create_embedding)
+
+    async def search_candidates(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        threshold: float = 0.0,
+        allowed_ids: Optional[Sequence[int]] = None,
+        selectivity: float = 1.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Ближайшие товары, при allowed_ids - только среди них
+        
+        Если хранилище не умеет искать по подмножеству, запрашивается
+        больше результатов с учетом доли подходящих товаров (selectivity),
+        и запас увеличивается, пока после фильтрации не наберется limit.
+        """
+        if allowed_ids is None:
+            return await self._store_call(self.vector_store.search, query_embedding, threshold, limit)
+        allowed_ids = [int(product_id) for product_id in allowed_ids]
+        if not allowed_ids:
+            return []
+        if self.vector_store.supports_prefilter:
+            return await self._store_call(self.vector_store.search, query_embedding, threshold, limit, allowed_ids)
+        
+        allowed = set(allowed_ids)
+        fetch = min(int(limit / max(selectivity, 1e-3) * 1.5) + limit, self.max_overfetch)
+        while True:
+            results = await self._store_call(self.vector_store.search, query_embedding, threshold, fetch)
+            matched = [item for item in results if item['product_id'] in allowed]
+            if len(matched) >= limit or len(results) < fetch or fetch >= self.max_overfetch:
+                return matched[:limit]
+            # Среди ближайших подходящих меньше ожидаемого - увеличиваем запас
+            observed = len(matched) / len(results)
+            fetch = min(max(fetch * 2, int(limit / max(observed, 1e-3) * 1.5)), self.max_overfetch)
+
     async def get_product_recommendations(
         self, 
         product_id: int, 
@@ -159,20 +349,20 @@ class VectorSearchService:
             Список рекомендованных товаров
         """
         try:
-            result = self.supabase.rpc('get_product_recommendations', {
-                'target_product_id': product_id,
-                'recommendation_count': limit
-            }).execute()
+            # Заранее посчитанные соседи (product_relations): поиск по словарю без запроса к хранилищу
+            precomputed = await asyncio.to_thread(self._precomputed_recommendations, product_id, limit, exclude_same_category)
+            if precomputed is not None:
+                return precomputed
             
-            recommendations = result.data or []
+            recommendations = await self._store_call(self.vector_store.recommendations, product_id, limit)
             
             # Фильтруем по категориям если нужно
             if exclude_same_category and recommendations:
                 # Получаем категорию исходного товара
-                target_product = self.supabase.table('product_embeddings').select('category_name').eq('product_id', product_id).execute()
+                target_product = await self._store_call(self.vector_store.get, product_id)
                 
-                if target_product.data:
-                    target_category = target_product.data[0]['category_name']
+                if target_product:
+                    target_category = target_product['category_name']
                     recommendations = [
                         rec for rec in recommendations 
                         if rec.get('category_name') != target_category
@@ -185,6 +375,49 @@ class VectorSearchService:
             logger.error(f"Ошибка получения рекомендаций для товара {product_id}: {e}")
             return []
 
+    @staticmethod
+    def _precomputed_recommendations(
+        product_id: int, limit: int, exclude_same_category: bool
+    ) -> Optional[List[Dict[str, Any]]]:
+        from app.services.related_products import related_products
+
+        db = SessionLocal()
+        try:
+            return related_products.get(db, product_id, limit, exclude_same_category)
+        finally:
+            db.close()
+
+    async def get_product_vectors(self, products: List[Dict[str, Any]]) -> Dict[int, List[float]]:
+        """
+        Embedding'и текущих текстов товаров по ID
+        
+        Берутся из кеша embedding'ов; тексты, которых там нет, отправляются
+        в API пачками (как при массовой индексации) и кешируются.
+        """
+        keys = {}
+        texts = {}
+        for product_data in products:
+            text = self._prepare_text_for_embedding(product_data)
+            key = text_hash(text)
+            keys[product_data['id']] = key
+            texts[key] = text
+
+        vectors: Dict[str, List[float]] = {}
+        if self.embedding_cache is not None:
+            vectors = await self._store_call(self.embedding_cache.get_many, self.embedding_model, list(texts))
+
+        pending = [(key, text) for key, text in texts.items() if key not in vectors]
+        for batch in self._make_batches(pending, 128, 100_000):
+            embeddings = await self._create_embeddings_with_retry(
+                [text for _, text in batch], 5, IndexingReport()
+            )
+            batch_vectors = {key: embedding for (key, _), embedding in zip(batch, embeddings)}
+            vectors.update(batch_vectors)
+            if self.embedding_cache is not None:
+                await self._store_call(self.embedding_cache.put_many, self.embedding_model, list(batch_vectors.items()))
+
+        return {product_id: vectors[key] for product_id, key in keys.items()}
+
     async def get_similar_by_specs(
         self, 
         technical_specs: Dict[str, Any], 
@@ -193,6 +426,9 @@ class VectorSearchService:
         """
         Поиск товаров по техническим характеристикам
         
+        Ближайшие по числовым характеристикам (app.services.spec_search),
+        локально и без запроса embedding'а.
+        
         Args:
             technical_specs: Технические характеристики
             limit: Количество результатов
@@ -201,36 +437,47 @@ class VectorSearchService:
             Список похожих товаров
         """
         try:
-            # Формируем запрос для поиска по техническим характеристикам
-            query_parts = []
-            
-            if technical_specs.get('power'):
-                query_parts.append(f"мощность {technical_specs['power']} ватт")
-            
-            if technical_specs.get('luminous_flux'):
-                query_parts.append(f"световой поток {technical_specs['luminous_flux']} люмен")
-                
-            if technical_specs.get('color_temperature'):
-                query_parts.append(f"цветовая температура {technical_specs['color_temperature']} кельвин")
-                
-            if technical_specs.get('protection_rating'):
-                query_parts.append(f"степень защиты {technical_specs['protection_rating']}")
-                
-            if technical_specs.get('installation_area'):
-                query_parts.append(f"для {technical_specs['installation_area']}")
-            
-            query = " ".join(query_parts)
-            
-            if not query:
-                return []
-            
-            # Выполняем поиск
-            return await self.search_products(query, limit=limit, threshold=0.6)
+            return await asyncio.to_thread(self._similar_by_specs, technical_specs, limit)
             
         except Exception as e:
             logger.error(f"Ошибка поиска по техническим характеристикам: {e}")
             return []
 
+    @staticmethod
+    def _similar_by_specs(technical_specs: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        from sqlalchemy.orm import joinedload
+
+        from app.models import Product
+        from app.services.hybrid_search import SearchFilters
+        from app.services.spec_search import SpecQuery, spec_index, spec_similarity
+
+        query = SpecQuery.from_dict(technical_specs)
+        if query.is_empty():
+            return []
+
+        db = SessionLocal()
+        try:
+            filters = SearchFilters(category_id=technical_specs.get('category_id'))
+            matches = spec_index.similar(db, query, limit, filters=filters)
+            ids = [product_id for product_id, _ in matches]
+            products = {
+                product.id: product
+                for product in db.query(Product).options(joinedload(Product.category)).filter(Product.id.in_(ids))
+            } if ids else {}
+            return [
+                {
+                    'product_id': product_id,
+                    'article': products[product_id].sku,
+                    'product_name': products[product_id].name,
+                    'category_name': products[product_id].category.name if products[product_id].category else '',
+                    'similarity': spec_similarity(distance),
+                    'distance': distance,
+                }
+                for product_id, distance in matches if product_id in products
+            ]
+        finally:
+            db.close()
+
     async def update_product_embedding(self, product_id: int, product_data: Dict[str, Any]) -> bool:
         """
         Обновление embedding существующего товара
@@ -243,11 +490,8 @@ class VectorSearchService:
             Успешность обновления
         """
         try:
-            # Удаляем старый embedding
-            self.supabase.table('product_embeddings').delete().eq('product_id', product_id).execute()
-            
-            # Создаем новый
-            await self.create_product_embedding(product_data)
+            # Запись на месте (upsert по product_id): между удалением и созданием товар не пропадает из поиска
+            await self.create_product_embedding({**product_data, 'id': product_id})
             
             logger.info(f"Обновлен embedding для товара {product_id}")
             return True
@@ -267,7 +511,8 @@ class VectorSearchService:
             Успешность удаления
         """
         try:
-            result = self.supabase.table('product_embeddings').delete().eq('product_id', product_id).execute()
+            await self._store_call(self.vector_store.delete, product_id)
+            await self._store_call(self.vector_store.flush)
             
             logger.info(f"Удален embedding для товара {product_id}")
             return True
@@ -284,42 +529,24 @@ class VectorSearchService:
             days: Количество дней для анализа
             
         Returns:
-            Статистика поисковых запросов
+            Статистика поисковых запросов (из дневных сверток, см. search_analytics_report)
         """
+        def report() -> Dict[str, Any]:
+            db = SessionLocal()
+            try:
+                return search_analytics_report(db, days)
+            finally:
+                db.close()
+
         try:
-            # Получаем данные за период
-            from_date = (datetime.now() - timedelta(days=days)).isoformat()
-            
-            result = self.supabase.table('search_analytics').select('*').gte('created_at', from_date).execute()
-            
-            analytics_data = result.data or []
-            
-            # Анализируем данные
-            total_searches = len(analytics_data)
-            unique_queries = len(set(item['search_query'] for item in analytics_data))
-            avg_results = sum(item['results_count'] for item in analytics_data) / total_searches if total_searches > 0 else 0
-            
-            # Топ запросы
-            query_counts = {}
-            for item in analytics_data:
-                query = item['search_query']
-                query_counts[query] = query_counts.get(query, 0) + 1
-            
-            top_queries = sorted(query_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-            
-            return {
-                'total_searches': total_searches,
-                'unique_queries': unique_queries,
-                'average_results': round(avg_results, 2),
-                'top_queries': top_queries,
-                'period_days': days
-            }
+            return await asyncio.to_thread(report)
             
         except Exception as e:
             logger.error(f"Ошибка получения аналитики поиска: {e}")
             return {}
 
-    def _prepare_text_for_embedding(self, product_data: Dict[str, Any]) -> str:
+    @staticmethod
+    def _prepare_text_for_embedding(product_data: Dict[str, Any]) -> str:
         """Подготовка текста для создания embedding"""
         parts = []
         
@@ -403,6 +630,50 @@ class VectorSearchService:
         
         return "\n".join(parts)
 
+    def _embedding_row(self, product_data: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+        """Строка таблицы product_embeddings"""
+        metadata = {
+            'price': float(product_data.get('price', 0)),
+            'b2b_price': float(product_data.get('b2b_price', 0)),
+            'stock_quantity': product_data.get('stock_quantity', 0),
+            'weight': float(product_data.get('weight', 0)),
+            'dimensions': product_data.get('dimensions', ''),
+            'warranty_years': product_data.get('warranty_years', 0),
+            'is_featured': product_data.get('is_featured', False),
+            'tags': product_data.get('tags', '').split(',') if product_data.get('tags') else []
+        }
+        
+        return {
+            'product_id': product_data['id'],
+            'article': product_data['article'],
+            'product_name': product_data['name'],
+            'description': product_data.get('description', ''),
+            'category_name': product_data.get('category_name', ''),
+            'technical_specs': self._extract_technical_specs(product_data),
+            'embedding': embedding,
+            'metadata': metadata,
+            'updated_at': datetime.now().isoformat()
+        }
+
+    @staticmethod
+    def _make_batches(
+        items: List[Tuple[str, str]], batch_size: int, max_batch_tokens: int
+    ) -> List[List[Tuple[str, str]]]:
+        """Разбить пары (хеш, текст) на запросы к API в пределах лимитов"""
+        batches = []
+        batch: List[Tuple[str, str]] = []
+        tokens = 0
+        for key, text in items:
+            text_tokens = _estimate_tokens(text)
+            if batch and (len(batch) >= batch_size or tokens + text_tokens > max_batch_tokens):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += text_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
     def _extract_technical_specs(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
         """Извлечение технических характеристик"""
         return {
@@ -426,65 +697,97 @@ class VectorSearchService:
             'installation_area': product_data.get('installation_area'),
         }
 
-    async def _create_openai_embedding(self, text: str) -> List[float]:
-        """Создание embedding через OpenAI API"""
+    async def _store_call(self, func: Callable, *args) -> Any:
+        """Вызов синхронного клиента хранилища в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.store_executor, functools.partial(func, *args))
+
+    def close(self):
+        """Остановить пул потоков хранилищ и пул процессов локальной модели"""
+        self.store_executor.shutdown(wait=False)
+        self.embedding_provider.close()
+
+    async def _embed_text(self, text: str) -> List[float]:
+        """Embedding текста товара: сначала кеш, при промахе поставщик embedding'ов"""
+        if self.embedding_cache is not None:
+            cached = await self._store_call(self.embedding_cache.get, self.embedding_model, text)
+            if cached is not None:
+                return cached
+
+        embedding = await self._create_embedding(text)
+
+        if self.embedding_cache is not None:
+            try:
+                await self._store_call(self.embedding_cache.put, self.embedding_model, text, embedding)
+            except Exception as e:
+                logger.error(f"Ошибка записи в кеш embedding'ов: {e}")
+        return embedding
+
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша embedding'ов (попадания, промахи, hit rate)"""
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.stats()}
+
+    def get_query_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша запросов (hit rate, объединенные запросы, сэкономленное время)"""
+        return self.query_cache.stats()
+
+    async def _create_embedding(self, text: str) -> List[float]:
+        """Создание embedding через поставщика (OpenAI API или локальная модель)"""
         try:
-            response = await openai.Embedding.acreate(
-                model=self.embedding_model,
-                input=text
-            )
-            
-            return response['data'][0]['embedding']
+            return (await self.embedding_provider.embed([text]))[0]
             
         except Exception as e:
-            logger.error(f"Ошибка создания OpenAI embedding: {e}")
+            logger.error(f"Ошибка создания embedding ({self.embedding_provider.name}): {e}")
             raise
 
-    def _apply_filters(
-        self, 
-        search_results: List[Dict[str, Any]], 
-        filters: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Применение дополнительных фильтров к результатам поиска"""
-        filtered_results = search_results
-        
-        # Фильтр по категории
-        if filters.get('category'):
-            filtered_results = [
-                item for item in filtered_results 
-                if item.get('category_name', '').lower() == filters['category'].lower()
-            ]
-        
-        # Фильтр по мощности
-        if filters.get('power_min') or filters.get('power_max'):
-            power_min = filters.get('power_min', 0)
-            power_max = filters.get('power_max', float('inf'))
-            
-            # Здесь нужно получить дополнительные данные из основной БД
-            # Пока пропускаем этот фильтр
-        
-        return filtered_results
+    async def _create_embeddings_with_retry(
+        self, texts: List[str], max_retries: int, report: IndexingReport
+    ) -> List[List[float]]:
+        """Запрос к поставщику с повтором и экспоненциальной задержкой (лимиты, сетевые ошибки)"""
+        attempt = 0
+        while True:
+            report.api_requests += 1
+            try:
+                return await self.embedding_provider.embed(texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                delay = min(2 ** attempt, 60) * random.uniform(0.5, 1.0)
+                logger.warning(f"Ошибка запроса embedding ({len(texts)} текстов), повтор через {delay:.1f} с: {e}")
+                await asyncio.sleep(delay)
 
     async def _log_search_query(
         self, 
         query: str, 
         query_embedding: List[float], 
         results_count: int,
-        user_session: Optional[str] = None
+        user_session: Optional[str] = None,
+        latency_ms: Optional[float] = None
     ):
-        """Логирование поискового запроса для аналитики"""
+        """Логирование поискового запроса для аналитики (буфер, запись в фоне)"""
         try:
-            self.supabase.table('search_analytics').insert({
-                'user_session': user_session or 'anonymous',
-                'search_query': query,
-                'search_embedding': query_embedding,
-                'results_count': results_count,
-                'created_at': datetime.now().isoformat()
-            }).execute()
+            search_analytics.record(
+                query, query_embedding, results_count, user_session, mode='vector', latency_ms=latency_ms
+            )
             
         except Exception as e:
             logger.warning(f"Ошибка логирования поискового запроса: {e}")
 
 
-# Глобальный экземпляр сервиса
-vector_search_service = VectorSearchService()
\ No newline at end of file
+# Глобальный экземпляр сервиса: создается при первом обращении, а не при импорте,
+# чтобы импорт модуля не требовал ключей API и доступа к хранилищу
+_vector_search_service: Optional[VectorSearchService] = None
+_vector_search_service_lock = threading.Lock()
+
+
+def get_vector_search_service() -> VectorSearchService:
+    """Общий экземпляр VectorSearchService (создается один раз)"""
+    global _vector_search_service
+    if _vector_search_service is None:
+        with _vector_search_service_lock:
+            if _vector_search_service is None:
+                _vector_search_service = VectorSearchService()
+    return _vector_search_service
@@ -0,0 +1,183 @@
+"""
+Хранилища векторов товаров для сервиса векторного поиска
+- supabase: таблица product_embeddings и RPC search_similar_products /
+  get_product_recommendations (pgvector);
+- local: локальный индекс в отображаемой в память матрице, поиск без
+  сетевых запросов (с квантованием int8/pq - по компактным кодам в памяти)
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+# Поля строки product_embeddings, которые возвращаются в результатах поиска
+RESULT_FIELDS = ("article", "product_name", "category_name")
+
+
+class VectorStore:
+    """Хранилище векторов: запись, удаление и поиск ближайших товаров"""
+
+    name = "base"
+    # Умеет ли хранилище искать только среди заданных товаров (иначе - дозапрос с фильтрацией)
+    supports_prefilter = False
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        """Записать строки product_embeddings (с полем embedding)"""
+        raise NotImplementedError
+
+    def delete(self, product_id: int):
+        raise NotImplementedError
+
+    def search(
+        self, query_embedding: List[float], threshold: float, limit: int, allowed_ids: Optional[Sequence[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Товары с близостью выше threshold: поля RESULT_FIELDS, product_id и similarity
+
+        allowed_ids учитывается только при supports_prefilter
+        """
+        raise NotImplementedError
+
+    def recommendations(self, product_id: int, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get(self, product_id: int) -> Optional[Dict[str, Any]]:
+        """Строка товара без вектора"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Сохранить накопленные изменения (для локальных хранилищ)"""
+
+
+class SupabaseVectorStore(VectorStore):
+    """Векторы в Supabase (pgvector)"""
+
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        self.client.table('product_embeddings').upsert(rows, on_conflict='product_id').execute()
+        return len(rows)
+
+    def delete(self, product_id: int):
+        self.client.table('product_embeddings').delete().eq('product_id', product_id).execute()
+
+    def search(
+        self, query_embedding: List[float], threshold: float, limit: int, allowed_ids: Optional[Sequence[int]] = None
+    ) -> List[Dict[str, Any]]:
+        result = self.client.rpc('search_similar_products', {
+            'query_embedding': query_embedding,
+            'match_threshold': threshold,
+            'match_count': limit
+        }).execute()
+        return result.data or []
+
+    def recommendations(self, product_id: int, limit: int) -> List[Dict[str, Any]]:
+        result = self.client.rpc('get_product_recommendations', {
+            'target_product_id': product_id,
+            'recommendation_count': limit
+        }).execute()
+        return result.data or []
+
+    def get(self, product_id: int) -> Optional[Dict[str, Any]]:
+        result = self.client.table('product_embeddings').select(
+            'product_id, article, product_name, description, category_name, technical_specs, metadata'
+        ).eq('product_id', product_id).execute()
+        return result.data[0] if result.data else None
+
+
+class LocalVectorStore(VectorStore):
+    """Векторы в локальном индексе (app.services.vector_index)"""
+
+    name = "local"
+    supports_prefilter = True
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        self.index.add([
+            (row['product_id'], row['embedding'], {key: value for key, value in row.items() if key != 'embedding'})
+            for row in rows
+        ])
+        return len(rows)
+
+    def delete(self, product_id: int):
+        self.index.remove([product_id])
+
+    def _results(self, matches) -> List[Dict[str, Any]]:
+        payloads = self.index.payloads([product_id for product_id, _ in matches])
+        results = []
+        for product_id, similarity in matches:
+            payload = payloads.get(product_id, {})
+            result = {'product_id': product_id}
+            result.update({field: payload.get(field) for field in RESULT_FIELDS})
+            result['similarity'] = similarity
+            results.append(result)
+        return results
+
+    def search(
+        self, query_embedding: List[float], threshold: float, limit: int, allowed_ids: Optional[Sequence[int]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._results(
+            self.index.search(query_embedding, limit=limit, threshold=threshold, allowed=allowed_ids)
+        )
+
+    def recommendations(self, product_id: int, limit: int) -> List[Dict[str, Any]]:
+        vector = self.index.get_vector(product_id)
+        if vector is None:
+            return []
+        return self._results(self.index.search(vector, limit=limit, exclude=[product_id]))
+
+    def get(self, product_id: int) -> Optional[Dict[str, Any]]:
+        return self.index.payloads([product_id]).get(product_id)
+
+    def flush(self):
+        self.index.flush()
+
+
+def create_supabase_client():
+    """Клиент Supabase из настроек (пакет supabase нужен только для этого хранилища)"""
+    from supabase import create_client
+
+    if not settings.supabase_url or not settings.supabase_service_key:
+        raise RuntimeError("Для VECTOR_SEARCH_BACKEND=supabase нужны SUPABASE_URL и SUPABASE_SERVICE_KEY")
+    return create_client(settings.supabase_url, settings.supabase_service_key)
+
+
+def create_vector_store(
+    dimension: int, backend: str = settings.vector_search_backend, supabase_client=None
+) -> VectorStore:
+    """Хранилище векторов по настройке VECTOR_SEARCH_BACKEND"""
+    if backend == "local":
+        from app.services.vector_index import LocalVectorIndex
+
+        return LocalVectorStore(LocalVectorIndex(
+            settings.vector_index_path,
+            dimension,
+            dtype=settings.vector_index_dtype,
+            ivf_threshold=settings.vector_index_ivf_threshold,
+            nprobe=settings.vector_index_nprobe,
+            quantization=settings.vector_index_quantization,
+            pq_subspaces=settings.vector_index_pq_subspaces or None,
+            rerank=settings.vector_index_rerank
+        ))
+    return SupabaseVectorStore(supabase_client or create_supabase_client())
+
+
+def create_store_executor() -> ThreadPoolExecutor:
+    """
+    Пул потоков для синхронных клиентов хранилищ (Supabase, SQLite)
+
+    Клиент Supabase один на процесс и переиспользует соединения своего
+    HTTP-пула, поэтому размер пула ограничивает и число соединений.
+    """
+    return ThreadPoolExecutor(max_workers=settings.vector_store_workers, thread_name_prefix="vector-store")
@@ -1,16 +1,17 @@
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from app.database import get_db, settings
-from app.models import User
+from app.models import User, RefreshToken
 from app.schemas import TokenData
-
-# Настройки шифрования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.token_revocation import token_revocation
+from app.utils.passwords import pwd_context, password_hasher, PasswordHasherBusy
+from app.utils.principal_cache import token_cache, principal_cache, UserSnapshot
 
 # Bearer token схема
 security = HTTPBearer()
@@ -31,43 +32,174 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    """Аутентификация пользователя"""
-    user = db.query(User).filter(User.email == email).first()
+def create_refresh_token(db: Session, user: User, family_id: Optional[str] = None) -> RefreshToken:
+    """
+    Создать refresh токен (commit выполняет вызывающий код)
+    
+    family_id объединяет все токены одной сессии: при ротации он сохраняется,
+    а при повторном использовании старого токена отзывается вся сессия.
+    """
+    refresh_token = RefreshToken(
+        jti=uuid.uuid4().hex,
+        user_id=user.id,
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days)
+    )
+    db.add(refresh_token)
+    return refresh_token
+
+def encode_refresh_token(refresh_token: RefreshToken, email: str) -> str:
+    return jwt.encode(
+        {"sub": email, "jti": refresh_token.jti, "sid": refresh_token.family_id,
+         "exp": refresh_token.expires_at, "type": "refresh"},
+        settings.secret_key,
+        algorithm=settings.algorithm
+    )
+
+def issue_tokens(db: Session, user: User, family_id: Optional[str] = None) -> dict:
+    """Выдать пару access + refresh токенов (commit выполняет вызывающий код)"""
+    refresh_token = create_refresh_token(db, user, family_id)
+    access_token = create_access_token(
+        data={"sub": user.email, "sid": refresh_token.family_id},
+        expires_delta=timedelta(minutes=settings.access_token_expire_minutes)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": encode_refresh_token(refresh_token, user.email),
+        "token_type": "bearer",
+        "expires_in": settings.access_token_expire_minutes * 60
+    }
+
+def revoke_session(db: Session, family_id: str):
+    """
+    Отозвать сессию: все ее refresh токены и выданные по ним access токены
+    (commit выполняет вызывающий код)
+    """
+    now = datetime.now(timezone.utc)
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    # Access токены сессии живут не дольше access_token_expire_minutes
+    token_revocation.revoke(db, family_id, now + timedelta(minutes=settings.access_token_expire_minutes))
+
+def rotate_refresh_token(db: Session, token: str) -> Optional[dict]:
+    """
+    Обменять refresh токен на новую пару токенов
+    
+    Использованный токен отзывается. Повторное предъявление уже
+    замененного токена означает утечку - отзывается вся сессия.
+    Возвращает None, если токен недействителен.
+    """
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        return None
+    
+    refresh_token = db.query(RefreshToken).filter(
+        RefreshToken.jti == payload["jti"]
+    ).with_for_update().first()
+    if refresh_token is None:
+        return None
+    
+    if refresh_token.revoked_at is not None:
+        if refresh_token.replaced_by is not None:
+            revoke_session(db, refresh_token.family_id)
+            db.commit()
+        return None
+    
+    user = db.query(User).filter(User.id == refresh_token.user_id).first()
+    if user is None or not user.is_active:
+        return None
+    
+    tokens = issue_tokens(db, user, refresh_token.family_id)
+    refresh_token.revoked_at = datetime.now(timezone.utc)
+    refresh_token.replaced_by = jwt.get_unverified_claims(tokens["refresh_token"])["jti"]
+    db.commit()
+    return tokens
+
+def _get_user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+async def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    """
+    Аутентификация пользователя
+
+    bcrypt выполняется в пуле password_hasher; хеш с устаревшим числом
+    раундов прозрачно пересчитывается и сохраняется при успешном входе.
+    """
+    user = await run_in_threadpool(_get_user_by_email, db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    
+    try:
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис авторизации перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
+    if not verified:
         return None
+    
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
     return user
 
-async def get_current_user(
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
-    """Получить текущего пользователя из JWT токена"""
+    """
+    Получить текущего пользователя из JWT токена
+
+    Обычная функция, а не async: FastAPI вызывает ее в пуле потоков, поэтому
+    синхронизация списка отзыва (запрос к БД или Redis) и чтение пользователя
+    при промахе кеша не блокируют цикл событий.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Неверные учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        email: str = payload.get("sub")
-        if email is None:
+    token = credentials.credentials
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+        token_cache.put(token, payload, expires_at=payload.get("exp"))
+    
+    # Refresh токен не принимается вместо access; отзыв проверяется по токену и по сессии
+    if payload.get("type", "access") != "access":
         raise credentials_exception
+    if token_revocation.is_revoked(db, payload.get("jti"), payload.get("sid")):
+        raise credentials_exception
+    
+    email: str = payload.get("sub")
+    if email is None:
+        raise credentials_exception
+    token_data = TokenData(email=email)
+    
+    # Снимок пользователя из кеша: без запроса к БД на каждый вызов
+    snapshot = principal_cache.get(token_data.email)
+    if snapshot is not None:
+        return snapshot.attach(db)
     
     user = db.query(User).filter(User.email == token_data.email).first()
     if user is None:
         raise credentials_exception
+    principal_cache.put(token_data.email, UserSnapshot.from_user(user), expires_at=payload.get("exp"))
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -3,6 +3,7 @@ import re
 from sqlalchemy.orm import Session
 from app.models import Category, Product
 from app.database import SessionLocal
+from app.services import embedding_indexer  # noqa: F401 - журнал изменений для векторного индекса
 import logging
 
 # Настройка логирования
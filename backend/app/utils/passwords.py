@@ -0,0 +1,133 @@
+"""
+Хеширование паролей EMC3 в отдельном пуле потоков
+bcrypt намеренно медленный (100-300 мс), поэтому проверка паролей выполняется
+в собственном ограниченном пуле, а не в общем threadpool Starlette: всплеск
+логинов не занимает потоки, обслуживающие каталог
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+# Хеши с другим числом раундов считаются устаревшими и пересчитываются при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь пула хеширования переполнена"""
+
+
+class PasswordHasher:
+    """
+    Ограниченный пул для bcrypt
+
+    Одновременно выполняется не больше workers операций (bcrypt отпускает GIL,
+    поэтому потоки работают параллельно), в очереди ждет не больше queue_size;
+    сверх этого запрос сразу отклоняется, чтобы не копить бесконечную очередь.
+    """
+
+    def __init__(
+        self,
+        context: CryptContext = pwd_context,
+        workers: int = settings.password_hash_workers,
+        queue_size: int = settings.password_hash_queue_size
+    ):
+        self.context = context
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "rehashed": 0,
+            "in_flight": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    def _record(self, **changes: float):
+        with self._lock:
+            for key, value in changes.items():
+                if key.endswith("_max"):
+                    self._stats[key] = max(self._stats[key], value)
+                else:
+                    self._stats[key] += value
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики пула: очередь, время ожидания и выполнения"""
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats["completed"] or 1
+        stats["queued"] = max(stats["in_flight"] - self.workers, 0)
+        stats["wait_ms_avg"] = round(stats.pop("wait_seconds_total") / completed * 1000, 2)
+        stats["wait_ms_max"] = round(stats.pop("wait_seconds_max") * 1000, 2)
+        stats["run_ms_avg"] = round(stats.pop("run_seconds_total") / completed * 1000, 2)
+        stats.update(workers=self.workers, queue_size=self.queue_size, rounds=settings.bcrypt_rounds)
+        return stats
+
+    def _run(self, submitted_at: float, func: Callable, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            wait = started - submitted_at
+            self._record(
+                completed=1,
+                in_flight=-1,
+                wait_seconds_total=wait,
+                wait_seconds_max=wait,
+                run_seconds_total=finished - started
+            )
+            self._slots.release()
+
+    async def _submit(self, func: Callable, *args):
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise PasswordHasherBusy("Очередь проверки паролей переполнена")
+
+        self._record(submitted=1, in_flight=1)
+        try:
+            future = self._executor.submit(self._run, time.perf_counter(), func, *args)
+        except Exception:
+            self._record(in_flight=-1)
+            self._slots.release()
+            raise
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Проверить пароль; вторым значением - новый хеш, если текущий устарел"""
+        verified, new_hash = await self._submit(self.context.verify_and_update, password, hashed_password)
+        if new_hash:
+            self._record(rehashed=1)
+        return verified, new_hash
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Глобальный пул хеширования
+password_hasher = PasswordHasher()
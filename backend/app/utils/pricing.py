@@ -1,28 +1,49 @@
-from app.database import settings
+from typing import Optional
 from app.schemas.orders import PriceCalculation
+from app.models.users import UserType
+from app.services.pricing_engine import pricing_engine, CompiledPricing
 
-def calculate_b2b_discount(quantity: int) -> float:
+def calculate_b2b_discount(
+    quantity: int,
+    user_type: Optional[UserType] = None,
+    category_id: Optional[int] = None,
+    manufacturer: Optional[str] = None,
+    cart_total: float = 0.0,
+    rules: Optional[CompiledPricing] = None
+) -> float:
     """
     Вычисляет процент скидки на основе количества товара
-    B2B ценообразование:
+    B2B ценообразование по правилам из pricing_rules с учетом типа клиента,
+    категории, производителя и суммы корзины. Без правил в БД действует лестница из настроек:
     - 5+ шт = -5%
     - 10+ шт = -10% 
     - 50+ шт = -15%
+    
+    rules - снимок из pricing_engine.get_rules(db); без него используется последний загруженный
     """
-    if quantity >= 50:
-        return settings.wholesale_discount_50
-    elif quantity >= 10:
-        return settings.wholesale_discount_10
-    elif quantity >= 5:
-        return settings.wholesale_discount_5
-    else:
-        return 0.0
+    rules = rules or pricing_engine.current
+    return rules.discount_for(
+        quantity,
+        user_type=user_type,
+        category_id=category_id,
+        manufacturer=manufacturer,
+        cart_total=cart_total
+    )
 
-def calculate_price_with_discount(base_price: float, quantity: int) -> PriceCalculation:
+def calculate_price_with_discount(
+    base_price: float,
+    quantity: int,
+    user_type: Optional[UserType] = None,
+    category_id: Optional[int] = None,
+    manufacturer: Optional[str] = None,
+    rules: Optional[CompiledPricing] = None
+) -> PriceCalculation:
     """
     Вычисляет итоговую цену с учетом B2B скидки
     """
-    discount_percent = calculate_b2b_discount(quantity)
+    discount_percent = calculate_b2b_discount(
+        quantity, user_type, category_id, manufacturer, rules=rules
+    )
     discount_amount = base_price * (discount_percent / 100)
     final_price = base_price - discount_amount
     
@@ -33,11 +54,21 @@ def calculate_price_with_discount(base_price: float, quantity: int) -> PriceCalc
         quantity=quantity
     )
 
-def calculate_total_for_item(unit_price: float, quantity: int) -> dict:
+def calculate_total_for_item(
+    unit_price: float,
+    quantity: int,
+    user_type: Optional[UserType] = None,
+    category_id: Optional[int] = None,
+    manufacturer: Optional[str] = None,
+    cart_total: float = 0.0,
+    rules: Optional[CompiledPricing] = None
+) -> dict:
     """
     Вычисляет общую стоимость для позиции заказа
     """
-    discount_percent = calculate_b2b_discount(quantity)
+    discount_percent = calculate_b2b_discount(
+        quantity, user_type, category_id, manufacturer, cart_total, rules
+    )
     base_total = unit_price * quantity
     discount_amount = base_total * (discount_percent / 100)
     final_total = base_total - discount_amount
@@ -49,4 +80,4 @@ def calculate_total_for_item(unit_price: float, quantity: int) -> dict:
         "discount_percent": discount_percent,
         "discount_amount": discount_amount,
         "final_total": final_total
-    }
\ No newline at end of file
+    }
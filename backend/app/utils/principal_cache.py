@@ -0,0 +1,145 @@
+"""
+Кеш аутентифицированных пользователей EMC3
+Для каждого запроса с токеном хранится декодированный JWT и легкий снимок
+пользователя (id, тип, активность), поэтому get_current_user не ходит в БД.
+Записи ограничены по количеству, живут не дольше токена и короткого TTL
+и сбрасываются при изменении пользователя
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app.database import settings
+from app.models.users import User, UserType
+
+# Поля, изменение которых должно сразу сбрасывать кеш
+PRINCIPAL_FIELDS = ("email", "user_type", "is_active")
+
+
+class BoundedTTLCache:
+    """Потокобезопасный LRU-кеш с временем жизни каждой записи"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """Сохранить значение; срок - не позже expires_at (например, exp токена)"""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserSnapshot(NamedTuple):
+    """Неизменяемый снимок пользователя для авторизации"""
+    id: int
+    email: str
+    user_type: Optional[UserType]
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(user.id, user.email, user.user_type, user.is_active)
+
+    def attach(self, db: Session) -> User:
+        """
+        Пользователь в сессии без запроса к БД
+
+        Поля снимка уже загружены, остальные (имя, телефон и т.д.)
+        подгрузятся одним запросом при первом обращении; изменения
+        сохраняются обычным commit.
+        """
+        user = User(id=self.id, email=self.email, user_type=self.user_type, is_active=self.is_active)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+
+# Декодированные JWT: токен -> payload
+token_cache = BoundedTTLCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl_seconds
+)
+
+# Снимки пользователей: email (sub токена) -> UserSnapshot
+principal_cache = BoundedTTLCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl_seconds
+)
+
+
+def invalidate_principal(email: str):
+    principal_cache.pop(email)
+
+
+def _capture_principal_change(mapper, connection, target):
+    state = inspect(target)
+    changed = [field for field in PRINCIPAL_FIELDS if state.attrs[field].history.has_changes()]
+    if not changed:
+        return
+
+    emails = {target.email}
+    if "email" in changed:
+        emails.update(state.attrs.email.history.deleted)
+
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("principal_invalidate", set()).update(emails)
+
+
+def _capture_principal_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("principal_invalidate", set()).add(target.email)
+
+
+event.listen(User, "after_update", _capture_principal_change)
+event.listen(User, "after_delete", _capture_principal_delete)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_principals_after_commit(session):
+    for email in session.info.pop("principal_invalidate", ()):
+        invalidate_principal(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_invalidation(session):
+    session.info.pop("principal_invalidate", None)
@@ -0,0 +1,131 @@
+"""
+Подсчет SQL-запросов для выявления N+1 регрессий
+
+Счетчик привязан к contextvar, поэтому запросы из разных HTTP-запросов
+(и из потоков threadpool Starlette) не смешиваются.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """Накопитель выполненных SQL-запросов"""
+
+    def __init__(self, parent: Optional["QueryCounter"] = None):
+        self.statements: List[str] = []
+        # Внешний счетчик (например, middleware) тоже видит запросы вложенного блока
+        self.parent = parent
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    while counter is not None:
+        counter.statements.append(statement)
+        counter = counter.parent
+
+
+@contextmanager
+def count_queries():
+    """
+    Посчитать SQL-запросы, выполненные внутри блока
+
+    Пример:
+        with count_queries() as counter:
+            client.get("/api/orders")
+        print(counter.count)
+    """
+    counter = QueryCounter(parent=_current_counter.get())
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """
+    Упасть с AssertionError, если внутри блока выполнено больше `limit` запросов
+
+    Используется в проверках эндпоинтов: количество запросов не должно
+    расти вместе с количеством заказов и позиций.
+    """
+    with count_queries() as counter:
+        yield counter
+
+    if counter.count > limit:
+        statements = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(counter.statements, 1))
+        raise AssertionError(
+            f"Выполнено {counter.count} SQL-запросов при лимите {limit}:\n{statements}"
+        )
+
+
+@contextmanager
+def query_budget(limit: int, name: str = "блок"):
+    """
+    Бюджет SQL-запросов эндпоинта: в режиме DEBUG превышение пишется в лог
+    предупреждением, иначе блок выполняется без подсчета
+
+    Запрос пользователя не ломается; жесткая проверка бюджета - в
+    scripts/order_query_budget_check.py (assert_max_queries).
+    """
+    if not settings.debug:
+        yield None
+        return
+
+    with count_queries() as counter:
+        yield counter
+
+    if counter.count > limit:
+        statements = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(counter.statements, 1))
+        logger.warning(f"{name}: {counter.count} SQL-запросов при бюджете {limit}:\n{statements}")
+
+
+class QueryCountMiddleware:
+    """
+    ASGI middleware: считает SQL-запросы каждого HTTP-запроса,
+    отдает их в заголовке X-Query-Count и пишет предупреждение при превышении порога
+    """
+
+    def __init__(self, app, warn_threshold: int = 20):
+        self.app = app
+        self.warn_threshold = warn_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(counter.count).encode()))
+                    message["headers"] = headers
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+        if counter.count > self.warn_threshold:
+            logger.warning(
+                f"{scope.get('method')} {scope.get('path')}: "
+                f"{counter.count} SQL-запросов (порог {self.warn_threshold})"
+            )
@@ -0,0 +1,286 @@
+"""
+Ограничение частоты запросов EMC3 (token bucket)
+Дорогие маршруты (вход и регистрация с bcrypt, поиск) защищаются корзинами
+токенов по IP и по учетной записи. Корзины хранятся в таблице с
+блокировками по шардам (шард выбирается по хешу ключа) и ленивым вытеснением,
+для нескольких воркеров есть общее хранилище в Redis
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Лимит для маршрута: rate токенов в секунду, не больше burst подряд"""
+    name: str
+    path_prefix: str
+    rate: float
+    burst: int
+    methods: Tuple[str, ...] = ("POST",)
+    keys: Tuple[str, ...] = ("ip",)  # ip и/или account
+    query_param: Optional[str] = None  # лимит только для запросов с этим параметром
+
+    def matches(self, method: str, path: str, query: Dict[str, List[str]]) -> bool:
+        if method not in self.methods or not path.startswith(self.path_prefix):
+            return False
+        return self.query_param is None or bool(query.get(self.query_param, [""])[0])
+
+
+def default_rules() -> List[RateLimitRule]:
+    auth_rate = settings.rate_limit_auth_per_minute / 60
+    search_rate = settings.rate_limit_search_per_minute / 60
+    return [
+        RateLimitRule("login", "/api/auth/login", auth_rate, settings.rate_limit_auth_burst, keys=("ip", "account")),
+        RateLimitRule("register", "/api/auth/register", auth_rate, settings.rate_limit_auth_burst),
+        RateLimitRule("refresh", "/api/auth/refresh", auth_rate * 2, settings.rate_limit_auth_burst * 2),
+        RateLimitRule(
+            "catalog_search", "/api/products", search_rate, settings.rate_limit_search_burst,
+            methods=("GET",), query_param="search"
+        ),
+        RateLimitRule(
+            "search", "/api/search", search_rate, settings.rate_limit_search_burst,
+            methods=("GET", "POST")
+        ),
+    ]
+
+
+class LocalBucketStore:
+    """
+    Корзины в памяти процесса
+
+    Таблица разбита на shards частей со своими блокировками, поэтому
+    параллельные запросы с разными ключами почти не конкурируют.
+    Полностью восстановившиеся корзины ничем не отличаются от новых
+    и вытесняются лениво, когда шард превышает max_keys_per_shard.
+    """
+
+    def __init__(self, shards: int = 64, max_keys_per_shard: int = 4096):
+        self.shards = shards
+        self.max_keys_per_shard = max_keys_per_shard
+        self._tables: List[Dict[str, List[float]]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, key: str) -> int:
+        return int(key[:8], 16) % self.shards
+
+    def _evict(self, table: Dict[str, List[float]], now: float):
+        # bucket: [токены, время обновления, время полного восстановления]
+        for key in [key for key, bucket in table.items() if now - bucket[1] >= bucket[2]]:
+            del table[key]
+        # Все корзины активны - вытесняем самые старые
+        while len(table) >= self.max_keys_per_shard:
+            del table[next(iter(table))]
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Взять токен; возвращает (разрешено, через сколько секунд повторить)"""
+        # Без await внутри: короткая операция под блокировкой шарда не отдает управление циклу
+        shard = self._shard(key)
+        now = time.monotonic()
+
+        with self._locks[shard]:
+            table = self._tables[shard]
+            bucket = table.get(key)
+            if bucket is None:
+                if len(table) >= self.max_keys_per_shard:
+                    self._evict(table, now)
+                bucket = table[key] = [float(burst), now, burst / rate if rate > 0 else 0.0]
+
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True, 0.0
+            bucket[0] = tokens
+            return False, (1 - tokens) / rate if rate > 0 else 60.0
+
+
+class RedisBucketStore:
+    """Общие для всех воркеров корзины в Redis (атомарный Lua-скрипт, асинхронный клиент)"""
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or burst
+        local ts = tonumber(data[2]) or now
+        tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+        local allowed = 0
+        local retry = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        else
+            retry = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return {allowed, tostring(retry)}
+    """
+
+    def __init__(self, url: str, prefix: str = "emc3:ratelimit:"):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, retry = await self._script(keys=[self.prefix + key], args=[rate, burst, time.time()])
+        return bool(allowed), float(retry)
+
+
+def create_bucket_store(name: str = settings.rate_limit_backend):
+    if name == "redis":
+        return RedisBucketStore(settings.redis_url)
+    return LocalBucketStore(shards=settings.rate_limit_shards)
+
+
+def _bucket_key(rule: RateLimitRule, kind: str, value: str) -> str:
+    # Хеш вместо сырых IP и email: равномерное распределение по шардам и без персональных данных в памяти
+    return hashlib.sha1(f"{rule.name}:{kind}:{value}".encode()).hexdigest()
+
+
+def _client_ip(scope) -> str:
+    if settings.rate_limit_trust_proxy:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _account_from_body(body: bytes, content_type: str) -> Optional[str]:
+    """Учетная запись из тела запроса входа (JSON email или form username)"""
+    try:
+        if content_type.startswith("application/json"):
+            data = json.loads(body or b"{}")
+            account = data.get("email") if isinstance(data, dict) else None
+        else:
+            account = parse_qs(body.decode("utf-8", "ignore")).get("username", [None])[0]
+    except ValueError:
+        return None
+    return account.strip().lower() if isinstance(account, str) and account.strip() else None
+
+
+def _content_length(headers: Dict[bytes, bytes]) -> int:
+    try:
+        return int(headers.get(b"content-length", b"0"))
+    except ValueError:
+        return 0
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware: отклоняет запросы сверх лимита ответом 429
+    до того, как они дойдут до bcrypt или поиска
+
+    Подключается внутри CORSMiddleware, чтобы ответ 429 получал CORS-заголовки.
+    Для ключа по учетной записи читается не больше max_body байт тела.
+    """
+
+    def __init__(self, app, rules: Optional[Sequence[RateLimitRule]] = None, store=None, max_body: int = 65536):
+        self.app = app
+        self.rules = list(rules) if rules is not None else default_rules()
+        self.store = store or create_bucket_store()
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        rules = [rule for rule in self.rules if rule.matches(scope["method"], scope["path"], query)]
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        account = None
+        if any("account" in rule.keys for rule in rules):
+            headers = dict(scope.get("headers", []))
+            if _content_length(headers) <= self.max_body:
+                body, receive = await self._buffer_body(receive, self.max_body)
+                if body is not None:
+                    account = _account_from_body(body, headers.get(b"content-type", b"").decode("latin-1"))
+
+        ip = _client_ip(scope)
+        retry_after = 0.0
+        for rule in rules:
+            for kind in rule.keys:
+                value = ip if kind == "ip" else account
+                if value is None:
+                    continue
+                try:
+                    allowed, retry = await self.store.take(_bucket_key(rule, kind, value), rule.rate, rule.burst)
+                except Exception as e:
+                    # Недоступное общее хранилище не должно ронять вход
+                    logger.error(f"Ошибка хранилища лимитов: {e}")
+                    continue
+                if not allowed:
+                    retry_after = max(retry_after, retry)
+
+        if retry_after:
+            logger.warning(f"Превышен лимит запросов: {scope['method']} {scope['path']} с {ip}")
+            await self._reject(send, retry_after)
+            return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _buffer_body(receive, limit: int):
+        """
+        Прочитать тело (для ключа по учетной записи) и вернуть receive, повторяющий его
+
+        Читается не больше limit байт: тело длиннее возвращается как None,
+        прочитанные части отдаются приложению, остаток - из исходного receive.
+        """
+        chunks = []
+        size = 0
+        more = True
+        while more and size <= limit:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more = message.get("more_body", False)
+
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": more}
+            return await receive()
+
+        return (body if size <= limit else None), replay
+
+    @staticmethod
+    async def _reject(send, retry_after: float):
+        payload = json.dumps(
+            {"detail": "Слишком много запросов, повторите попытку позже"}, ensure_ascii=False
+        ).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,60 @@
+"""
+Локальная заглушка API Битрикс24 для проверки outbox воркера
+Отвечает {"result": <id>} на любой метод вебхука, умеет имитировать задержки и сбои
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay: float, fail_rate: float, ids):
+    class Bitrix24StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else b''
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+
+            if delay:
+                time.sleep(delay)
+
+            if random.random() < fail_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            result = next(ids) if method.endswith('.add') else True
+            payload = json.dumps({'result': result}).encode()
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            print(f"{method}: {len(body)} байт -> {result}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Bitrix24StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заглушка API Битрикс24')
+    parser.add_argument('--port', type=int, default=8099, help='Порт')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка ответа (сек)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля ответов 503 (0-1)')
+
+    args = parser.parse_args()
+
+    handler = make_handler(args.delay, args.fail_rate, itertools.count(1))
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), handler)
+    print(f"Заглушка Битрикс24: http://127.0.0.1:{args.port}/rest/1/stub/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Инкрементальная переиндексация товаров для векторного поиска отдельным процессом
+
+Запуск:
+    python scripts/embedding_indexer.py            # разбирать журнал изменений постоянно
+    python scripts/embedding_indexer.py --once     # разобрать накопленное и выйти
+    python scripts/embedding_indexer.py --full --once   # сверить весь каталог (после записей в обход ORM)
+"""
+
+import sys
+import asyncio
+import logging
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, settings
+from app.services.embedding_indexer import EmbeddingIndexer, enqueue_all_products
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def run(args):
+    if args.full:
+        db = SessionLocal()
+        try:
+            logger.info(f"В журнал поставлено товаров: {enqueue_all_products(db)}")
+        finally:
+            db.close()
+
+    indexer = EmbeddingIndexer(batch_size=args.batch_size, poll_interval=args.poll_interval)
+    if args.once:
+        while await indexer.run_once():
+            logger.info(f"Статистика: {indexer.stats}")
+    else:
+        await indexer.run()
+
+    logger.info(f"Статистика: {indexer.stats}")
+
+
+def main():
+    """Основная функция для запуска индексатора"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Инкрементальная переиндексация измененных товаров')
+    parser.add_argument('--once', action='store_true', help='Разобрать журнал и завершиться')
+    parser.add_argument('--full', action='store_true', help='Поставить в журнал весь каталог')
+    parser.add_argument('--batch-size', type=int, default=settings.embedding_indexer_batch_size, help='Записей журнала за проход')
+    parser.add_argument('--poll-interval', type=float, default=settings.embedding_indexer_poll_seconds, help='Интервал опроса журнала (сек)')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Локальная заглушка OpenAI Embeddings API для проверки массовой индексации
+
+Отвечает на POST /v1/embeddings детерминированными векторами (одинаковый
+текст - одинаковый вектор) с заданной задержкой и долей ответов 429.
+
+Запуск:
+    python scripts/fake_embedding_server.py --port 8100 --latency-ms 300
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1 OPENAI_API_KEY=test python scripts/index_embeddings.py
+"""
+
+import sys
+import asyncio
+import hashlib
+import logging
+import random
+from pathlib import Path
+from typing import List, Union
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    """Псевдослучайный единичный вектор, зависящий только от текста"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimension)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def create_app(dimension: int, latency: float, error_rate: float, max_inputs: int) -> FastAPI:
+    app = FastAPI(title="Fake Embeddings API")
+    stats = {"requests": 0, "inputs": 0, "rate_limited": 0}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: EmbeddingRequest):
+        texts = [request.input] if isinstance(request.input, str) else request.input
+        stats["requests"] += 1
+
+        if len(texts) > max_inputs:
+            return JSONResponse(status_code=400, content={"error": {"message": f"Не больше {max_inputs} входов"}})
+        if random.random() < error_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(status_code=429, content={"error": {"message": "Rate limit exceeded"}})
+
+        # Время ответа реального API почти не зависит от числа входов
+        await asyncio.sleep(latency)
+        stats["inputs"] += len(texts)
+        return {
+            "object": "list",
+            "model": request.model,
+            "data": [
+                {"object": "embedding", "index": index, "embedding": fake_embedding(text, dimension)}
+                for index, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    """Основная функция для запуска заглушки"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Заглушка OpenAI Embeddings API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--dimension', type=int, default=1536, help='Размерность векторов')
+    parser.add_argument('--latency-ms', type=float, default=300, help='Задержка ответа (мс)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--max-inputs', type=int, default=2048, help='Максимум входов в запросе')
+
+    args = parser.parse_args()
+
+    app = create_app(args.dimension, args.latency_ms / 1000, args.error_rate, args.max_inputs)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,7 @@ sys.path.append(str(Path(__file__).parent.parent))
 from app.database import SessionLocal, engine
 from app.models.products import Product
 from app.models.categories import Category
+from app.services import embedding_indexer  # noqa: F401 - журнал изменений для векторного индекса
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
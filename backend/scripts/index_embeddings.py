@@ -0,0 +1,97 @@
+"""
+Массовая индексация каталога для векторного поиска
+
+Запуск:
+    python scripts/index_embeddings.py --concurrency 4 --batch-size 128
+    python scripts/index_embeddings.py --embed-only   # только прогреть кеш embedding'ов
+"""
+
+import sys
+import asyncio
+import logging
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy.orm import joinedload
+
+from app.database import SessionLocal
+from app.models import Product
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_products(limit=None):
+    from app.services.vector_search import product_embedding_data
+
+    db = SessionLocal()
+    try:
+        query = db.query(Product).options(joinedload(Product.category)).order_by(Product.id)
+        if limit:
+            query = query.limit(limit)
+        return [product_embedding_data(product) for product in query]
+    finally:
+        db.close()
+
+
+def log_progress(report):
+    percent = report.done * 100 // report.total if report.total else 100
+    logger.info(
+        f"Индексация: {report.done}/{report.total} ({percent}%), из кеша {report.cached}, "
+        f"запросов к API {report.api_requests}, записано {report.upserted}, ошибок {report.failed}, "
+        f"{report.elapsed:.1f} с"
+    )
+
+
+async def run(args):
+    from app.services.vector_search import get_vector_search_service
+
+    vector_search_service = get_vector_search_service()
+
+    products = load_products(args.limit)
+    logger.info(f"Товаров для индексации: {len(products)}")
+
+    report = await vector_search_service.index_products(
+        products,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        concurrency=args.concurrency,
+        upsert_chunk=args.upsert_chunk,
+        max_retries=args.max_retries,
+        store=not args.embed_only,
+        progress=log_progress
+    )
+
+    logger.info(f"Итог: {report.as_dict()}")
+    logger.info(f"Кеш embedding'ов: {vector_search_service.get_embedding_cache_stats()}")
+    return 1 if report.failed else 0
+
+
+def main():
+    """Основная функция для запуска индексации"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Массовая индексация товаров для векторного поиска')
+    parser.add_argument('--batch-size', type=int, default=128, help='Текстов в одном запросе к API')
+    parser.add_argument('--max-batch-tokens', type=int, default=100_000, help='Оценка токенов на запрос')
+    parser.add_argument('--concurrency', type=int, default=4, help='Одновременных запросов к API')
+    parser.add_argument('--upsert-chunk', type=int, default=200, help='Строк в одной записи в хранилище')
+    parser.add_argument('--max-retries', type=int, default=5, help='Повторов запроса при ошибке')
+    parser.add_argument('--limit', type=int, help='Проиндексировать только первые N товаров')
+    parser.add_argument('--embed-only', action='store_true', help='Не записывать в хранилище, только кеш')
+
+    args = parser.parse_args()
+
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
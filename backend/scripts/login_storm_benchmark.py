@@ -0,0 +1,138 @@
+"""
+Бенчмарк EMC3: задержка каталога во время всплеска логинов
+Сначала измеряет p50/p99 запросов каталога без нагрузки, затем - пока
+параллельные клиенты непрерывно выполняют вход (bcrypt), и выводит метрики
+пула хеширования паролей из /health
+
+Запуск против работающего сервера:
+    python scripts/login_storm_benchmark.py --base-url http://localhost:8000
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+import statistics
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def request(url: str, payload: dict = None) -> int:
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def ensure_user(base_url: str, email: str, password: str):
+    """Зарегистрировать тестового пользователя (если уже есть - 400, это нормально)"""
+    request(f"{base_url}/api/auth/register", {"email": email, "password": password})
+
+
+def measure_catalog(base_url: str, duration: float, clients: int) -> list:
+    """Задержки запросов каталога за duration секунд"""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            request(f"{base_url}/api/products/?page=1&size=20")
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(worker)
+    return latencies
+
+
+def login_storm(base_url: str, email: str, password: str, clients: int, stop: threading.Event) -> dict:
+    """Непрерывные логины до установки stop; возвращает счетчики по кодам ответа"""
+    codes = {}
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            code = request(f"{base_url}/api/auth/login/json", {"email": email, "password": password})
+            with lock:
+                codes[code] = codes.get(code, 0) + 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    stop.wait()
+    for thread in threads:
+        thread.join()
+    return codes
+
+
+def summary(latencies: list) -> str:
+    if not latencies:
+        return "нет данных"
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return (f"{len(ordered)} запросов, p50 {statistics.median(ordered) * 1000:.1f} мс, "
+            f"p99 {p99 * 1000:.1f} мс, max {ordered[-1] * 1000:.1f} мс")
+
+
+def main():
+    """Основная функция для запуска бенчмарка"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Задержка каталога во время всплеска логинов')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='Адрес API')
+    parser.add_argument('--email', default='login-storm@emc3-lighting.ru', help='Тестовый пользователь')
+    parser.add_argument('--password', default='login-storm-password', help='Пароль тестового пользователя')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность каждого замера (сек)')
+    parser.add_argument('--catalog-clients', type=int, default=4, help='Параллельных клиентов каталога')
+    parser.add_argument('--login-clients', type=int, default=64, help='Параллельных логинов')
+
+    args = parser.parse_args()
+    base_url = args.base_url.rstrip("/")
+
+    ensure_user(base_url, args.email, args.password)
+
+    logger.info("Замер каталога без нагрузки")
+    baseline = measure_catalog(base_url, args.duration, args.catalog_clients)
+
+    logger.info(f"Замер каталога во время {args.login_clients} параллельных логинов")
+    stop = threading.Event()
+    storm_result = {}
+    storm = threading.Thread(
+        target=lambda: storm_result.update(
+            login_storm(base_url, args.email, args.password, args.login_clients, stop)
+        )
+    )
+    storm.start()
+    time.sleep(1)
+    loaded = measure_catalog(base_url, args.duration, args.catalog_clients)
+    stop.set()
+    storm.join()
+
+    with urllib.request.urlopen(f"{base_url}/health", timeout=30) as response:
+        health = json.loads(response.read())
+
+    print(f"\nКаталог без нагрузки:   {summary(baseline)}")
+    print(f"Каталог во время входа: {summary(loaded)}")
+    print(f"Ответы логина: {storm_result}")
+    print(f"Пул хеширования: {json.dumps(health.get('password_hasher'), ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
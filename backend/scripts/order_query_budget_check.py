@@ -0,0 +1,115 @@
+"""
+Проверка EMC3: бюджет SQL-запросов истории заказов
+Создает пользователя с несколькими заказами по несколько позиций и вызывает
+обработчики GET /api/orders и GET /api/orders/{id} внутри assert_max_queries:
+число запросов (вместе с сериализацией ответа) не должно превышать
+ORDER_LIST_QUERY_BUDGET / ORDER_DETAIL_QUERY_BUDGET и расти с числом заказов.
+Пользователь подставляется из снимка principal_cache, как в запросе с токеном.
+
+Запуск:
+    python scripts/order_query_budget_check.py
+    python scripts/order_query_budget_check.py --orders 20 --items 8
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal
+from app.models import Order, OrderItem, Product, User
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+EMAIL = "query-budget-check@emc3.ru"
+SKU_PREFIX = "QUERY-BUDGET-"
+
+
+def prepare_orders(orders: int, items: int) -> int:
+    """Пользователь с orders заказами по items позиций; возвращает ID пользователя"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == EMAIL).first()
+        if user is None:
+            user = User(email=EMAIL, hashed_password="-", is_active=True)
+            db.add(user)
+            db.flush()
+
+        products = []
+        for i in range(items):
+            sku = f"{SKU_PREFIX}{i}"
+            product = db.query(Product).filter(Product.sku == sku).first()
+            if product is None:
+                product = Product(name=f"Проверка запросов {i}", sku=sku, price=100.0 + i)
+                db.add(product)
+            products.append(product)
+        db.flush()
+
+        old_orders = db.query(Order.id).filter(Order.user_id == user.id)
+        db.query(OrderItem).filter(OrderItem.order_id.in_(old_orders)).delete(synchronize_session=False)
+        db.query(Order).filter(Order.user_id == user.id).delete(synchronize_session=False)
+        for _ in range(orders):
+            order = Order(user_id=user.id, total_amount=sum(product.price for product in products))
+            db.add(order)
+            db.flush()
+            db.add_all([
+                OrderItem(order_id=order.id, product_id=product.id, quantity=1, unit_price=product.price)
+                for product in products
+            ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def check(orders: int, items: int) -> int:
+    from app.api.orders import ORDER_DETAIL_QUERY_BUDGET, ORDER_LIST_QUERY_BUDGET, get_order, get_orders
+    from app.utils.principal_cache import UserSnapshot
+    from app.utils.query_counter import assert_max_queries
+
+    user_id = prepare_orders(orders, items)
+    failed = 0
+    for name, budget in (("GET /api/orders", ORDER_LIST_QUERY_BUDGET), ("GET /api/orders/{id}", ORDER_DETAIL_QUERY_BUDGET)):
+        db = SessionLocal()
+        try:
+            # Пользователь из снимка и ID заказа из URL - до подсчета, как в запросе
+            snapshot = UserSnapshot.from_user(db.get(User, user_id))
+            order_id = db.query(Order.id).filter(Order.user_id == user_id).limit(1).scalar()
+            db.expunge_all()
+            user = snapshot.attach(db)
+
+            with assert_max_queries(budget) as counter:
+                if name == "GET /api/orders":
+                    response = get_orders(skip=0, limit=100, status=None, current_user=user, db=db)
+                else:
+                    response = get_order(order_id, current_user=user, db=db)
+                response.model_dump()
+            logger.info(f"{name}: {counter.count} SQL-запросов (бюджет {budget})")
+        except AssertionError as e:
+            failed += 1
+            logger.error(f"{name}: {e}")
+        finally:
+            db.close()
+    return 1 if failed else 0
+
+
+def main():
+    """Основная функция проверки"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Бюджет SQL-запросов истории заказов')
+    parser.add_argument('--orders', type=int, default=10, help='Число заказов пользователя')
+    parser.add_argument('--items', type=int, default=5, help='Позиций в каждом заказе')
+
+    args = parser.parse_args()
+    return check(args.orders, args.items)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
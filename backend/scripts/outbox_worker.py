@@ -0,0 +1,60 @@
+"""
+Запуск outbox воркера синхронизации заказов с Битрикс24 отдельным процессом
+"""
+
+import sys
+import asyncio
+import logging
+from pathlib import Path
+
+import httpx
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services.outbox import create_bitrix24_outbox_worker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def run(args):
+    from app.integrations.bitrix24 import Bitrix24Integration
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        bitrix = Bitrix24Integration(webhook_url=args.webhook_url, client=client)
+        worker = create_bitrix24_outbox_worker(bitrix, concurrency=args.concurrency)
+
+        if args.once:
+            while await worker.run_once():
+                pass
+        else:
+            await worker.run()
+
+        logger.info(f"Статистика: {worker.stats}")
+
+
+def main():
+    """Основная функция для запуска воркера"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Outbox воркер синхронизации с Битрикс24')
+    parser.add_argument('--webhook-url', help='URL вебхука (например, заглушки scripts/bitrix24_stub.py)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Одновременных запросов к Битрикс24')
+    parser.add_argument('--once', action='store_true', help='Обработать накопленные события и выйти')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
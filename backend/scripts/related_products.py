@@ -0,0 +1,67 @@
+"""
+Полный пересчет похожих товаров (product_relations)
+
+После первичной индексации или смены модели embedding'ов; дальше списки
+обновляет индексатор изменений (scripts/embedding_indexer.py) только для
+затронутых товаров.
+
+Запуск:
+    python scripts/related_products.py --top-k 20
+"""
+
+import sys
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def run(args):
+    from app.services.related_products import load_product_vectors, rebuild_relations
+    from app.services.vector_search import get_vector_search_service
+
+    vector_search_service = get_vector_search_service()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        data = await load_product_vectors(vector_search_service, db)
+        logger.info(f"Загружено {len(data.ids)} векторов за {time.perf_counter() - started:.1f} с")
+
+        started = time.perf_counter()
+        count = await asyncio.to_thread(rebuild_relations, db, data, args.top_k)
+        logger.info(f"Соседи посчитаны для {count} товаров за {time.perf_counter() - started:.1f} с")
+    finally:
+        db.close()
+        vector_search_service.close()
+
+
+def main():
+    """Основная функция пересчета"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Пересчет похожих товаров по embedding')
+    parser.add_argument('--top-k', type=int, default=settings.related_products_top_k, help='Соседей в каждом списке')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,539 @@
+"""
+Бенчмарк EMC3: качество и задержка поиска
+Прогоняет размеченные запросы через hybrid_search (тот же путь, что и
+/api/search) на каталоге из stock.csv и для каждого варианта поиска выводит
+recall@k, nDCG@k, задержку p50/p95/p99, процессорное время и стоимость
+запроса. Варианты:
+- supabase: векторный поиск через SupabaseVectorStore и заменитель RPC
+  search_similar_products (точный перебор в процессе, запрос и ответ
+  проходят через JSON, как по сети; --rpc-rtt-ms добавляет задержку сети);
+- local: локальный индекс, точный перебор;
+- ann: локальный индекс с IVF;
+- int8, pq: локальный индекс с квантованием;
+- lexical: BM25 по индексу каталога;
+- hybrid: BM25 + векторные кандидаты (локальный индекс) с RRF.
+
+Все работает без сети: каталог - в SQLite в памяти, embedding'и - локальная
+модель (LOCAL_EMBEDDING_MODEL_PATH, без обученной модели - случайная
+проекция). Стоимость - оценка токенов запроса по цене API embedding'ов в
+продакшене (--embedding-price) плюс цена вызовов RPC (--rpc-price).
+
+Размеченные запросы (search_benchmark_queries.json рядом со скриптом)
+строятся из stock.csv: названия товаров (с опечатками и без суффиксов),
+характеристики (серия, мощность, цветовая температура) и признаки серии;
+оценка релевантности 1-3 - по полям товара. Результат сохраняется в JSON
+(--save) и сравнивается с сохраненным базовым прогоном (--compare).
+
+Запуск:
+    python scripts/search_benchmark.py
+    python scripts/search_benchmark.py --backends lexical hybrid --save baseline.json
+    python scripts/search_benchmark.py --compare baseline.json
+    python scripts/search_benchmark.py --build-queries
+"""
+
+import sys
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from app.database import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+STOCK_CSV = Path(__file__).resolve().parents[2] / "stock.csv"
+QUERIES_FILE = Path(__file__).parent / "search_benchmark_queries.json"
+
+BACKENDS = ("supabase", "local", "ann", "int8", "pq", "lexical", "hybrid")
+
+# Суффиксы исполнения в названиях (аварийный блок, диммирование и т.п.): пользователи их часто опускают
+NAME_SUFFIXES = {"AN", "EM", "ND", "DALI", "CRI90", "ST"}
+
+
+# Каталог
+
+def load_stock(path: Path = STOCK_CSV) -> List[Dict[str, Any]]:
+    """Товары stock.csv с характеристиками, разобранными из названия и описания"""
+    import pandas as pd
+
+    df = pd.read_csv(path, sep=';', skiprows=2, dtype=str).fillna('')
+    products = []
+    for row in df.itertuples(index=False):
+        description = row.description
+        power = re.search(r'Мощность:\s*(\d+)', description)
+        flux = re.search(r'Световой поток:\s*(\d+)', description)
+        temperature = re.search(r'\b(\d{4})\s*[КK]\b', row.name)
+        words = row.name.split()
+        products.append({
+            'id': int(row.id),
+            'name': row.name.strip(),
+            'sku': row.sku,
+            'description': description,
+            'category': row.category.strip() or 'Прочее',
+            'price': float(row.price or 0),
+            'manufacturer': row.manufacturer,
+            'country': row.country,
+            'power': int(power.group(1)) if power else None,
+            'luminous_flux': int(flux.group(1)) if flux else None,
+            'color_temperature': int(temperature.group(1)) if temperature else None,
+            # Линейка - слово после бренда: Office, Highway, Road...
+            'family': words[2] if len(words) > 2 and words[1] == 'Econex' else None,
+            'words': set(words),
+        })
+    return products
+
+
+def create_catalog_session(products: List[Dict[str, Any]]):
+    """Сессия SQLite в памяти с категориями и товарами каталога (ID товаров - из stock.csv)"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from app.database import Base
+    from app.models import Category, Product
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    categories = {}
+    for product in products:
+        if product['category'] not in categories:
+            categories[product['category']] = Category(name=product['category'], slug=f"category-{len(categories) + 1}")
+    db.add_all(categories.values())
+    db.flush()
+    db.add_all([
+        Product(
+            id=product['id'],
+            name=product['name'],
+            sku=product['sku'],
+            price=product['price'],
+            description=product['description'],
+            manufacturer=product['manufacturer'],
+            country=product['country'],
+            power_watts=product['power'],
+            luminous_flux=product['luminous_flux'],
+            color_temperature=product['color_temperature'],
+            category_id=categories[product['category']].id,
+        )
+        for product in products
+    ])
+    db.commit()
+    return db
+
+
+# Размеченные запросы
+
+def _typo(word: str, rng: random.Random) -> str:
+    """Перестановка двух соседних букв внутри слова"""
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def build_queries(products: List[Dict[str, Any]], seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Запросы с оценками релевантности {ID товара: 1-3}
+
+    - name: название без "Светильник Econex", иногда с опечаткой в линейке или
+      без суффиксов исполнения; 3 - сам товар, 2 - тот же светильник с другими
+      суффиксами исполнения;
+    - spec: "линейка мощность Вт температура K"; 3 - совпадает все (мощность
+      в пределах 10%), 2 - другая температура, 1 - мощность в пределах 30%;
+    - attribute: "линейка признак" (Opal, Prism, IP54...); 2 - есть оба.
+    """
+    rng = random.Random(seed)
+    lamps = [product for product in products if product['family']]
+    queries = []
+
+    for product in rng.sample(lamps, min(150, len(lamps))):
+        words = product['name'].split()[2:]
+        if rng.random() < 0.3:
+            words = [word for word in words if word not in NAME_SUFFIXES]
+        if rng.random() < 0.3:
+            words[0] = _typo(words[0], rng)
+        base = product['words'] - NAME_SUFFIXES
+        labels = {other['id']: 2 for other in lamps if other['words'] - NAME_SUFFIXES == base}
+        labels[product['id']] = 3
+        queries.append({'query': ' '.join(words).lower(), 'type': 'name', 'labels': labels})
+
+    specs = sorted({
+        (product['family'], product['power'], product['color_temperature'])
+        for product in lamps if product['power'] and product['color_temperature']
+    }, key=str)
+    for family, power, temperature in rng.sample(specs, min(100, len(specs))):
+        labels = {}
+        for other in lamps:
+            if other['family'] != family or not other['power']:
+                continue
+            deviation = abs(other['power'] - power) / power
+            if deviation <= 0.1:
+                labels[other['id']] = 3 if other['color_temperature'] == temperature else 2
+            elif deviation <= 0.3 and other['color_temperature'] == temperature:
+                labels[other['id']] = 1
+        queries.append({'query': f"{family} {power} Вт {temperature}K".lower(), 'type': 'spec', 'labels': labels})
+
+    # Признаки, которые встречаются у нескольких товаров линейки, но не у всех
+    pairs: Dict[tuple, List[int]] = {}
+    family_sizes: Dict[str, int] = {}
+    for product in lamps:
+        family_sizes[product['family']] = family_sizes.get(product['family'], 0) + 1
+        for word in product['words']:
+            if word.isalpha() and word.isascii() and word not in (product['family'], 'Econex'):
+                pairs.setdefault((product['family'], word), []).append(product['id'])
+    candidates = sorted(
+        pair for pair, ids in pairs.items() if 3 <= len(ids) < family_sizes[pair[0]]
+    )
+    for family, word in rng.sample(candidates, min(50, len(candidates))):
+        queries.append({
+            'query': f"светильник {family} {word}".lower(),
+            'type': 'attribute',
+            'labels': {product_id: 2 for product_id in pairs[(family, word)]},
+        })
+    return queries
+
+
+def load_queries(path: Path) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        queries = json.load(f)
+    for query in queries:
+        query['labels'] = {int(product_id): grade for product_id, grade in query['labels'].items()}
+    return queries
+
+
+# Метрики
+
+def recall_at_k(ranking: List[int], labels: Dict[int, int], k: int) -> float:
+    """Доля найденных в top-k товаров с оценкой 2+ (от min(k, их числа))"""
+    relevant = {product_id for product_id, grade in labels.items() if grade >= 2}
+    if not relevant:
+        return 0.0
+    return len(relevant.intersection(ranking[:k])) / min(k, len(relevant))
+
+
+def ndcg_at_k(ranking: List[int], labels: Dict[int, int], k: int) -> float:
+    def dcg(grades) -> float:
+        return sum((2 ** grade - 1) / math.log2(position + 2) for position, grade in enumerate(grades))
+
+    ideal = dcg(sorted(labels.values(), reverse=True)[:k])
+    return dcg([labels.get(product_id, 0) for product_id in ranking[:k]]) / ideal if ideal else 0.0
+
+
+# Заменители сервисов
+
+class _StandInResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class _StandInRequest:
+    """Запрос PostgREST: table(...).upsert/select/delete(...).eq(...).execute() или rpc(...).execute()"""
+
+    def __init__(self, client, action=None):
+        self._client = client
+        self._action = action
+        self._filters: Dict[str, Any] = {}
+
+    def upsert(self, rows, on_conflict=None):
+        self._action = ('upsert', rows)
+        return self
+
+    def select(self, columns='*'):
+        self._action = ('select', None)
+        return self
+
+    def delete(self):
+        self._action = ('delete', None)
+        return self
+
+    def eq(self, column, value):
+        self._filters[column] = value
+        return self
+
+    def execute(self):
+        return _StandInResponse(self._client.execute(self._action, self._filters))
+
+
+class SupabaseStandIn:
+    """
+    Заменитель клиента Supabase для SupabaseVectorStore
+
+    product_embeddings хранится в памяти, RPC search_similar_products -
+    точный перебор numpy. Запрос и ответ проходят через JSON, как по сети.
+    """
+
+    def __init__(self, rtt_ms: float = 0.0):
+        self.rtt = rtt_ms / 1000
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self._matrix = None
+
+    def table(self, name: str) -> _StandInRequest:
+        return _StandInRequest(self)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> _StandInRequest:
+        return _StandInRequest(self, ('rpc', (name, params)))
+
+    def _wire(self, payload):
+        if self.rtt:
+            time.sleep(self.rtt)
+        return json.loads(json.dumps(payload, ensure_ascii=False, default=str))
+
+    def execute(self, action, filters: Dict[str, Any]):
+        kind, payload = action
+        payload = self._wire(payload)
+        matches = [
+            product_id for product_id, row in self.rows.items()
+            if all(row.get(column) == value for column, value in filters.items())
+        ]
+        if kind == 'upsert':
+            for row in payload:
+                self.rows[row['product_id']] = row
+            self._matrix = None
+            return self._wire(payload)
+        if kind == 'delete':
+            self._matrix = None
+            return self._wire([self.rows.pop(product_id) for product_id in matches])
+        if kind == 'select':
+            return self._wire([
+                {key: value for key, value in self.rows[product_id].items() if key != 'embedding'}
+                for product_id in matches
+            ])
+        name, params = payload
+        if name != 'search_similar_products':
+            raise NotImplementedError(f"RPC {name} не поддерживается заменителем")
+        return self._wire(self._search(params['query_embedding'], params['match_threshold'], params['match_count']))
+
+    def _search(self, embedding, threshold: float, count: int) -> List[Dict[str, Any]]:
+        if self._matrix is None:
+            ids = list(self.rows)
+            vectors = np.array([self.rows[product_id]['embedding'] for product_id in ids], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrix = (ids, vectors / norms)
+        ids, vectors = self._matrix
+        if not ids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = vectors @ (query / (float(np.linalg.norm(query)) or 1.0))
+        top = np.argsort(-scores)[:count]
+        return [
+            {
+                'product_id': ids[position],
+                **{field: self.rows[ids[position]].get(field) for field in ('article', 'product_name', 'category_name')},
+                'similarity': float(scores[position]),
+            }
+            for position in top if scores[position] > threshold
+        ]
+
+
+def create_store(backend: str, path: str, dimension: int, args):
+    from app.services.vector_index import LocalVectorIndex
+    from app.services.vector_store import LocalVectorStore, SupabaseVectorStore
+
+    if backend == "supabase":
+        return SupabaseVectorStore(SupabaseStandIn(args.rpc_rtt_ms))
+    quantization = backend if backend in ("int8", "pq") else "none"
+    return LocalVectorStore(LocalVectorIndex(
+        path,
+        dimension,
+        # ANN - IVF с первого вектора, остальные - точный перебор (или по кодам)
+        ivf_threshold=0 if backend == "ann" else 10 ** 9,
+        nprobe=args.nprobe,
+        quantization=quantization,
+        rerank=settings.vector_index_rerank
+    ))
+
+
+# Прогон
+
+async def run_backend(db, queries, backend: str, service, args) -> Dict[str, Any]:
+    from app.services.hybrid_search import hybrid_search
+
+    mode = backend if backend in ("lexical", "hybrid") else "vector"
+    # Прогрев: первый запрос загружает индекс каталога и страницы матрицы
+    await hybrid_search(db, queries[0]['query'], args.k, mode=mode, vector_service=service)
+
+    recalls, ndcgs, latencies, by_type = [], [], [], {}
+    cpu_started = time.process_time()
+    for query in queries:
+        started = time.perf_counter()
+        hits = await hybrid_search(db, query['query'], args.k, mode=mode, vector_service=service)
+        latencies.append(time.perf_counter() - started)
+
+        ranking = [hit['product_id'] for hit in hits]
+        recall = recall_at_k(ranking, query['labels'], args.k)
+        ndcg = ndcg_at_k(ranking, query['labels'], args.k)
+        recalls.append(recall)
+        ndcgs.append(ndcg)
+        by_type.setdefault(query['type'], []).append((recall, ndcg))
+    cpu = time.process_time() - cpu_started
+
+    # Стоимость: embedding запроса по цене API (кроме лексического поиска) и вызов RPC
+    tokens = 0
+    if mode != "lexical":
+        from app.services.vector_search import _estimate_tokens
+
+        tokens = np.mean([_estimate_tokens(query['query']) for query in queries])
+    cost = tokens * args.embedding_price / 1e6 + (args.rpc_price if backend == "supabase" else 0.0)
+    return {
+        'backend': backend,
+        'recall': float(np.mean(recalls)),
+        'ndcg': float(np.mean(ndcgs)),
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'cpu_ms': cpu / len(queries) * 1000,
+        'cost_per_1000': cost * 1000,
+        'by_type': {
+            query_type: {'recall': float(np.mean([r for r, _ in values])), 'ndcg': float(np.mean([n for _, n in values]))}
+            for query_type, values in sorted(by_type.items())
+        },
+    }
+
+
+async def run(args, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    from sqlalchemy.orm import joinedload
+
+    from app.models import Product
+    from app.services.hybrid_search import catalog_index
+
+    settings.search_vector_threshold = args.threshold
+    db = create_catalog_session(load_stock(args.stock))
+    catalog_index.invalidate()
+
+    # Векторный поиск и модель embedding'ов нужны только векторным вариантам:
+    # лексический прогон не импортирует vector_search
+    provider = products = None
+    if any(backend != "lexical" for backend in args.backends):
+        from app.services.embedding_provider import LocalEmbeddingProvider
+        from app.services.vector_search import VectorSearchService, product_embedding_data
+
+        products = [
+            product_embedding_data(product)
+            for product in db.query(Product).options(joinedload(Product.category)).order_by(Product.id)
+        ]
+        provider = LocalEmbeddingProvider(
+            settings.local_embedding_model_path,
+            dimension=settings.local_embedding_dimension,
+            workers=settings.local_embedding_workers
+        )
+    results = []
+    with tempfile.TemporaryDirectory() as path:
+        cache = None
+        for backend in args.backends:
+            service = None
+            if backend != "lexical":
+                if cache is None:
+                    from app.services.embedding_cache import EmbeddingCache
+
+                    # Общий кеш: embedding'и товаров считаются один раз на все варианты
+                    cache = EmbeddingCache(str(Path(path) / "embeddings.sqlite3"))
+                # hybrid - векторные кандидаты из локального индекса с точным перебором
+                store = create_store("local" if backend == "hybrid" else backend, str(Path(path) / backend), provider.dimension, args)
+                service = VectorSearchService(embedding_cache=cache, vector_store=store, embedding_provider=provider)
+                report = await service.index_products(products)
+                logger.info(f"{backend}: проиндексировано {report.upserted} товаров")
+
+            result = await run_backend(db, queries, backend, service, args)
+            results.append(result)
+            if service is not None:
+                service.store_executor.shutdown(wait=False)
+    if provider is not None:
+        provider.close()
+    db.close()
+    return results
+
+
+def print_results(results: List[Dict[str, Any]], k: int, baseline: Optional[Dict[str, Dict[str, Any]]] = None):
+    columns = (
+        ('recall', f'recall@{k}', '{:.3f}'), ('ndcg', f'nDCG@{k}', '{:.3f}'),
+        ('p50_ms', 'p50 мс', '{:.2f}'), ('p95_ms', 'p95 мс', '{:.2f}'), ('p99_ms', 'p99 мс', '{:.2f}'),
+        ('cpu_ms', 'CPU мс', '{:.2f}'), ('cost_per_1000', '$/1000', '{:.4f}'),
+    )
+    width = 18 if baseline else 12
+    print(f"\n{'вариант':<10}" + ''.join(f"{title:>{width}}" for _, title, _ in columns))
+    for result in results:
+        line = f"{result['backend']:<10}"
+        previous = (baseline or {}).get(result['backend'])
+        for key, _, fmt in columns:
+            cell = fmt.format(result[key])
+            if previous is not None:
+                cell += f" ({result[key] - previous[key]:+.3f})"
+            line += f"{cell:>{width}}"
+        print(line)
+
+    print(f"\nПо типам запросов (recall@{k} / nDCG@{k}):")
+    for result in results:
+        print(f"{result['backend']:<10}" + ''.join(
+            f"  {query_type}: {values['recall']:.3f} / {values['ndcg']:.3f}"
+            for query_type, values in result['by_type'].items()
+        ))
+
+
+def main():
+    """Основная функция для запуска бенчмарка"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Качество и задержка поиска по размеченным запросам')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS), help='Варианты поиска')
+    parser.add_argument('--k', type=int, default=10, help='Размер выдачи (recall@k, nDCG@k)')
+    parser.add_argument('--threshold', type=float, default=settings.search_vector_threshold, help='Порог близости векторных кандидатов')
+    parser.add_argument('--nprobe', type=int, default=settings.vector_index_nprobe, help='Кластеров IVF на запрос (ann)')
+    parser.add_argument('--stock', type=Path, default=STOCK_CSV, help='Каталог stock.csv')
+    parser.add_argument('--queries', type=Path, default=QUERIES_FILE, help='Размеченные запросы (JSON)')
+    parser.add_argument('--build-queries', action='store_true', help='Пересобрать размеченные запросы из stock.csv и выйти')
+    parser.add_argument('--embedding-price', type=float, default=0.10, help='Цена API embedding\'ов, $ за 1 млн токенов')
+    parser.add_argument('--rpc-price', type=float, default=0.0, help='Цена вызова RPC Supabase, $')
+    parser.add_argument('--rpc-rtt-ms', type=float, default=0.0, help='Задержка сети до Supabase на вызов, мс')
+    parser.add_argument('--save', type=Path, help='Сохранить результаты в JSON')
+    parser.add_argument('--compare', type=Path, help='Сравнить с сохраненными результатами')
+
+    args = parser.parse_args()
+
+    if args.build_queries:
+        queries = build_queries(load_stock(args.stock))
+        with open(args.queries, 'w', encoding='utf-8') as f:
+            # Запрос на строку: изменения разметки читаются в diff
+            f.write('[\n' + ',\n'.join(json.dumps(query, ensure_ascii=False) for query in queries) + '\n]\n')
+        logger.info(f"Сохранено {len(queries)} размеченных запросов: {args.queries}")
+        return 0
+
+    if not args.queries.exists():
+        logger.error(f"Нет файла запросов {args.queries}: сначала --build-queries")
+        return 1
+    queries = load_queries(args.queries)
+    logger.info(f"{len(queries)} размеченных запросов, k = {args.k}, порог близости {args.threshold}")
+
+    results = asyncio.run(run(args, queries))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {result['backend']: result for result in json.load(f)['results']}
+    print_results(results, args.k, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'k': args.k, 'threshold': args.threshold, 'results': results}, f, ensure_ascii=False, indent=2)
+        logger.info(f"Результаты сохранены: {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
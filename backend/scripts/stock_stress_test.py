@@ -0,0 +1,169 @@
+"""
+Нагрузочная проверка резервирования остатков EMC3
+Много параллельных заказов на одни и те же SKU: проверяет, что склад
+не уходит в минус, не продано больше, чем было, и измеряет задержку резервирования
+"""
+
+import sys
+import time
+import random
+import logging
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, engine, Base
+from app.models import Product, StockLevel, StockReservation
+from app.services.stock import reserve_items, InsufficientStock
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SKU_PREFIX = "STRESS-STOCK-"
+
+
+def prepare_products(skus: int, stock: int) -> list:
+    """Создание тестовых товаров с начальным остатком"""
+    db = SessionLocal()
+    try:
+        product_ids = []
+        for i in range(skus):
+            sku = f"{SKU_PREFIX}{i}"
+            product = db.query(Product).filter(Product.sku == sku).first()
+            if not product:
+                product = Product(name=f"Нагрузочный тест {i}", sku=sku, price=1000.0)
+                db.add(product)
+                db.flush()
+
+            stock_level = db.query(StockLevel).filter(StockLevel.product_id == product.id).first()
+            if stock_level:
+                stock_level.quantity = stock
+            else:
+                db.add(StockLevel(product_id=product.id, quantity=stock))
+
+            product_ids.append(product.id)
+
+        db.query(StockReservation).filter(StockReservation.product_id.in_(product_ids)).delete(synchronize_session=False)
+        db.commit()
+        return product_ids
+    finally:
+        db.close()
+
+
+def place_order(product_ids: list, max_quantity: int, retries: int = 5):
+    """Одна попытка заказа: резерв случайного набора SKU и commit"""
+    lines = random.sample(product_ids, k=random.randint(1, len(product_ids)))
+    items = {product_id: random.randint(1, max_quantity) for product_id in lines}
+
+    for attempt in range(retries):
+        db = SessionLocal()
+        started = time.perf_counter()
+        try:
+            reserve_items(db, items)
+            db.commit()
+            return True, time.perf_counter() - started, items
+        except InsufficientStock:
+            db.rollback()
+            return False, time.perf_counter() - started, items
+        except Exception as e:
+            # Блокировка БД (SQLite) или сериализационный конфликт - повторяем
+            db.rollback()
+            if attempt == retries - 1:
+                logger.error(f"Заказ не выполнен: {e}")
+                return None, time.perf_counter() - started, items
+            time.sleep(0.01 * (attempt + 1))
+        finally:
+            db.close()
+
+
+def verify(product_ids: list, stock: int) -> bool:
+    """Проверка инварианта: остаток + зарезервировано = начальный остаток"""
+    db = SessionLocal()
+    try:
+        ok = True
+        for product_id in product_ids:
+            remaining = db.query(StockLevel.quantity).filter(StockLevel.product_id == product_id).scalar()
+            reserved = sum(
+                quantity for (quantity,) in
+                db.query(StockReservation.quantity).filter(StockReservation.product_id == product_id)
+            )
+            status = "OK" if remaining >= 0 and remaining + reserved == stock else "ОШИБКА"
+            ok = ok and status == "OK"
+            print(f"  товар {product_id}: остаток {remaining}, продано {reserved} из {stock} - {status}")
+        return ok
+    finally:
+        db.close()
+
+
+def cleanup(product_ids: list):
+    db = SessionLocal()
+    try:
+        db.query(StockReservation).filter(StockReservation.product_id.in_(product_ids)).delete(synchronize_session=False)
+        db.query(StockLevel).filter(StockLevel.product_id.in_(product_ids)).delete(synchronize_session=False)
+        db.query(Product).filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    """Основная функция для запуска нагрузочной проверки"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Нагрузочная проверка резервирования остатков')
+    parser.add_argument('--orders', type=int, default=500, help='Количество заказов')
+    parser.add_argument('--workers', type=int, default=32, help='Параллельных покупателей')
+    parser.add_argument('--skus', type=int, default=3, help='Количество "горячих" SKU')
+    parser.add_argument('--stock', type=int, default=300, help='Начальный остаток каждого SKU')
+    parser.add_argument('--max-quantity', type=int, default=5, help='Максимум штук в позиции')
+    parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    product_ids = prepare_products(args.skus, args.stock)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(
+            lambda _: place_order(product_ids, args.max_quantity),
+            range(args.orders)
+        ))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [latency for ok, latency, _ in results if ok]
+    rejected = sum(1 for ok, _, _ in results if ok is False)
+    failed = sum(1 for ok, _, _ in results if ok is None)
+
+    print(f"\nЗаказов: {args.orders}, покупателей: {args.workers}, время: {elapsed:.2f} с "
+          f"({args.orders / elapsed:.0f} заказов/с)")
+    print(f"Зарезервировано: {len(succeeded)}, отказ (нет остатка): {rejected}, ошибки: {failed}")
+    if succeeded:
+        print(f"Задержка резервирования: p50 {statistics.median(succeeded) * 1000:.1f} мс, "
+              f"p99 {percentile(succeeded, 0.99) * 1000:.1f} мс")
+
+    print("\nПроверка остатков:")
+    ok = verify(product_ids, args.stock)
+
+    if not args.keep:
+        cleanup(product_ids)
+
+    print("\nИтог:", "перепродаж нет" if ok else "ОБНАРУЖЕНА ПЕРЕПРОДАЖА")
+    return 0 if ok and not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Обучение локальной модели embedding'ов на текстах каталога
+
+Модель (idf и проекция TF-IDF -> dimension измерений) сохраняется в
+LOCAL_EMBEDDING_MODEL_PATH; после обучения у модели новое имя, поэтому
+каталог нужно переиндексировать (scripts/embedding_indexer.py --full --once).
+
+Запуск:
+    python scripts/train_local_embeddings.py --dimension 256
+"""
+
+import sys
+import logging
+import time
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from sqlalchemy.orm import joinedload
+
+from app.database import SessionLocal, settings
+from app.models import Product
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_texts():
+    from app.services.vector_search import VectorSearchService, product_embedding_data
+
+    db = SessionLocal()
+    try:
+        products = db.query(Product).options(joinedload(Product.category)).order_by(Product.id).all()
+        return [VectorSearchService._prepare_text_for_embedding(product_embedding_data(product)) for product in products]
+    finally:
+        db.close()
+
+
+def main():
+    """Основная функция обучения"""
+    import argparse
+    from app.services.embedding_provider import LocalEmbeddingProvider, fit_local_model, save_local_model
+
+    parser = argparse.ArgumentParser(description='Обучение локальной модели embedding\'ов на каталоге')
+    parser.add_argument('--dimension', type=int, default=settings.local_embedding_dimension, help='Размерность embedding\'ов')
+    parser.add_argument('--output', default=settings.local_embedding_model_path, help='Файл модели (.npz)')
+
+    args = parser.parse_args()
+
+    texts = load_texts()
+    if not texts:
+        logger.error("Каталог пуст: обучать не на чем")
+        return 1
+
+    started = time.perf_counter()
+    idf, components = fit_local_model(texts, args.dimension)
+    save_local_model(args.output, idf, components)
+    logger.info(f"Модель обучена на {len(texts)} текстах за {time.perf_counter() - started:.1f} с: {args.output}")
+
+    provider = LocalEmbeddingProvider(args.output)
+    started = time.perf_counter()
+    vectors = provider.encode(texts)
+    logger.info(
+        f"Модель {provider.model}: {len(texts) / (time.perf_counter() - started):.0f} текстов/с в одном процессе"
+    )
+
+    # Ближайший сосед каждого товара (кроме него самого) - для быстрой проверки на глаз
+    similarities = vectors @ vectors.T
+    np.fill_diagonal(similarities, -1)
+    for row in range(min(3, len(texts))):
+        neighbour = int(similarities[row].argmax())
+        logger.info(f"{texts[row].splitlines()[0]} -> {texts[neighbour].splitlines()[0]} ({similarities[row, neighbour]:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
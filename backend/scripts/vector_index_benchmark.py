@@ -0,0 +1,164 @@
+"""
+Бенчмарк EMC3: квантование локального векторного индекса
+Строит индекс без квантования, int8 и pq на одних и тех же векторах и
+сравнивает с точным перебором float32: recall@k, задержка поиска p50/p95/p99
+и байт на вектор, которые перебирает поиск.
+
+Векторы - embedding'и каталога из базы (локальная модель, без сети) или
+синтетические кластеры заданного размера; запросы - векторы товаров со
+случайным шумом.
+
+Запуск:
+    python scripts/vector_index_benchmark.py
+    python scripts/vector_index_benchmark.py --synthetic 200000 --dimension 1536
+"""
+
+import sys
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from app.database import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def catalog_vectors() -> np.ndarray:
+    """Embedding'и товаров каталога локальной моделью"""
+    from sqlalchemy.orm import joinedload
+
+    from app.database import SessionLocal
+    from app.models import Product
+    from app.services.embedding_provider import LocalEmbeddingProvider
+    from app.services.vector_search import VectorSearchService, product_embedding_data
+
+    db = SessionLocal()
+    try:
+        products = db.query(Product).options(joinedload(Product.category)).order_by(Product.id).all()
+        texts = [VectorSearchService._prepare_text_for_embedding(product_embedding_data(product)) for product in products]
+    finally:
+        db.close()
+    provider = LocalEmbeddingProvider(settings.local_embedding_model_path, dimension=settings.local_embedding_dimension)
+    return provider.encode(texts)
+
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Нормированные векторы вокруг count / 50 случайных центров (похоже на серии товаров)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 50), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=count)]
+    queries = queries + noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Номера k ближайших векторов точным перебором float32 (эталон)"""
+    result = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        result.append(top)
+    return np.concatenate(result)
+
+
+def percentile(values, p: float) -> float:
+    return float(np.percentile(values, p)) * 1000
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, quantization: str, args) -> dict:
+    from app.services.vector_index import LocalVectorIndex
+
+    with tempfile.TemporaryDirectory() as path:
+        index = LocalVectorIndex(
+            path,
+            vectors.shape[1],
+            dtype=args.dtype,
+            ivf_threshold=args.ivf_threshold,
+            nprobe=args.nprobe,
+            quantization=quantization,
+            rerank=args.rerank
+        )
+        started = time.perf_counter()
+        for start in range(0, len(vectors), 10000):
+            index.add([(row, vectors[row], {}) for row in range(start, min(start + 10000, len(vectors)))])
+        build = time.perf_counter() - started
+
+        latencies, found = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            matches = index.search(query, limit=k)
+            latencies.append(time.perf_counter() - started)
+            found += len(set(product_id for product_id, _ in matches) & set(expected.tolist()))
+
+        stats = index.stats()
+        return {
+            "quantization": quantization,
+            "recall": found / (len(queries) * k),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "bytes_per_vector": stats["bytes_per_vector"],
+            "ivf_lists": stats["ivf_lists"],
+            "build": build,
+        }
+
+
+def main():
+    """Основная функция для запуска бенчмарка"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Recall и задержка квантованного индекса против точного поиска')
+    parser.add_argument('--synthetic', type=int, default=0, help='Число синтетических векторов (0 - каталог из базы)')
+    parser.add_argument('--dimension', type=int, default=1536, help='Размерность синтетических векторов')
+    parser.add_argument('--queries', type=int, default=500, help='Число запросов')
+    parser.add_argument('--noise', type=float, default=0.5, help='Шум запроса относительно вектора товара')
+    parser.add_argument('--k', type=int, default=10, help='Размер выдачи (recall@k)')
+    parser.add_argument('--rerank', type=int, default=settings.vector_index_rerank, help='Кандидатов на точный пересчет (k * rerank)')
+    parser.add_argument('--dtype', default=settings.vector_index_dtype, help='Тип матрицы: float32 или float16')
+    parser.add_argument('--ivf-threshold', type=int, default=settings.vector_index_ivf_threshold, help='Порог IVF')
+    parser.add_argument('--nprobe', type=int, default=settings.vector_index_nprobe, help='Кластеров IVF на запрос')
+    parser.add_argument(
+        '--quantization', nargs='+', default=['none', 'int8', 'pq'], help='Варианты квантования'
+    )
+
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dimension) if args.synthetic else catalog_vectors()
+    if len(vectors) < args.k:
+        logger.error("Векторов меньше k: сравнивать нечего")
+        return 1
+    queries = make_queries(vectors, args.queries, args.noise)
+    truth = exact_top_k(vectors, queries, args.k)
+    logger.info(f"{len(vectors)} векторов x {vectors.shape[1]}, {len(queries)} запросов, эталон - точный перебор float32")
+
+    float_bytes = vectors.shape[1] * 4
+    print(f"\n{'квантование':<12} {'recall@' + str(args.k):>9} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} "
+          f"{'байт/вектор':>12} {'сжатие':>7} {'IVF':>5} {'сборка с':>9}")
+    for quantization in args.quantization:
+        result = run(vectors, queries, truth, args.k, quantization, args)
+        print(
+            f"{result['quantization']:<12} {result['recall']:>9.3f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+            f"{result['p99']:>8.2f} {result['bytes_per_vector']:>12} {float_bytes / result['bytes_per_vector']:>6.1f}x "
+            f"{result['ivf_lists']:>5} {result['build']:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Проверка: медленное хранилище векторов не блокирует цикл событий
+
+Сервис векторного поиска получает хранилище, каждый вызов которого спит
+--store-delay секунд (как медленный RPC Supabase). Пока идут поиски,
+соседняя корутина "тикает" каждые 10 мс; если вызов хранилища занимает
+цикл событий, паузы между тиками вырастают до задержки хранилища.
+
+Запуск:
+    python scripts/vector_search_blocking_check.py --store-delay 1 --searches 5
+"""
+
+import sys
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services.vector_store import VectorStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 0.01
+
+
+class SlowVectorStore(VectorStore):
+    """Хранилище с синхронной задержкой на каждом вызове"""
+
+    name = "slow"
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def search(self, query_embedding, threshold, limit, allowed_ids=None):
+        time.sleep(self.delay)
+        return []
+
+    def upsert(self, rows):
+        time.sleep(self.delay)
+        return len(rows)
+
+    def delete(self, product_id):
+        time.sleep(self.delay)
+
+    def recommendations(self, product_id, limit):
+        time.sleep(self.delay)
+        return []
+
+    def get(self, product_id):
+        time.sleep(self.delay)
+        return None
+
+
+async def fake_embedding(text):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.random() for _ in range(1536)]
+
+
+async def run(args) -> float:
+    from app.services.vector_search import VectorSearchService
+
+    service = VectorSearchService(vector_store=SlowVectorStore(args.store_delay))
+    # Без обращений к API embedding'ов и записи аналитики: проверяется только хранилище
+    service._create_embedding = fake_embedding
+    service._log_search_query = lambda *a, **k: asyncio.sleep(0)
+
+    max_gap = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_gap
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(TICK_SECONDS)
+            now = time.perf_counter()
+            max_gap = max(max_gap, now - last - TICK_SECONDS)
+            last = now
+
+    async def searches():
+        await asyncio.gather(*(
+            service.search_products(f"прожектор {i}") for i in range(args.searches)
+        ))
+        done.set()
+
+    started = time.perf_counter()
+    await asyncio.gather(ticker(), searches())
+    logger.info(
+        f"{args.searches} поисков по {args.store_delay} с заняли {time.perf_counter() - started:.2f} с, "
+        f"максимальная задержка цикла событий {max_gap * 1000:.1f} мс"
+    )
+    service.close()
+    return max_gap
+
+
+def main():
+    """Основная функция проверки"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Проверка неблокирующего доступа к хранилищу векторов')
+    parser.add_argument('--store-delay', type=float, default=1.0, help='Задержка вызова хранилища (сек)')
+    parser.add_argument('--searches', type=int, default=5, help='Одновременных поисков')
+    parser.add_argument('--max-gap-ms', type=float, default=100, help='Допустимая задержка цикла событий (мс)')
+
+    args = parser.parse_args()
+
+    max_gap = asyncio.run(run(args))
+    if max_gap * 1000 > args.max_gap_ms:
+        logger.error("Цикл событий блокируется вызовами хранилища")
+        return 1
+    logger.info("OK: цикл событий не блокируется")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())